@@ -5,6 +5,8 @@ Chaostoolkit custom actions/probes lib from Wix.com
 import json
 import os
 import os.path
+import threading
+import time
 from typing import List
 import requests
 from requests.exceptions import HTTPError
@@ -15,6 +17,7 @@ from chaoslib.exceptions import DiscoveryFailed
 from chaoslib.types import Discovery, DiscoveredActivities, \
     DiscoveredSystemInfo, Secrets
 from kubernetes import client, config
+from kubernetes.client import rest
 from logzero import logger
 import boto3
 
@@ -32,12 +35,16 @@ def has_local_config_file():
     # return os.path.exists(config_path)
 
 
-def get_kube_secret_from_production(target_url, token):
+VAULT_TIMEOUT = 10
+
+
+def get_kube_secret_from_production(target_url, token,
+                                    timeout: float = VAULT_TIMEOUT):
     headers = {'Authorization': 'Token ' + token,
                'Content-Type': 'application/json'}
     retval = None
     try:
-        response = requests.get(target_url, headers=headers)
+        response = requests.get(target_url, headers=headers, timeout=timeout)
         retval = json.loads(response.content)
 
         response.raise_for_status()
@@ -51,7 +58,22 @@ def get_kube_secret_from_production(target_url, token):
     return retval
 
 
+AWS_CREDENTIALS_TTL = 300
+# vault misses are remembered for a shorter time, so credentials added to
+# vault are picked up soon
+AWS_NO_CREDENTIALS_TTL = 60
+
+_aws_credentials = {}
+_aws_objects = {}
+_aws_lock = threading.Lock()
+
+
 def get_aws_credentials(secrets):
+    """
+    AWS credentials stored in vault. Lookups are cached per vault url and
+    token, for AWS_CREDENTIALS_TTL seconds or, when vault has no
+    credentials, for AWS_NO_CREDENTIALS_TTL seconds.
+    """
     env = os.environ
     secrets = secrets or {}
 
@@ -61,35 +83,80 @@ def get_aws_credentials(secrets):
     prod_vault_url = lookup("NASA_SECRETS_URL", "undefined")
     target_url = os.path.join(prod_vault_url, 'aws')
     token = lookup("NASA_TOKEN", "undefined")
+    key = (target_url, token)
+    with _aws_lock:
+        cached = _aws_credentials.get(key)
+    if cached is not None:
+        aws_creds, loaded = cached
+        ttl = AWS_NO_CREDENTIALS_TTL if aws_creds is None else AWS_CREDENTIALS_TTL
+        if time.time() - loaded <= ttl:
+            return aws_creds
     aws_creds = get_kube_secret_from_production(target_url, token)
+    with _aws_lock:
+        _aws_credentials[key] = (aws_creds, time.time())
     return aws_creds
 
 
-def create_aws_client(secrets, resource):
-    aws_creds = get_aws_credentials(secrets)
-    if aws_creds is not None:
-        client = boto3.client(resource,
-                              aws_access_key_id=aws_creds['aws_access_key_id'],
-                              aws_secret_access_key=aws_creds['aws_secret_access_key'])
-    else:
-        client = boto3.client(resource)
+def get_aws_region(secrets):
+    env = os.environ
+    secrets = secrets or {}
+    default = env.get("AWS_REGION", env.get("AWS_DEFAULT_REGION"))
+    return secrets.get("AWS_REGION", default)
 
-    return client
+
+def get_aws_key(secrets) -> tuple:
+    """
+    Region and credentials AWS calls made with `secrets` are bound to, used
+    to key caches of AWS objects and of data read from AWS.
+    """
+    aws_creds = get_aws_credentials(secrets) or {}
+    return (get_aws_region(secrets), aws_creds.get('aws_access_key_id'),
+            aws_creds.get('aws_secret_access_key'))
+
+
+def get_aws_object(kind: str, secrets, resource):
+    """
+    Return boto3 "client" or "resource" (depending on `kind`) for the
+    service named `resource`. Objects are created once per process for
+    every combination of credentials, service and region, so activities
+    share them together with their connection pools.
+    """
+    region, access_key_id, secret_access_key = get_aws_key(secrets)
+    kwargs = {}
+    if access_key_id is not None:
+        kwargs["aws_access_key_id"] = access_key_id
+        kwargs["aws_secret_access_key"] = secret_access_key
+    if region:
+        kwargs["region_name"] = region
+
+    key = (kind, resource, region, access_key_id, secret_access_key)
+    with _aws_lock:
+        obj = _aws_objects.get(key)
+        if obj is None:
+            obj = getattr(boto3, kind)(resource, **kwargs)
+            _aws_objects[key] = obj
+    return obj
+
+
+def create_aws_client(secrets, resource):
+    return get_aws_object("client", secrets, resource)
 
 
 def create_aws_resource(secrets, resource):
-    aws_creds = get_aws_credentials(secrets)
-    if aws_creds is not None:
-        client = boto3.resource(resource,
-                                aws_access_key_id=aws_creds['aws_access_key_id'],
-                                aws_secret_access_key=aws_creds['aws_secret_access_key'])
-    else:
-        client = boto3.resource(resource)
+    return get_aws_object("resource", secrets, resource)
 
-    return client
+
+def invalidate_aws_cache():
+    """
+    Drop cached AWS credentials and boto3 clients and resources.
+    """
+    with _aws_lock:
+        _aws_credentials.clear()
+        _aws_objects.clear()
 
 
-def create_k8s_api_client(secrets: Secrets = None) -> client.ApiClient:
+def create_k8s_api_client(secrets: Secrets = None,
+                          pool_maxsize: int = None) -> client.ApiClient:
     """
     Create a Kubernetes client from:
 
@@ -122,6 +189,9 @@ def create_k8s_api_client(secrets: Secrets = None) -> client.ApiClient:
 
         You may pass a secrets dictionary, in which case, values will be looked
         there before the environ.
+
+    `pool_maxsize` sets how many connections the client keeps open, when the
+    client is shared by many threads.
     """
     env = os.environ
     secrets = secrets or {}
@@ -149,10 +219,14 @@ def create_k8s_api_client(secrets: Secrets = None) -> client.ApiClient:
         context = lookup("KUBERNETES_CONTEXT")
         logger.debug("Using Kubernetes context: {}".format(
             context or "default"))
-        return config.new_client_from_config(context=context)
+        api = config.new_client_from_config(context=context)
+        if pool_maxsize:
+            api.rest_client = rest.RESTClientObject(api.configuration,
+                                                    maxsize=pool_maxsize)
+        return api
     elif env.get("CHAOSTOOLKIT_IN_POD") == "true":
         config.load_incluster_config()
-        return client.ApiClient()
+        configuration = client.Configuration()
     else:
         configuration = client.Configuration()
         configuration.debug = False
@@ -174,9 +248,55 @@ def create_k8s_api_client(secrets: Secrets = None) -> client.ApiClient:
             configuration.username = lookup("KUBERNETES_USERNAME")
             configuration.password = lookup("KUBERNETES_PASSWORD", "")
 
+    if pool_maxsize:
+        configuration.connection_pool_maxsize = pool_maxsize
     return client.ApiClient(configuration)
 
 
+def get_cluster_key(secrets: Secrets = None) -> str:
+    """
+    Key that identifies the cluster the secrets point to. Used to keep
+    cached state of different clusters apart.
+    """
+    env = os.environ
+    secrets = secrets or {}
+
+    def lookup(k: str, d: str = None) -> str:
+        return secrets.get(k, env.get(k, d))
+
+    return "{}|{}".format(lookup("KUBERNETES_CONTEXT"),
+                          lookup("KUBERNETES_HOST"))
+
+
+def iter_pages(list_func, page_size: int = 500, **kwargs):
+    """
+    Call a Kubernetes `list_*` API function page by page, following the
+    `continue` token returned by the server, and yield every page response.
+    """
+    continue_token = None
+    while True:
+        if continue_token:
+            kwargs["_continue"] = continue_token
+        ret = list_func(limit=page_size, **kwargs)
+        yield ret
+        continue_token = None
+        if ret.metadata is not None:
+            continue_token = ret.metadata._continue
+        if not continue_token:
+            break
+
+
+def list_all_pages(list_func, page_size: int = 500, **kwargs) -> list:
+    """
+    Call a Kubernetes `list_*` API function page by page and return all
+    collected items.
+    """
+    items = []
+    for ret in iter_pages(list_func, page_size=page_size, **kwargs):
+        items.extend(ret.items)
+    return items
+
+
 def discover(discover_system: bool = True) -> Discovery:
     """
     Discover Kubernetes capabilities offered by this extension.
@@ -1,16 +1,21 @@
 # -*- coding: utf-8 -*-
+import copy
 import json
 import os
-import random
+import time
+from typing import Dict
 from chaoslib.exceptions import FailedActivity
 from chaoslib.types import MicroservicesStatus, Secrets, Configuration
 from logzero import logger
-from kubernetes import client
+from kubernetes import client, watch
 from kubernetes.client.rest import ApiException
+import urllib3
 import yaml
-from chaosk8s_wix import create_k8s_api_client
+from chaosk8s_wix import create_k8s_api_client, aio
+from chaosk8s_wix.namespaces import choose_random_namespace, parse_flag, NS_INVENTORY_TTL
 from chaosk8s_wix.slack.logger_handler import SlackHanlder
 from jinja2 import Template
+from collections import OrderedDict
 from collections.abc import Iterable
 
 __all__ = ["start_microservice", "kill_microservice", "scale_microservice",
@@ -21,6 +26,61 @@ __all__ = ["start_microservice", "kill_microservice", "scale_microservice",
 slack_handler = SlackHanlder()
 slack_handler.attach(logger)
 
+DEPLOY_ORDER = {
+    "Namespace": 0,
+    "CustomResourceDefinition": 0,
+    "ServiceAccount": 1,
+    "Secret": 1,
+    "ConfigMap": 1,
+    "PersistentVolumeClaim": 1,
+    "LimitRange": 1,
+    "ResourceQuota": 1,
+    "Role": 1,
+    "RoleBinding": 2,
+    "Service": 2
+}
+WORKLOADS_DEPLOY_ORDER = 3
+
+# (apiVersion, kind) -> (api class, suffix of create_namespaced_* method,
+# or of create_* method for kinds in CLUSTER_SCOPED_KINDS, resource plural name)
+DEPLOY_RESOURCES = {
+    ("v1", "Namespace"): ("CoreV1Api", "namespace", "namespaces"),
+    ("apiextensions.k8s.io/v1beta1", "CustomResourceDefinition"): (
+        "ApiextensionsV1beta1Api", "custom_resource_definition", "customresourcedefinitions"),
+    ("v1", "Pod"): ("CoreV1Api", "pod", "pods"),
+    ("v1", "Service"): ("CoreV1Api", "service", "services"),
+    ("v1", "ConfigMap"): ("CoreV1Api", "config_map", "configmaps"),
+    ("v1", "Secret"): ("CoreV1Api", "secret", "secrets"),
+    ("v1", "ServiceAccount"): ("CoreV1Api", "service_account", "serviceaccounts"),
+    ("v1", "PersistentVolumeClaim"): ("CoreV1Api", "persistent_volume_claim", "persistentvolumeclaims"),
+    ("v1", "LimitRange"): ("CoreV1Api", "limit_range", "limitranges"),
+    ("v1", "ResourceQuota"): ("CoreV1Api", "resource_quota", "resourcequotas"),
+    ("rbac.authorization.k8s.io/v1", "Role"): ("RbacAuthorizationV1Api", "role", "roles"),
+    ("rbac.authorization.k8s.io/v1", "RoleBinding"): ("RbacAuthorizationV1Api", "role_binding", "rolebindings"),
+    ("rbac.authorization.k8s.io/v1beta1", "Role"): ("RbacAuthorizationV1beta1Api", "role", "roles"),
+    ("rbac.authorization.k8s.io/v1beta1", "RoleBinding"): (
+        "RbacAuthorizationV1beta1Api", "role_binding", "rolebindings"),
+    ("apps/v1beta1", "Deployment"): ("AppsV1beta1Api", "deployment", "deployments"),
+    ("apps/v1beta1", "StatefulSet"): ("AppsV1beta1Api", "stateful_set", "statefulsets"),
+    ("apps/v1", "Deployment"): ("AppsV1Api", "deployment", "deployments"),
+    ("apps/v1", "StatefulSet"): ("AppsV1Api", "stateful_set", "statefulsets"),
+    ("apps/v1", "DaemonSet"): ("AppsV1Api", "daemon_set", "daemonsets"),
+    ("apps/v1", "ReplicaSet"): ("AppsV1Api", "replica_set", "replicasets"),
+    ("extensions/v1beta1", "Deployment"): ("ExtensionsV1beta1Api", "deployment", "deployments"),
+    ("extensions/v1beta1", "DaemonSet"): ("ExtensionsV1beta1Api", "daemon_set", "daemonsets"),
+    ("batch/v1", "Job"): ("BatchV1Api", "job", "jobs"),
+    ("batch/v1beta1", "CronJob"): ("BatchV1beta1Api", "cron_job", "cronjobs")
+}
+CLUSTER_SCOPED_KINDS = {"Namespace", "CustomResourceDefinition"}
+APPLY_FIELD_MANAGER = "chaostoolkit-k8s-wix"
+
+# libyaml based loader is much faster, when PyYAML was built with it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+MANIFESTS_CACHE_SIZE = 64
+_templates_cache = OrderedDict()
+_manifests_cache = OrderedDict()
+
 
 def start_microservice(spec_path: str, ns: str = "default",
                        secrets: Secrets = None):
@@ -35,7 +95,7 @@ def start_microservice(spec_path: str, ns: str = "default",
         if ext == '.json':
             deployment = json.loads(f.read())
         elif ext in ['.yml', '.yaml']:
-            deployment = yaml.load_all(f.read())
+            deployment = yaml.load_all(f.read(), Loader=YamlLoader)
         else:
             raise FailedActivity(
                 "cannot process {path}".format(path=spec_path))
@@ -47,7 +107,7 @@ def start_microservice(spec_path: str, ns: str = "default",
 
 def kill_microservice(name: str, ns: str = "default",
                       label_selector: str = "name in ({name})",
-                      secrets: Secrets = None):
+                      secrets: Secrets = None) -> Dict:
     """
     Kill a microservice by `name` in the namespace `ns`.
 
@@ -55,95 +115,144 @@ def kill_microservice(name: str, ns: str = "default",
     a graceful period to trigger an abrupt termination.
 
     The selected resources are matched by the given `label_selector`.
+    Returns per resource kind report, see `delete_microservice_resources`.
     """
     label_selector = label_selector.format(name=name)
-    api = create_k8s_api_client(secrets)
-
-    v1 = client.AppsV1beta1Api(api)
-    ret = v1.list_namespaced_deployment(ns, label_selector=label_selector)
-
-    logger.debug("Found {d} deployments named '{n}'".format(
-        d=len(ret.items), n=name))
-
-    body = client.V1DeleteOptions()
-    for d in ret.items:
-        res = v1.delete_namespaced_deployment(
-            name=d.metadata.name, namespace=ns, body=body)
+    api = aio.get_shared_api_client(secrets)
 
-    v1 = client.ExtensionsV1beta1Api(api)
-    ret = v1.list_namespaced_replica_set(ns, label_selector=label_selector)
-
-    logger.debug("Found {d} replica sets named '{n}'".format(
-        d=len(ret.items), n=name))
-
-    body = client.V1DeleteOptions()
-    for r in ret.items:
-        res = v1.delete_namespaced_replica_set(
-            name=r.metadata.name, namespace=ns, body=body)
-
-    v1 = client.CoreV1Api(api)
-    ret = v1.list_namespaced_pod(ns, label_selector=label_selector)
-
-    logger.debug("Found {d} pods named '{n}'".format(
-        d=len(ret.items), n=name))
-
-    body = client.V1DeleteOptions()
-    for p in ret.items:
-        res = v1.delete_namespaced_pod(
-            name=p.metadata.name, namespace=ns, body=body)
+    return delete_microservice_resources(api, label_selector, ns=ns)
 
 
 def kill_microservice_by_label(label_selector: str = "name in ({name})",
-                               secrets: Secrets = None):
+                               secrets: Secrets = None) -> Dict:
     """
-    Kill a microservice by `label_selector` in the namespace `ns`.
+    Kill a microservice by `label_selector` in all namespaces.
 
     The microservice is killed by deleting the deployment for it without
     a graceful period to trigger an abrupt termination.
 
     The selected resources are matched by the given `label_selector`.
+    Returns per resource kind report, see `delete_microservice_resources`.
     """
 
-    api = create_k8s_api_client(secrets)
+    api = aio.get_shared_api_client(secrets)
 
-    v1 = client.AppsV1beta1Api(api)
+    retval = {}
     try:
-        ret = v1.list_deployment_for_all_namespaces(label_selector=label_selector)
-        if ret.items:
-            logger.debug("Found {d} deployments labeled '{n}'".format(
-                d=len(ret.items), n=label_selector))
-
-            body = client.V1DeleteOptions()
-            for d in ret.items:
-                logger.debug("Delete deployment {}".format(d.metadata.name))
-                res = v1.delete_namespaced_deployment(
-                    name=d.metadata.name, namespace=d.metadata.namespace, body=body)
-
-            v1 = client.ExtensionsV1beta1Api(api)
-            ret = v1.list_replica_set_for_all_namespaces(label_selector=label_selector)
-            logger.debug("Found {d} replica sets labeled '{n}'".format(
-                d=len(ret.items), n=label_selector))
-
-            v1 = client.ExtensionsV1beta1Api(api)
-            body = client.V1DeleteOptions()
-            for r in ret.items:
-                logger.warning("Delete replicaset {}".format(r.metadata.name))
-                res = v1.delete_namespaced_replica_set(
-                    name=r.metadata.name, namespace=r.metadata.namespace, body=body)
-
-            v1 = client.CoreV1Api(api)
-            ret = v1.list_pod_for_all_namespaces(label_selector=label_selector)
-
-            logger.debug("Found {d} pods labeled '{n}'".format(
-                d=len(ret.items), n=label_selector))
-
-            body = client.V1DeleteOptions()
-            for p in ret.items:
-                logger.warning("Delete pod {}".format(p.metadata.name))
-                res = v1.delete_namespaced_pod(
-                    name=p.metadata.name, namespace=p.metadata.namespace, body=body)
+        retval = delete_microservice_resources(api, label_selector,
+                                               require_deployments=True)
     except ApiException as e:
         pass
+    return retval
+
+
+def delete_microservice_resources(api, label_selector: str, ns: str = None,
+                                  require_deployments: bool = False,
+                                  max_workers: int = aio.AIO_MAX_CONCURRENCY) -> Dict:
+    """
+    Delete deployments, replica sets and pods matched by `label_selector` in
+    namespace `ns`, or in all namespaces when `ns` is not set.
+
+    All three kinds are listed concurrently. They are then deleted kind after
+    kind, deployments first so they do not recreate replica sets, which in
+    turn would recreate pods. As the label selector fully describes the set
+    of objects, each kind is deleted with one `delete_collection` call per
+    namespace, issued concurrently. In namespaces where the server refuses
+    collection deletes, objects are deleted one by one with at most
+    `max_workers` requests in flight. Objects already gone count as deleted.
+
+    :param api: kubernetes ApiClient, preferably `aio.get_shared_api_client`
+    :param label_selector: selector of objects to delete
+    :param ns: namespace to delete in, all namespaces if not set
+    :param require_deployments: delete nothing when no deployment matched
+    :param max_workers: maximum number of concurrent requests
+    :return: dictionary with "count", "method" ("collection", "single" or
+    "mixed" when only some namespaces refused collection deletes),
+    "list_duration" and "delete_duration" (seconds) for "deployments",
+    "replica_sets" and "pods"
+    """
+    resources = [
+        ("deployments", client.AppsV1beta1Api(api), "deployment"),
+        ("replica_sets", client.ExtensionsV1beta1Api(api), "replica_set"),
+        ("pods", client.CoreV1Api(api), "pod")
+    ]
+
+    async def resolve(resource):
+        name, v1, kind = resource
+        started = time.time()
+        if ns:
+            list_func = getattr(v1, "list_namespaced_" + kind)
+            ret = await aio.call_api(list_func, ns, label_selector=label_selector)
+        else:
+            list_func = getattr(v1, "list_{}_for_all_namespaces".format(kind))
+            ret = await aio.call_api(list_func, label_selector=label_selector)
+        return ret.items, time.time() - started
+
+    resolved = aio.run(aio.gather_limited([resolve(r) for r in resources]))
+
+    report = {}
+    if require_deployments and not resolved[0][0]:
+        logger.debug("No deployments labeled '{}' found".format(label_selector))
+        return report
+
+    for (name, v1, kind), (items, list_duration) in zip(resources, resolved):
+        logger.debug("Found {d} {k} labeled '{n}'".format(
+            d=len(items), k=name, n=label_selector))
+        started = time.time()
+        method = "collection"
+        namespaces = sorted(set(i.metadata.namespace for i in items))
+        if namespaces:
+            logger.warning("Delete {k} labeled '{s}' in {n}".format(
+                k=name, s=label_selector, n=", ".join(namespaces)))
+            delete_collection = getattr(
+                v1, "delete_collection_namespaced_" + kind)
+            refused = [n for n in aio.run(aio.gather_limited(
+                [delete_collection_or_refuse(delete_collection, n, label_selector)
+                 for n in namespaces], max_workers)) if n is not None]
+            if refused:
+                logger.debug("Collection delete of {k} refused in {n}".format(
+                    k=name, n=", ".join(refused)))
+                method = "single" if len(refused) == len(namespaces) else "mixed"
+                delete_single = getattr(v1, "delete_namespaced_" + kind)
+                body = client.V1DeleteOptions()
+                aio.run(aio.gather_limited(
+                    [delete_ignoring_missing(delete_single, name=i.metadata.name,
+                                             namespace=i.metadata.namespace, body=body)
+                     for i in items if i.metadata.namespace in refused], max_workers))
+        report[name] = {
+            "count": len(items),
+            "method": method,
+            "list_duration": list_duration,
+            "delete_duration": time.time() - started
+        }
+    return report
+
+
+async def delete_ignoring_missing(delete_func, *args, **kwargs):
+    """
+    Helper function.
+    Await a delete call, objects which are already gone (404) count as deleted.
+    """
+    try:
+        await aio.call_api(delete_func, *args, **kwargs)
+    except ApiException as x:
+        if x.status != 404:
+            raise
+
+
+async def delete_collection_or_refuse(delete_collection, ns: str, label_selector: str):
+    """
+    Helper function.
+    Await a collection delete in namespace `ns`. Returns `ns` when the server
+    refuses collection deletes there (403/405), None otherwise.
+    """
+    try:
+        await delete_ignoring_missing(delete_collection, ns, label_selector=label_selector)
+    except ApiException as x:
+        if x.status not in (403, 405):
+            raise
+        return ns
+    return None
 
 
 def remove_service_endpoint(name: str, ns: str = "default",
@@ -158,14 +267,22 @@ def remove_service_endpoint(name: str, ns: str = "default",
 
 
 def scale_microservice(name: str, replicas: int, ns: str = "default",
-                       secrets: Secrets = None):
+                       secrets: Secrets = None, wait: bool = False,
+                       timeout: int = 300):
     """
     Scale a deployment up or down. The `name` is the name of the deployment.
+
+    When `wait` is set, block until the deployment has exactly `replicas`
+    ready replicas, following deployment changes with a watch, and return
+    the measured scaling latency in seconds. Raises
+    :exc:`chaoslib.exceptions.FailedActivity` when it does not happen
+    within `timeout` seconds.
     """
     api = create_k8s_api_client(secrets)
 
     v1 = client.ExtensionsV1beta1Api(api)
     body = {"spec": {"replicas": replicas}}
+    started = time.time()
     try:
         v1.patch_namespaced_deployment_scale(name, namespace=ns, body=body)
     except ApiException as e:
@@ -173,60 +290,182 @@ def scale_microservice(name: str, replicas: int, ns: str = "default",
             "failed to scale '{s}' to {r} replicas: {e}".format(
                 s=name, r=replicas, e=str(e)))
 
+    if not wait:
+        return None
+
+    latency = wait_for_deployment_replicas(v1, name, ns, int(replicas),
+                                           started, int(timeout))
+    logger.debug("Deployment '{s}' scaled to {r} replicas in {t}s".format(
+        s=name, r=replicas, t=latency))
+    return {"name": name, "replicas": replicas, "latency": latency}
+
+
+def deployment_has_replicas(deployment, replicas: int) -> bool:
+    status = deployment.status
+    return (status.ready_replicas or 0) == replicas and \
+        (status.replicas or 0) == replicas
+
+
+def wait_for_deployment_replicas(v1, name: str, ns: str, replicas: int,
+                                 started: float, timeout: int) -> float:
+    """
+    Helper function.
+    Wait until deployment `name` has `replicas` ready replicas and no other
+    replicas, return seconds passed since `started`.
+    """
+    deployment = v1.read_namespaced_deployment(name, ns)
+    if deployment_has_replicas(deployment, replicas):
+        return time.time() - started
+
+    w = watch.Watch()
+    try:
+        for event in w.stream(v1.list_namespaced_deployment, ns,
+                              field_selector="metadata.name={}".format(name),
+                              resource_version=deployment.metadata.resource_version,
+                              timeout_seconds=max(timeout - int(time.time() - started), 1)):
+            deployment = event['object']
+            logger.debug(
+                "Deployment '{p}' {t}: "
+                "Ready Replicas {r} - "
+                "Replicas {a}".format(
+                    p=name, t=event["type"],
+                    r=deployment.status.ready_replicas,
+                    a=deployment.status.replicas))
+            if deployment_has_replicas(deployment, replicas):
+                w.stop()
+                return time.time() - started
+    except urllib3.exceptions.ReadTimeoutError:
+        pass
+
+    raise FailedActivity(
+        "deployment '{s}' did not reach {r} ready replicas within {t}s".format(
+            s=name, r=replicas, t=timeout))
+
 
 def get_random_namespace(configuration: Configuration = None, secrets: Secrets = None):
     """
     Get random namespace from cluster.
-    Supports ns-ignore-list value in configuration
+    Supports ns-ignore-list value in configuration.
+    Namespaces are listed once per ns-inventory-ttl seconds (60 by default).
+    When ns-weighted-by-pods is true in configuration, namespaces running
+    more pods are more likely to be picked.
     :param secrets: chaostoolkit will inject this dictionary
     :param configuration: chaostoolkit will inject this dictionary
     :return: random namespace
     """
     ns_ignore_list = []
+    ttl = NS_INVENTORY_TTL
+    weighted = False
     if configuration is not None:
         ns_ignore_list = configuration.get("ns-ignore-list", [])
+        ttl = float(configuration.get("ns-inventory-ttl", NS_INVENTORY_TTL))
+        weighted = parse_flag(configuration.get("ns-weighted-by-pods", False))
 
-    api = create_k8s_api_client(secrets)
-    v1 = client.CoreV1Api(api)
-    ret = v1.list_namespace()
-    namespace = None
-
-    clean_ns = [
-        namespace for namespace in ret.items if namespace.metadata.name not in ns_ignore_list]
+    def v1_factory():
+        return client.CoreV1Api(create_k8s_api_client(secrets))
 
-    if len(clean_ns) > 0:
-        namespace = random.choice(clean_ns)
-    return namespace
+    return choose_random_namespace(v1_factory, ns_ignore_list,
+                                   secrets=secrets, ttl=ttl,
+                                   weighted=weighted)
 
 
-def deploy_single_obj(secrets: Secrets, ns: str, obj):
-    api = create_k8s_api_client(secrets)
-    retval = None
-    api_specific = None
+def deploy_single_obj(secrets: Secrets, ns: str, obj, api: client.ApiClient = None,
+                      apply: bool = False):
+    """
+    Create object in namespace `ns` with the api matching its apiVersion and
+    kind in DEPLOY_RESOURCES. Kinds in CLUSTER_SCOPED_KINDS are created
+    outside of any namespace. With `apply` set, the object is server side
+    applied instead, so deploying it again updates it in place rather than
+    failing because it already exists.
+    """
+    if api is None:
+        api = create_k8s_api_client(secrets)
     apiVersion = obj.get('apiVersion')
-    if apiVersion == 'apps/v1beta1':
-        api_specific = client.AppsV1beta1Api(api)
-    elif apiVersion == 'v1':
-        api_specific = client.CoreV1Api(api)
+    kind = obj.get('kind')
+    resource = DEPLOY_RESOURCES.get((apiVersion, kind))
+    if resource is None:
+        logger.warning("Unable to create object {} {}".format(apiVersion, kind))
+        return None
+
+    api_class, method_suffix, plural = resource
+    name = (obj.get('metadata') or {}).get('name')
+    if apply and name:
+        return apply_single_obj(api, ns, obj, plural)
+
+    api_specific = getattr(client, api_class)(api)
+    if kind in CLUSTER_SCOPED_KINDS:
+        create = getattr(api_specific, "create_" + method_suffix)
+        return create(body=obj)
+    create = getattr(api_specific, "create_namespaced_" + method_suffix)
+    return create(ns, body=obj)
+
+
+def apply_single_obj(api: client.ApiClient, ns: str, obj, plural: str):
+    """
+    Server side apply of object to namespace `ns`: a single PATCH request
+    that creates the object or updates it when it already exists. Kinds in
+    CLUSTER_SCOPED_KINDS are applied outside of any namespace.
+    """
+    apiVersion = obj.get('apiVersion')
+    if apiVersion == 'v1':
+        prefix = '/api/v1'
     else:
-        logger.warning("Unable to create api client for {}".format(apiVersion))
-    if api_specific is not None:
-        kind = obj.get('kind')
-        if kind == 'Deployment':
-            retval = api_specific.create_namespaced_deployment(ns, body=obj)
-        elif kind == 'Pod':
-            retval = api_specific.create_namespaced_pod(ns, body=obj)
-        else:
-            logger.warning("Unable to create object".format(kind))
-    return retval
+        prefix = '/apis/' + apiVersion
+    path_params = {'name': obj['metadata']['name']}
+    if obj.get('kind') in CLUSTER_SCOPED_KINDS:
+        path = prefix + '/' + plural + '/{name}'
+    else:
+        path = prefix + '/namespaces/{namespace}/' + plural + '/{name}'
+        path_params['namespace'] = ns
+        obj['metadata']['namespace'] = ns
+    return api.call_api(
+        path, 'PATCH',
+        path_params=path_params,
+        query_params=[('fieldManager', APPLY_FIELD_MANAGER), ('force', 'true')],
+        header_params={'Accept': 'application/json',
+                       'Content-Type': 'application/apply-patch+yaml'},
+        body=json.dumps(obj),
+        response_type='object',
+        auth_settings=['BearerToken'],
+        _return_http_data_only=True)
+
+
+def get_deploy_stages(objects) -> list:
+    """
+    Split objects to deploy to stages by kind: objects of a stage only depend
+    on objects of previous stages (namespaces, then configuration, then
+    services, then workloads), so objects of the same stage can be created
+    concurrently. Kinds not listed in DEPLOY_ORDER are deployed last.
+    """
+    stages = {}
+    for obj in objects:
+        order = DEPLOY_ORDER.get(obj.get('kind'), WORKLOADS_DEPLOY_ORDER)
+        stages.setdefault(order, []).append(obj)
+    return [stages[order] for order in sorted(stages)]
 
 
-def deploy_generic_template(secrets: Secrets, ns, template):
+def deploy_generic_template(secrets: Secrets, ns, template,
+                            max_workers: int = aio.AIO_MAX_CONCURRENCY,
+                            apply: bool = False):
+    """
+    Deploy one object or all objects of a multi document template with the
+    shared api client. Objects are created stage by stage (see
+    `get_deploy_stages`), objects of the same stage concurrently. With
+    `apply` set objects are server side applied (see `deploy_single_obj`).
+    """
     if isinstance(template, Iterable) and not isinstance(template, dict):
-        for obj in template:
-            deploy_single_obj(secrets, ns, obj)
+        objects = [obj for obj in template if obj]
     else:
-        deploy_single_obj(secrets, ns, template)
+        objects = [template]
+
+    api = aio.get_shared_api_client(secrets)
+    retval = []
+    for stage in get_deploy_stages(objects):
+        retval.extend(aio.run(aio.gather_limited(
+            [aio.call_api(deploy_single_obj, secrets, ns, obj, api=api,
+                          apply=apply)
+             for obj in stage], max_workers)))
+    return retval
 
 
 def deploy_deployment(secrets, ns, body):
@@ -246,39 +485,78 @@ def deploy_pod(secrets, ns, body):
     v1.create_namespaced_pod(ns, body=body)
 
 
+def load_manifest(spec_path: str, template_vars: Dict = None):
+    """
+    Load objects from JSON or YAML file, optionally a Jinja template of it
+    (`.json.jinja`, `.yaml.jinja`) rendered with `template_vars`.
+
+    Compiled templates and parsed objects are cached by path, modification
+    time and render variables, so repeated deploys of the same unchanged
+    file skip reading, rendering and parsing. Callers get their own copy of
+    cached objects.
+    """
+    p, ext = os.path.splitext(spec_path)
+    is_template = ext == '.jinja'
+    if is_template:
+        p, ext = os.path.splitext(p)
+    if ext not in ['.json', '.yml', '.yaml']:
+        raise FailedActivity(
+            "cannot process {path}".format(path=spec_path))
+
+    mtime = os.path.getmtime(spec_path)
+    vars_key = json.dumps(template_vars or {}, sort_keys=True, default=str)
+    key = (spec_path, mtime, vars_key)
+    documents = _manifests_cache.get(key)
+    if documents is None:
+        if is_template:
+            template = _templates_cache.get((spec_path, mtime))
+            if template is None:
+                with open(spec_path) as f:
+                    template = Template(f.read())
+                put_to_cache(_templates_cache, (spec_path, mtime), template)
+            text = template.render(**(template_vars or {}))
+        else:
+            with open(spec_path) as f:
+                text = f.read()
+
+        if ext == '.json':
+            documents = json.loads(text)
+        else:
+            documents = list(yaml.load_all(text, Loader=YamlLoader))
+        put_to_cache(_manifests_cache, key, documents)
+
+    return copy.deepcopy(documents)
+
+
+def put_to_cache(cache: OrderedDict, key, value):
+    cache[key] = value
+    if len(cache) > MANIFESTS_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
 def deploy_objects_in_namespace(spec_path: str,
                                 ns: str,
                                 configuration: Configuration = None,
-                                secrets: Secrets = None):
+                                secrets: Secrets = None,
+                                template_vars: Dict = None,
+                                apply: bool = False):
     """
     Start a microservice described by the deployment config, which must be the
     path to the JSON or YAML representation of the deployment.microservice will be
     started in random namespace.
+    Files with `.jinja` extension are rendered with `template_vars` first.
+    Set `apply` to server side apply objects, so redeploying is idempotent.
     """
-    p, ext = os.path.splitext(spec_path)
-    text = ''
-    if ext == '.jinja':
-        template = Template(open(spec_path).read())
-        text = template.render()
-        p, ext = os.path.splitext(p)
-    else:
-        with open(spec_path) as f:
-            text = f.read()
-
-    if ext == '.json':
-        deployment = json.loads(text)
-    elif ext in ['.yml', '.yaml']:
-        deployment = yaml.load_all(text)
-    else:
-        raise FailedActivity(
-            "cannot process {path}".format(path=spec_path))
+    deployment = load_manifest(spec_path, template_vars)
 
-    deploy_generic_template(secrets, ns, deployment)
+    deploy_generic_template(secrets, ns, deployment, apply=apply)
 
 
 def deploy_objects_in_random_namespace(spec_path: str,
                                        configuration: Configuration = None,
-                                       secrets: Secrets = None):
+                                       secrets: Secrets = None,
+                                       template_vars: Dict = None,
+                                       apply: bool = False):
     """
     Start a microservice described by the deployment config, which must be the
     path to the JSON or YAML representation of the deployment.microservice will be
@@ -287,4 +565,5 @@ def deploy_objects_in_random_namespace(spec_path: str,
     ns = get_random_namespace(configuration=configuration, secrets=secrets)
 
     deploy_objects_in_namespace(
-        spec_path=spec_path, ns=ns.metadata.name, secrets=secrets, configuration=configuration)
+        spec_path=spec_path, ns=ns.metadata.name, template_vars=template_vars,
+        apply=apply, secrets=secrets, configuration=configuration)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio flavour of the Kubernetes calls behind the probes of this extension.
+
+The coroutines hand the blocking calls of the Kubernetes client over to a
+shared thread pool, and all of them go through one ApiClient per cluster
+whose connection pool is sized for the pool, so fan-out checks (many
+namespaces, nodes or pods logs) run concurrently while reusing connections.
+Synchronous probes and actions call them through `run`.
+
+Every Kubernetes fan-out of this extension goes through this module,
+`chaosk8s_wix.parallel` is only used for clients of other systems (boto3,
+paramiko, plain HTTP) which bring their own connection handling.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from chaoslib.types import Secrets
+from kubernetes import client
+
+from chaosk8s_wix import create_k8s_api_client, get_cluster_key
+
+__all__ = ["run", "call_api", "gather_limited", "get_shared_api_client",
+           "async_list_pods", "async_list_pods_in_namespaces",
+           "async_read_pod_log", "async_read_pods_logs", "async_patch_node"]
+
+AIO_MAX_WORKERS = 64
+AIO_MAX_CONCURRENCY = 256
+# shared clients are rebuilt after that many seconds, so credentials
+# rotated in vault are picked up
+AIO_API_CLIENT_TTL = 300
+
+# secrets or environment keys holding the credentials of the client
+K8S_AUTH_KEYS = ("NASA_SECRETS_URL", "NASA_TOKEN", "KUBERNETES_API_KEY",
+                 "KUBERNETES_API_KEY_PREFIX", "KUBERNETES_USERNAME",
+                 "KUBERNETES_PASSWORD", "KUBERNETES_CERT_FILE",
+                 "KUBERNETES_KEY_FILE", "KUBERNETES_VERIFY_SSL",
+                 "KUBERNETES_CA_CERT_FILE")
+
+_executor = ThreadPoolExecutor(max_workers=AIO_MAX_WORKERS)
+_api_clients = {}
+_api_clients_lock = threading.Lock()
+
+
+def run(coro) -> Any:
+    """
+    Run coroutine to completion on a fresh event loop and return its result.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def get_api_client_key(secrets: Secrets = None) -> tuple:
+    """
+    Key of the shared ApiClient: the cluster the secrets point to and the
+    credentials used to talk to it.
+    """
+    env = os.environ
+    secrets = secrets or {}
+    return (get_cluster_key(secrets),) + tuple(
+        secrets.get(k, env.get(k)) for k in K8S_AUTH_KEYS)
+
+
+def get_shared_api_client(secrets: Secrets = None) -> client.ApiClient:
+    """
+    Return the ApiClient shared by all coroutines talking to the cluster the
+    secrets point to with the same credentials. Its connection pool can hold
+    a connection per worker of the shared thread pool. Clients are rebuilt
+    after AIO_API_CLIENT_TTL seconds.
+    """
+    key = get_api_client_key(secrets)
+    with _api_clients_lock:
+        cached = _api_clients.get(key)
+        if cached is None or time.time() - cached[1] > AIO_API_CLIENT_TTL:
+            cached = (create_k8s_api_client(secrets,
+                                            pool_maxsize=AIO_MAX_WORKERS),
+                      time.time())
+            _api_clients[key] = cached
+    return cached[0]
+
+
+async def call_api(func, *args, **kwargs) -> Any:
+    """
+    Await a blocking Kubernetes client call run in the shared thread pool.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(func, *args, **kwargs))
+
+
+async def gather_limited(coros, limit: int = AIO_MAX_CONCURRENCY) -> List:
+    """
+    Await all coroutines with at most `limit` of them in flight, results are
+    returned in the same order.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*[limited(c) for c in coros])
+
+
+async def async_list_pods(v1: client.CoreV1Api, ns: str = None,
+                          **kwargs) -> List[client.V1Pod]:
+    """
+    List pods of namespace `ns`, or of all namespaces when `ns` is not set.
+    """
+    if ns:
+        ret = await call_api(v1.list_namespaced_pod, ns, **kwargs)
+    else:
+        ret = await call_api(v1.list_pod_for_all_namespaces, **kwargs)
+    return ret.items
+
+
+async def async_list_pods_in_namespaces(v1: client.CoreV1Api,
+                                        ns_list: List[str],
+                                        **kwargs) -> List[client.V1Pod]:
+    """
+    List pods of all namespaces from `ns_list` concurrently.
+    """
+    results = await gather_limited(
+        [async_list_pods(v1, ns, **kwargs) for ns in ns_list])
+    pods = []
+    for items in results:
+        pods.extend(items)
+    return pods
+
+
+async def async_read_pod_log(v1: client.CoreV1Api, name: str, ns: str,
+                             **params) -> str:
+    params["_preload_content"] = False
+    r = await call_api(v1.read_namespaced_pod_log, name, namespace=ns,
+                       **params)
+    return r.read().decode('utf-8')
+
+
+async def async_read_pods_logs(v1: client.CoreV1Api, names: List[str],
+                               ns: str, **params) -> Dict[str, str]:
+    """
+    Read logs of all pods named in `names` concurrently.
+    """
+    logs = await gather_limited(
+        [async_read_pod_log(v1, name, ns, **dict(params)) for name in names])
+    return dict(zip(names, logs))
+
+
+async def async_patch_node(v1: client.CoreV1Api, name: str, body) -> Any:
+    return await call_api(v1.patch_node, name, body)
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, List
+
+from botocore.exceptions import ClientError
+from chaoslib.types import Secrets
+
+from chaosk8s_wix import get_cluster_key, list_all_pages
+
+__all__ = ["iter_aws_instances", "get_instance_ids_by_dns_names",
+           "get_node_instance_inventory", "lookup_node_instances",
+           "update_instances_tags",
+           "forget_instances", "invalidate_instance_index",
+           "split_to_chunks", "call_with_retries"]
+
+INSTANCE_INDEX_TTL = 300
+DESCRIBE_PAGE_SIZE = 1000
+# AWS accepts up to 200 values per describe filter
+FILTER_VALUES_CHUNK_SIZE = 200
+
+AWS_MAX_ATTEMPTS = 5
+AWS_RETRY_BASE_DELAY = 0.5
+THROTTLING_ERROR_CODES = {"Throttling", "ThrottlingException",
+                          "RequestLimitExceeded", "TooManyRequestsException"}
+
+# private ips, and dns names derived from them, are reused by AWS, so
+# terminated instances must not shadow the live instance holding them now
+LIVE_INSTANCE_STATES = ["pending", "running", "stopping", "stopped"]
+
+_IP_ADDRESS = re.compile(r"^\d{1,3}(\.\d{1,3}){3}$")
+
+_inventories = {}
+_inventories_lock = threading.Lock()
+
+
+def split_to_chunks(items: List, size: int) -> Iterator[List]:
+    """
+    Yield consecutive slices of `items` holding at most `size` elements.
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def call_with_retries(func, *args, **kwargs):
+    """
+    Call AWS API function, calls rejected by AWS throttling are retried up to
+    AWS_MAX_ATTEMPTS times with exponential backoff and jitter. Other errors
+    are raised right away.
+    """
+    for attempt in range(AWS_MAX_ATTEMPTS):
+        try:
+            return func(*args, **kwargs)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code not in THROTTLING_ERROR_CODES or \
+                    attempt == AWS_MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(random.uniform(0, AWS_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def iter_aws_instances(ec2, filters: List = None,
+                       page_size: int = None) -> Iterator[Dict]:
+    """
+    Call ec2.describe_instances page by page, following the `NextToken`
+    returned by AWS, and yield every instance description.
+    """
+    kwargs = {"Filters": list(filters or [])}
+    if page_size:
+        kwargs["MaxResults"] = page_size
+    while True:
+        response = ec2.describe_instances(**kwargs)
+        for reservation in response["Reservations"]:
+            for instance in reservation["Instances"]:
+                yield instance
+        next_token = response.get("NextToken")
+        if not next_token:
+            break
+        kwargs["NextToken"] = next_token
+
+
+def get_live_instances_filters(filters: List = None) -> List:
+    """
+    Copy of `filters` limited to instances in LIVE_INSTANCE_STATES, unless
+    they already filter by instance state.
+    """
+    retval = list(filters or [])
+    if not any(f.get('Name') == 'instance-state-name' for f in retval):
+        retval.append({'Name': 'instance-state-name',
+                       'Values': LIVE_INSTANCE_STATES})
+    return retval
+
+
+def get_inventory_store(secrets: Secrets = None, filters: List = None) -> Dict:
+    """
+    Helper function, call with _inventories_lock held.
+    Inventory of the cluster the secrets point to, for instances matching
+    `filters`. "index" maps node name, private dns name, private ip and
+    instance id to the same entry.
+    """
+    key = (get_cluster_key(secrets), json.dumps(filters or [], sort_keys=True))
+    store = _inventories.get(key)
+    if store is None:
+        store = {"loaded": None, "index": {}}
+        _inventories[key] = store
+    return store
+
+
+def get_node_internal_ip(node) -> str:
+    for address in (node.status.addresses or []) if node.status else []:
+        if address.type == "InternalIP":
+            return address.address
+    return None
+
+
+def index_instances(index: Dict, instances, nodes: List = None):
+    """
+    Helper function.
+    Add entries of instances to `index`. Instance is joined with k8s node
+    named by its PrivateDnsName or having its PrivateIpAddress as InternalIP,
+    with no `nodes` given node name is assumed to be the PrivateDnsName.
+    Instances which are shutting down or terminated are skipped.
+    """
+    nodes_by_name = {}
+    nodes_by_ip = {}
+    for node in nodes or []:
+        nodes_by_name[node.metadata.name] = node.metadata.name
+        ip = get_node_internal_ip(node)
+        if ip:
+            nodes_by_ip[ip] = node.metadata.name
+    loaded = time.time()
+    for instance in instances:
+        state = instance.get('State', {}).get('Name')
+        if state is not None and state not in LIVE_INSTANCE_STATES:
+            continue
+        dns_name = instance.get('PrivateDnsName')
+        ip = instance.get('PrivateIpAddress')
+        if nodes is None:
+            node_name = dns_name
+        else:
+            node_name = nodes_by_name.get(dns_name, nodes_by_ip.get(ip))
+        entry = {"node_name": node_name,
+                 "private_dns_name": dns_name,
+                 "private_ip": ip,
+                 "instance_id": instance['InstanceId'],
+                 "state": state,
+                 "tags": {tag['Key']: tag.get('Value')
+                          for tag in instance.get('Tags') or []},
+                 "loaded": loaded}
+        for key in (node_name, dns_name, ip, instance['InstanceId']):
+            if key:
+                index[key] = entry
+
+
+def merge_into_index(index: Dict, found: Dict):
+    """
+    Helper function, call with _inventories_lock held.
+    Add entries refreshed by `lookup_node_instances` to `index`. Refreshed
+    entries do not know k8s nodes, so node names joined by the full inventory
+    are kept for instances already in the index.
+    """
+    for entry in {id(e): e for e in found.values()}.values():
+        known = index.get(entry["instance_id"])
+        if known is not None and known["node_name"] and \
+                known["node_name"] != entry["node_name"]:
+            entry["node_name"] = known["node_name"]
+            found[entry["node_name"]] = entry
+    index.update(found)
+
+
+def get_node_instance_inventory(v1, ec2, filters: List = None,
+                                secrets: Secrets = None,
+                                ttl: int = INSTANCE_INDEX_TTL) -> Dict:
+    """
+    Joined inventory of k8s nodes and the ec2 instances backing them,
+    built with one paginated node list and one paginated describe_instances
+    call and rebuilt when older than `ttl` seconds. Only live instances,
+    see LIVE_INSTANCE_STATES, are indexed.
+
+    :param v1: CoreV1Api of the cluster
+    :param ec2: boto3 ec2 client
+    :return: dictionary keyed by node name, private dns name, private ip and
+    instance id, values are entries with "node_name", "private_dns_name",
+    "private_ip", "instance_id", "state" and "tags"
+    """
+    with _inventories_lock:
+        store = get_inventory_store(secrets, filters)
+        if store["loaded"] is not None and \
+                time.time() - store["loaded"] <= ttl:
+            return dict(store["index"])
+
+    nodes = list_all_pages(v1.list_node)
+    index = {}
+    index_instances(index, iter_aws_instances(
+        ec2, get_live_instances_filters(filters),
+        page_size=DESCRIBE_PAGE_SIZE), nodes)
+    with _inventories_lock:
+        store = get_inventory_store(secrets, filters)
+        store["index"] = index
+        store["loaded"] = time.time()
+    return dict(index)
+
+
+def get_lookup_filter_name(key: str) -> str:
+    if key.startswith("i-"):
+        return "instance-id"
+    if _IP_ADDRESS.match(key):
+        return "private-ip-address"
+    return "private-dns-name"
+
+
+def lookup_node_instances(ec2, keys: List[str], filters: List = None,
+                          secrets: Secrets = None,
+                          ttl: int = INSTANCE_INDEX_TTL) -> Dict[str, Dict]:
+    """
+    Look up inventory entries by node name, private dns name, private ip or
+    instance id. Keys missing from the inventory, or with entries older than
+    `ttl` seconds, are refreshed with a paginated describe_instances call
+    with the keys pushed down as filter. Keys known to the inventory are
+    refreshed by the instance id of their entry, so nodes joined by their
+    InternalIP can still be looked up by node name. Keys with no matching
+    live instance are left out of the result.
+    """
+    now = time.time()
+    retval = {}
+    stale = {}
+    with _inventories_lock:
+        index = get_inventory_store(secrets, filters)["index"]
+        for key in keys:
+            entry = index.get(key)
+            if entry is None:
+                continue
+            if now - entry["loaded"] <= ttl:
+                retval[key] = entry
+            else:
+                stale.setdefault(entry["instance_id"], []).append(key)
+
+    stale_keys = set(k for ks in stale.values() for k in ks)
+    missing = {}
+    for key in dict.fromkeys(keys):
+        if key not in retval and key not in stale_keys:
+            missing.setdefault(get_lookup_filter_name(key), []).append(key)
+    if stale:
+        missing.setdefault("instance-id", []).extend(stale)
+    for filter_name, names in missing.items():
+        for chunk in split_to_chunks(names, FILTER_VALUES_CHUNK_SIZE):
+            chunk_filters = get_live_instances_filters(filters)
+            chunk_filters.append({'Name': filter_name, 'Values': chunk})
+            found = {}
+            index_instances(found, iter_aws_instances(ec2, chunk_filters))
+            with _inventories_lock:
+                merge_into_index(
+                    get_inventory_store(secrets, filters)["index"], found)
+            for key in chunk:
+                if key not in found:
+                    continue
+                for original_key in stale.get(key, [key]):
+                    retval[original_key] = found[key]
+    return retval
+
+
+def update_instances_tags(instance_ids: List[str], set_tags: Dict = None,
+                          removed_tags: List[str] = None,
+                          secrets: Secrets = None):
+    """
+    Apply tags changed by this extension to inventories of the cluster the
+    secrets point to, so they do not have to be loaded again.
+    """
+    cluster = get_cluster_key(secrets)
+    ids = set(instance_ids)
+    with _inventories_lock:
+        for key, store in _inventories.items():
+            if key[0] != cluster:
+                continue
+            for instance_id in ids:
+                entry = store["index"].get(instance_id)
+                if entry is None:
+                    continue
+                entry["tags"].update(set_tags or {})
+                for tag in removed_tags or []:
+                    entry["tags"].pop(tag, None)
+
+
+def forget_instances(instance_ids: List[str], secrets: Secrets = None):
+    """
+    Drop entries of terminated instances from inventories of the cluster the
+    secrets point to.
+    """
+    cluster = get_cluster_key(secrets)
+    ids = set(instance_ids)
+    with _inventories_lock:
+        for key, store in _inventories.items():
+            if key[0] != cluster:
+                continue
+            index = store["index"]
+            for k in [k for k, e in index.items() if e["instance_id"] in ids]:
+                del index[k]
+
+
+def get_instance_ids_by_dns_names(ec2, dns_names: List[str],
+                                  filters: List = None,
+                                  secrets: Secrets = None,
+                                  ttl: int = INSTANCE_INDEX_TTL
+                                  ) -> Dict[str, str]:
+    """
+    Map PrivateDnsName of instances matching `filters` to their InstanceId,
+    see `lookup_node_instances`.
+    """
+    entries = lookup_node_instances(ec2, dns_names, filters, secrets, ttl)
+    return {name: entry["instance_id"] for name, entry in entries.items()}
+
+
+def invalidate_instance_index(secrets: Secrets = None):
+    """
+    Drop node and instance inventories of the cluster the secrets point to.
+    """
+    cluster = get_cluster_key(secrets)
+    with _inventories_lock:
+        for key in [k for k in _inventories if k[0] == cluster]:
+            del _inventories[key]
@@ -1,40 +1,95 @@
 # -*- coding: utf-8 -*-
+import itertools
 import random
+import shlex
+import threading
+import time
+from typing import Dict
 import boto3
+from chaoslib.exceptions import InvalidActivity
 from chaoslib.types import Configuration, Secrets
+from kubernetes import client, watch
+import urllib3
 from logzero import logger
 from chaosk8s_wix.node import get_active_nodes, load_taint_list_from_dict
-from fabric import api
-import os
 from chaosk8s_wix.slack.logger_handler import SlackHanlder
-from chaosk8s_wix import create_aws_client, create_aws_resource
+from chaosk8s_wix import create_aws_client, create_aws_resource, get_aws_key, create_k8s_api_client
+from chaosk8s_wix.aws import get_instance_ids_by_dns_names, split_to_chunks, call_with_retries, \
+    iter_aws_instances, get_node_instance_inventory, update_instances_tags, \
+    forget_instances, INSTANCE_INDEX_TTL, DESCRIBE_PAGE_SIZE
+from chaosk8s_wix.parallel import run_in_parallel, DEFAULT_MAX_WORKERS
+from chaosk8s_wix.ssh import run_on_hosts, SSH_MAX_WORKERS
 
 __all__ = [
     "tag_random_node_aws",
     "set_tag_to_aws_instance",
+    "set_tag_to_aws_instances",
     "detach_sq_from_instance_by_tag",
     "attach_sq_to_instance_by_tag",
+    "restore_sq_of_instances",
     "remove_tag_from_aws_instances",
     "iptables_block_port",
     "terminate_instance_by_tag",
+    "terminate_instances_by_tag",
     "run_shell_command_on_tag"
 ]
 
+TAGS_CHUNK_SIZE = 1000
+SG_ID_TTL = 600
+TERMINATE_WAITER_DELAY = 15
+# smallest MaxResults describe_instances accepts
+MIN_DESCRIBE_PAGE_SIZE = 5
+IPTABLES_DEFAULT_PROTOCOLS = ["tcp"]
+
+_sg_ids = {}
+_sg_rollback = {}
+_sg_lock = threading.Lock()
+
 slack_handler = SlackHanlder()
 slack_handler.attach(logger)
 
 
 def get_aws_filters_from_configuration(configuration: Configuration = None):
+    """
+    Copy of "aws-instance-filters" list from configuration, callers are free to extend it.
+    """
     filters_to_set = []
     if configuration is not None and "aws-instance-filters" in configuration.keys() is not None:
-        filters_to_set = configuration["aws-instance-filters"]
+        filters_to_set = list(configuration["aws-instance-filters"])
     return filters_to_set
 
 
+def get_instance_inventory(filters: list, configuration: Configuration = None, secrets: Secrets = None,
+                           ec2=None, v1: client.CoreV1Api = None) -> Dict:
+    """
+    Helper function.
+    Joined k8s node / ec2 instance inventory of instances matching `filters`, see
+    `chaosk8s_wix.aws.get_node_instance_inventory`. It is reloaded after "aws-inventory-ttl" seconds of
+    configuration (300 by default), tags changed by actions of this module are applied to it right away.
+    """
+    ttl = INSTANCE_INDEX_TTL
+    if configuration is not None and configuration.get("aws-inventory-ttl") is not None:
+        ttl = float(configuration["aws-inventory-ttl"])
+    if ec2 is None:
+        ec2 = create_aws_client(secrets, 'ec2')
+    if v1 is None:
+        v1 = client.CoreV1Api(create_k8s_api_client(secrets))
+    return get_node_instance_inventory(v1, ec2, filters, secrets, ttl)
+
+
 def get_sg_id_by_name(name: str = "",
                       secrets: Secrets = None):
+    """
+    Id of security group named `name`. Resolved ids are cached for SG_ID_TTL seconds.
+    """
     retval = ""
     if name != "":
+        key = get_aws_key(secrets) + (name,)
+        with _sg_lock:
+            cached = _sg_ids.get(key)
+        if cached is not None and time.time() - cached[1] <= SG_ID_TTL:
+            return cached[0]
+
         ec2 = create_aws_client(secrets, 'ec2')
         security_groups = ec2.describe_security_groups(
             Filters=[
@@ -46,6 +101,9 @@ def get_sg_id_by_name(name: str = "",
         )
         for sg in security_groups['SecurityGroups']:
             retval = sg['GroupId']
+        if retval:
+            with _sg_lock:
+                _sg_ids[key] = (retval, time.time())
     return retval
 
 
@@ -60,20 +118,39 @@ def set_tag_to_aws_instance(k8s_node_name: str = "not_defined",
     :param aws_instance_filter: not all aws instances are included into chaos testing scope.
     :return: result of ec2.create_tags, None if instance with specified PrivateDnsName was not found
     """
+    return set_tag_to_aws_instances([k8s_node_name], tag_name,
+                                    aws_instance_filter, secrets=secrets)
+
+
+def set_tag_to_aws_instances(k8s_node_names: list = [],
+                             tag_name: str = "under_chaostest",
+                             aws_instance_filter: list = [],
+                             secrets: Secrets = None):
+    """
+    Set tag to aws instances of several k8s nodes. Instances are resolved with one paginated describe call
+    and tagged with one create_tags call per 1000 instances.
+    :param k8s_node_names: k8s node names, the same as PrivateDnsName field in aws
+    :param tag_name:  tag name to set
+    :param aws_instance_filter: not all aws instances are included into chaos testing scope.
+    :return: result of ec2.create_tags, None if no instance with specified PrivateDnsName was found
+    """
     filters_to_set = []
     if aws_instance_filter is not None:
         filters_to_set = aws_instance_filter
 
     ec2 = create_aws_client(secrets, 'ec2')
     retval = None
-    response = ec2.describe_instances(Filters=filters_to_set)
-
-    for reservation in (response["Reservations"]):
-        for instance in reservation["Instances"]:
-            if instance['PrivateDnsName'] == k8s_node_name:
-
-                retval = ec2.create_tags(Resources=[instance['InstanceId']],
-                                         Tags=[{'Key': tag_name, 'Value': tag_name}])
+    ids_by_name = get_instance_ids_by_dns_names(ec2, k8s_node_names,
+                                                filters_to_set, secrets=secrets)
+    for name in k8s_node_names:
+        if name not in ids_by_name:
+            logger.warning("No aws instance found for node {}".format(name))
+
+    instance_ids = list(dict.fromkeys(ids_by_name.values()))
+    for chunk in split_to_chunks(instance_ids, TAGS_CHUNK_SIZE):
+        retval = ec2.create_tags(Resources=chunk,
+                                 Tags=[{'Key': tag_name, 'Value': tag_name}])
+    update_instances_tags(instance_ids, {tag_name: tag_name}, secrets=secrets)
     return retval
 
 
@@ -84,7 +161,7 @@ def tag_random_node_aws(k8s_label_selector: str = None,
                         ) -> (int, str):
     """
     This works for k8s in aws only. Tags aws instance with specific tag. nodes will be slected from k8s cluster, and
-    linked by PrivateDnsName property.
+    linked to their instances with the joined node / instance inventory, see `get_instance_inventory`.
 
     :param k8s_label_selector: label selector for k8s nodes "com.wix.lifecycle=true"
     :param secrets: secrets to connect to k8s
@@ -102,22 +179,27 @@ def tag_random_node_aws(k8s_label_selector: str = None,
 
     resp, k8s_api_v1 = get_active_nodes(
         k8s_label_selector, ignore_list, secrets)
-    random_node = None
-    if len(resp.items) > 0:
-        random_node = random.choice(resp.items)
-    if random_node is not None:
-        logger.info("tag_random_node_aws selected node " +
-                    random_node.metadata.name + " with label " + tag_name)
-        aws_retval = set_tag_to_aws_instance(
-            random_node.metadata.name, tag_name, filters_to_set, secrets=secrets)
-        if aws_retval is None:
-            retval = 1
-            desc = "Failed to set tag on aws node " + random_node.metadata.name
-        else:
-            desc = random_node.metadata.name
-    else:
+    if len(resp.items) == 0:
+        return 1, "No node selected"
+
+    ec2 = create_aws_client(secrets, 'ec2')
+    inventory = get_instance_inventory(filters_to_set, configuration, secrets, ec2=ec2, v1=k8s_api_v1)
+    backed_nodes = [node for node in resp.items if node.metadata.name in inventory]
+    if not backed_nodes:
+        return 1, "No aws instance found for nodes selected by {}".format(k8s_label_selector)
+
+    random_node = random.choice(backed_nodes)
+    instance_id = inventory[random_node.metadata.name]["instance_id"]
+    logger.info("tag_random_node_aws selected node " +
+                random_node.metadata.name + " with label " + tag_name)
+    aws_retval = ec2.create_tags(Resources=[instance_id],
+                                 Tags=[{'Key': tag_name, 'Value': tag_name}])
+    if aws_retval is None:
         retval = 1
-        desc = "No node selected"
+        desc = "Failed to set tag on aws node " + random_node.metadata.name
+    else:
+        update_instances_tags([instance_id], {tag_name: tag_name}, secrets=secrets)
+        desc = random_node.metadata.name
 
     return retval, desc
 
@@ -136,154 +218,377 @@ def remove_tag_from_aws_instances(configuration: Configuration = None,
 
     ec2 = create_aws_client(secrets, 'ec2')
     retval = None
-    response = ec2.describe_instances(Filters=filters_to_set)
-    array_of_ids = []
-    for reservation in (response["Reservations"]):
-        for instance in reservation["Instances"]:
-            array_of_ids.append(instance.get('InstanceId'))
+    array_of_ids = [instance.get('InstanceId')
+                    for instance in iter_aws_instances(ec2, filters_to_set, page_size=DESCRIBE_PAGE_SIZE)]
     if len(array_of_ids) > 0:
-        ec2.delete_tags(Resources=array_of_ids, Tags=[{"Key": tag_name}])
+        for chunk in split_to_chunks(array_of_ids, TAGS_CHUNK_SIZE):
+            call_with_retries(ec2.delete_tags, Resources=chunk, Tags=[{"Key": tag_name}])
+        update_instances_tags(array_of_ids, removed_tags=[tag_name], secrets=secrets)
     else:
         logger.warning('No aws instances found with tag {}'.format(tag_name))
     return retval
 
 
+def set_interface_groups(ec2, interface_id: str, instance_id: str, original_groups: list, groups_func) -> Dict:
+    """
+    Helper function.
+    Replace security groups of network interface with the ones returned by `groups_func` for the current
+    groups, original groups are kept in the rollback record unless already recorded by an earlier change.
+    The change goes through ec2 client, which unlike boto3 resources is safe to share between threads.
+    """
+    groups = groups_func(original_groups)
+    with _sg_lock:
+        _sg_rollback.setdefault(interface_id, {"instance_id": instance_id,
+                                               "groups": original_groups})
+    call_with_retries(ec2.modify_network_interface_attribute, NetworkInterfaceId=interface_id, Groups=groups)
+    return {"instance_id": instance_id,
+            "original_groups": original_groups,
+            "groups": groups}
+
+
+def change_instances_groups(instances, groups_func, max_workers: int = DEFAULT_MAX_WORKERS,
+                            secrets: Secrets = None) -> Dict:
+    """
+    Helper function.
+    Apply `groups_func` to groups of all network interfaces of all instances, network interfaces are
+    modified concurrently. Returns changes keyed by network interface id.
+    """
+    ec2 = create_aws_client(secrets, 'ec2')
+    interfaces = [(interface.id, instance.id, [sg['GroupId'] for sg in interface.groups])
+                  for instance in instances for interface in instance.network_interfaces]
+
+    def change_interface(item):
+        interface_id, instance_id, original_groups = item
+        return interface_id, set_interface_groups(ec2, interface_id, instance_id, original_groups, groups_func)
+
+    return dict(run_in_parallel(change_interface, interfaces, max_workers))
+
+
 def attach_sq_to_instance_by_tag(tag_name: str = "not_set",
                                  sg_name: str = "not_set",
                                  configuration: Configuration = None,
-                                 secrets: Secrets = None):
+                                 secrets: Secrets = None,
+                                 max_workers: int = DEFAULT_MAX_WORKERS):
     """
-    Attaches security group to all instances with specific tag set.
+    Attaches security group to all instances with specific tag set. The security group replaces all
+    groups of the instances network interfaces, use `restore_sq_of_instances` to put original ones back.
 
     :param tag_name: tag to filter aws instances
     :param sg_name: security group name to attach
     :param configuration: injected by chaostoolkit framework
-    :return: result of modify_attribute call
+    :param max_workers: amount of network interfaces modified at the same time
+    :return: changes keyed by network interface id, with instance id, original and new groups
     """
-    retval = None
     ec2 = create_aws_resource(secrets, 'ec2')
 
     filters_to_set = get_aws_filters_from_configuration(configuration)
     filters_to_set.append({'Name': 'tag:' + tag_name, 'Values': [tag_name]})
     response = ec2.instances.filter(Filters=filters_to_set)
-    sg_id = get_sg_id_by_name(sg_name)
+    sg_id = get_sg_id_by_name(sg_name, secrets)
+    instances = []
     for instance in response:
-        all_sg_ids = []
-        all_sg_ids.append(sg_id)
-
         logger.warning('Attach {} to instance {} {}'.format(
             sg_id, instance.id, instance.private_dns_name))
-        for interface in instance.network_interfaces:
-            retval = interface.modify_attribute(Groups=all_sg_ids)
-    return retval
+        instances.append(instance)
+    return change_instances_groups(instances, lambda groups: [sg_id], max_workers, secrets)
 
 
 def detach_sq_from_instance_by_tag(tag_name: str = "not_set",
                                    sg_name: str = "not_set",
                                    configuration: Configuration = None,
-                                   secrets: Secrets = None):
+                                   secrets: Secrets = None,
+                                   max_workers: int = DEFAULT_MAX_WORKERS):
     """
     Detaches security group from instances market with specified tag.
     :param tag_name: tag to filter aws instances
     :param sg_name: security group name to attach
     :param configuration: configuration: injected by chaostoolkit framework
-    :return: result of modify_attribute call
+    :param max_workers: amount of network interfaces modified at the same time
+    :return: changes keyed by network interface id, with instance id, original and new groups
     """
-    retval = None
     ec2 = create_aws_resource(secrets, 'ec2')
     filters_to_set = get_aws_filters_from_configuration(configuration)
     filters_to_set.append({'Name': 'tag:' + tag_name, 'Values': [tag_name]})
     response = ec2.instances.filter(Filters=filters_to_set)
 
-    target_sg_id = get_sg_id_by_name(sg_name)
+    target_sg_id = get_sg_id_by_name(sg_name, secrets)
+    instances = []
     for instance in response:
-        all_sg_ids = [sg['GroupId']
-                      for sg in instance.security_groups if sg['GroupId'] != target_sg_id]
         logger.warning('Detach {} from instance {} {}'.format(target_sg_id,
                                                               instance.id,
                                                               instance.private_dns_name))
+        instances.append(instance)
+    return change_instances_groups(
+        instances, lambda groups: [sg for sg in groups if sg != target_sg_id], max_workers, secrets)
 
-        retval = instance.modify_attribute(Groups=all_sg_ids)
-    return retval
 
-
-def terminate_instance_by_tag(tag_name: str = "not_set",
-                              configuration: Configuration = None,
-                              secrets: Secrets = None):
+def restore_sq_of_instances(configuration: Configuration = None,
+                            secrets: Secrets = None,
+                            max_workers: int = DEFAULT_MAX_WORKERS):
     """
-    Terminates instance marked with specified tag in aws
-    :param tag_name: tag to filter aws instances
+    Put back security groups network interfaces had before attach_sq_to_instance_by_tag or
+    detach_sq_from_instance_by_tag changed them.
     :param configuration: configuration: injected by chaostoolkit framework
-    :return: result of modify_attribute call
+    :param max_workers: amount of network interfaces modified at the same time
+    :return: restored groups keyed by network interface id
     """
-    retval = None
+    ec2 = create_aws_client(secrets, 'ec2')
+    with _sg_lock:
+        records = list(_sg_rollback.items())
 
-    ec2 = create_aws_resource(secrets, 'ec2')
+    def restore(item):
+        interface_id, record = item
+        logger.warning('Restore groups {} of instance {} interface {}'.format(
+            record["groups"], record["instance_id"], interface_id))
+        call_with_retries(ec2.modify_network_interface_attribute, NetworkInterfaceId=interface_id,
+                          Groups=record["groups"])
+        with _sg_lock:
+            _sg_rollback.pop(interface_id, None)
+        return record["groups"]
+
+    return dict(zip([interface_id for interface_id, _ in records],
+                    run_in_parallel(restore, records, max_workers)))
+
+
+def get_tagged_running_filters(tag_name: str, configuration: Configuration = None) -> list:
+    """
+    Helper function.
+    Filters selecting running instances marked with `tag_name`, so AWS only returns the instances
+    actions act on and no k8s API call is needed to pick them.
+    """
     filters_to_set = get_aws_filters_from_configuration(configuration)
     filters_to_set.append({'Name': 'tag:' + tag_name, 'Values': [tag_name]})
+    filters_to_set.append({'Name': 'instance-state-name', 'Values': ['running']})
+    return filters_to_set
+
+
+def get_terminate_filters(tag_name: str, configuration: Configuration = None, secrets: Secrets = None) -> list:
+    """
+    Helper function.
+    Filters selecting running instances of the k8s cluster marked with `tag_name`.
+    """
+    secrets = secrets or {}
+    filters_to_set = get_tagged_running_filters(tag_name, configuration)
     dc = secrets.get("KUBERNETES_CONTEXT", "undefined")
     filters_to_set.append({'Name': 'tag:KubernetesCluster', 'Values': [
                           "{}.k8s.wixprod.net".format(dc)]})
+    return filters_to_set
 
-    filters_to_set.append(
-        {'Name': 'instance-state-name', 'Values': ['running']})
 
-    response = ec2.instances.filter(Filters=filters_to_set)
-    instances = list(response)
-    if len(instances) > 0:
-        instance = instances[0]
+def terminate_instance_by_tag(tag_name: str = "not_set",
+                              configuration: Configuration = None,
+                              secrets: Secrets = None):
+    """
+    Terminates instance marked with specified tag in aws. The instance is picked by a describe_instances
+    call filtered by the tag and running state, made right before terminating it.
+    :param tag_name: tag to filter aws instances
+    :param configuration: configuration: injected by chaostoolkit framework
+    :return: result of terminate_instances call
+    """
+    retval = None
+
+    ec2 = create_aws_client(secrets, 'ec2')
+    instance = next(iter_aws_instances(ec2, get_terminate_filters(tag_name, configuration, secrets),
+                                       page_size=DESCRIBE_PAGE_SIZE), None)
+    if instance is not None:
         logger.warning('Terminate instance {} {}'.format(
-            instance.id, instance.private_dns_name))
-        retval = instance.terminate()
+            instance['InstanceId'], instance.get('PrivateDnsName')))
+        retval = call_with_retries(ec2.terminate_instances, InstanceIds=[instance['InstanceId']])
+        forget_instances([instance['InstanceId']], secrets)
     else:
         logger.info("No aws instances found with tag {}".format(tag_name))
     return retval
 
 
+def node_is_ready(node) -> bool:
+    for condition in node.status.conditions or []:
+        if condition.type == "Ready":
+            return condition.status == "True"
+    return False
+
+
+def wait_for_replacement_nodes(v1: client.CoreV1Api, known_nodes: set, count: int,
+                               label_selector: str = None, timeout: int = 900) -> bool:
+    """
+    Helper function.
+    Watch k8s nodes until `count` Ready nodes that are not in `known_nodes` show up.
+    :return: True when they did within `timeout` seconds
+    """
+    kwargs = {}
+    if label_selector:
+        kwargs["label_selector"] = label_selector
+    started = time.time()
+    ret = v1.list_node(**kwargs)
+    new_nodes = set(node.metadata.name for node in ret.items
+                    if node.metadata.name not in known_nodes and node_is_ready(node))
+    if len(new_nodes) >= count:
+        return True
+
+    resource_version = ret.metadata.resource_version
+    w = watch.Watch()
+    while time.time() - started < timeout:
+        try:
+            for event in w.stream(v1.list_node, resource_version=resource_version,
+                                  timeout_seconds=max(int(timeout - (time.time() - started)), 1),
+                                  **kwargs):
+                node = event['object']
+                resource_version = node.metadata.resource_version
+                name = node.metadata.name
+                if name in known_nodes:
+                    continue
+                if event['type'] != 'DELETED' and node_is_ready(node):
+                    new_nodes.add(name)
+                else:
+                    new_nodes.discard(name)
+                if len(new_nodes) >= count:
+                    w.stop()
+                    return True
+        except urllib3.exceptions.ReadTimeoutError:
+            pass
+    return False
+
+
+def terminate_instances_by_tag(tag_name: str = "not_set",
+                               count: int = 1,
+                               wait: bool = False,
+                               wait_for_replacement: bool = False,
+                               k8s_label_selector: str = None,
+                               timeout: int = 900,
+                               configuration: Configuration = None,
+                               secrets: Secrets = None):
+    """
+    Terminates up to `count` instances marked with specified tag in aws with a single terminate_instances
+    call. Instances are picked by describe_instances filtered by the tag and running state, its pages are
+    streamed and reading stops once `count` instances are found. Only the replacement wait needs the k8s API.
+    :param tag_name: tag to filter aws instances
+    :param count: amount of instances to terminate
+    :param wait: wait until instances are terminated, with the ec2 instance_terminated waiter
+    :param wait_for_replacement: wait until the same amount of new nodes joins k8s cluster and is Ready
+    :param k8s_label_selector: label selector of k8s nodes replacing the terminated ones
+    :param timeout: seconds to wait for each of the above
+    :param configuration: configuration: injected by chaostoolkit framework
+    :return: terminated instance ids, seconds until they were terminated and until replacement nodes were
+    Ready, None when not waited for
+    """
+    retval = {"instances": [], "time_to_terminated": None, "time_to_replacement_ready": None}
+
+    ec2_client = create_aws_client(secrets, 'ec2')
+    # pages are read only until count instances are found
+    page_size = min(max(count, MIN_DESCRIBE_PAGE_SIZE), DESCRIBE_PAGE_SIZE)
+    instances = iter_aws_instances(ec2_client, get_terminate_filters(tag_name, configuration, secrets),
+                                   page_size=page_size)
+    instance_ids = []
+    for instance in itertools.islice(instances, count):
+        logger.warning('Terminate instance {} {}'.format(
+            instance['InstanceId'], instance.get('PrivateDnsName')))
+        instance_ids.append(instance['InstanceId'])
+    if not instance_ids:
+        logger.info("No aws instances found with tag {}".format(tag_name))
+        return retval
+
+    v1 = None
+    known_nodes = None
+    if wait_for_replacement:
+        v1 = client.CoreV1Api(create_k8s_api_client(secrets))
+        known_nodes = set(node.metadata.name for node in v1.list_node().items)
+
+    started = time.time()
+    call_with_retries(ec2_client.terminate_instances, InstanceIds=instance_ids)
+    forget_instances(instance_ids, secrets)
+    retval["instances"] = instance_ids
+
+    if wait:
+        waiter = ec2_client.get_waiter('instance_terminated')
+        waiter.wait(InstanceIds=instance_ids,
+                    WaiterConfig={"Delay": TERMINATE_WAITER_DELAY,
+                                  "MaxAttempts": max(int(timeout / TERMINATE_WAITER_DELAY), 1)})
+        retval["time_to_terminated"] = time.time() - started
+
+    if wait_for_replacement:
+        if wait_for_replacement_nodes(v1, known_nodes, len(instance_ids), k8s_label_selector, timeout):
+            retval["time_to_replacement_ready"] = time.time() - started
+        else:
+            logger.warning("Replacement nodes for {} are not Ready after {}s".format(instance_ids, timeout))
+    return retval
+
+
+def render_iptables_block_batch(ports: list, protocols: list) -> str:
+    """
+    Render shell command adding DNAT rules for all combinations of ports and protocols with a single
+    iptables-restore call, so all of them are applied at once.
+    """
+    rule_format = "-I PREROUTING -p {} --dport {} -j DNAT --to-destination 0.0.0.0:1000"
+    lines = ["*nat"]
+    lines.extend(rule_format.format(protocol, port) for port in ports for protocol in protocols)
+    lines.append("COMMIT")
+    return "printf '%s\\n' {} | iptables-restore --noflush".format(
+        " ".join(shlex.quote(line) for line in lines))
+
+
+def get_tagged_running_instances(tag_name: str, configuration: Configuration = None,
+                                 secrets: Secrets = None) -> list:
+    """
+    Helper function.
+    Running instances marked with `tag_name` which have a private ip to connect to, as dictionaries with
+    "instance_id", "private_dns_name" and "private_ip". Only AWS is asked, so actions undoing a network
+    partition still work while the k8s API is unreachable.
+    """
+    ec2 = create_aws_client(secrets, 'ec2')
+    instances = []
+    for instance in iter_aws_instances(ec2, get_tagged_running_filters(tag_name, configuration),
+                                       page_size=DESCRIBE_PAGE_SIZE):
+        if instance.get('PrivateIpAddress'):
+            instances.append({"instance_id": instance['InstanceId'],
+                              "private_dns_name": instance.get('PrivateDnsName'),
+                              "private_ip": instance['PrivateIpAddress']})
+    return instances
+
+
 def iptables_block_port(tag_name: str = "under_chaos_test",
                         port: int = 0,
                         protocols: [] = None,
                         configuration: Configuration = None,
-                        secrets: Secrets = None):
+                        secrets: Secrets = None,
+                        max_workers: int = SSH_MAX_WORKERS,
+                        fail_on_error: bool = True):
     """
     Block specific port on aws instance. SSH key should be provided with SHH_KEY env variable. Full text of the key
 
     :param tag_name: tag to filter aws instances
-    :param port: port to block
+    :param port: port or list of ports to block
     :param configuration: injected by chaostoolkit framework
-    :param protocols: udp/tcp
-    :return: result of shh command on host
+    :param protocols: udp/tcp, single one or list, tcp when not set
+    :param max_workers: amount of hosts to run the command on at the same time
+    :param fail_on_error: fail the activity when any host was unreachable or the command failed on it
+    :return: results of ssh commands keyed by host, see `chaosk8s_wix.ssh.run_on_hosts`
     """
 
-    retval = None
-    ec2 = create_aws_resource(secrets, 'ec2')
-
-    filters_to_set = get_aws_filters_from_configuration(configuration)
-    filters_to_set.append({'Name': 'tag:' + tag_name, 'Values': [tag_name]})
-    response = ec2.instances.filter(Filters=filters_to_set)
-
-    api.env.key = os.getenv("SSH_KEY")
-    api.env.user = os.getenv("SSH_USER")
-    api.env.port = 22
-    text_format = "iptables -I PREROUTING  -t nat -p {} --dport {} -j DNAT --to-destination 0.0.0.0:1000"
-    for instance in response:
-        if instance.private_ip_address is not None:
-            for protocol in protocols:
-                command_text = text_format.format(protocol, port)
-
-                api.env.host_string = instance.private_ip_address
-                logger.warning("Run sudo {} \r\n on {}({})".format(command_text,
-                                                                   instance.private_dns_name,
-                                                                   instance.private_ip_address))
-                retval = api.sudo(command_text).return_code
-    return retval
+    ports = port if isinstance(port, (list, tuple)) else [port]
+    if protocols is None:
+        protocols = IPTABLES_DEFAULT_PROTOCOLS
+    elif isinstance(protocols, str):
+        protocols = [protocols]
+    if not ports or not protocols:
+        raise InvalidActivity("iptables_block_port needs at least one port and one protocol, "
+                              "got ports {} and protocols {}".format(ports, protocols))
+    command_text = render_iptables_block_batch(ports, protocols)
+    hosts = []
+    for instance in get_tagged_running_instances(tag_name, configuration, secrets):
+        logger.warning("Run sudo {} \r\n on {}({})".format(command_text,
+                                                           instance["private_dns_name"],
+                                                           instance["private_ip"]))
+        hosts.append(instance["private_ip"])
+    return run_on_hosts(hosts, command_text, sudo=True, max_workers=max_workers,
+                        fail_on_error=fail_on_error)
 
 
 def run_shell_command_on_tag(tag_name: str = "under_chaos_test",
                              command: str = "",
                              sudo: bool = False,
                              configuration: Configuration = None,
-                             secrets: Secrets = None):
+                             secrets: Secrets = None,
+                             max_workers: int = SSH_MAX_WORKERS,
+                             fail_on_error: bool = True):
     """
     Block specific port on aws instance. SSH key should be provided with SHH_KEY env variable. Full text of the key
 
@@ -291,30 +596,17 @@ def run_shell_command_on_tag(tag_name: str = "under_chaos_test",
     :param command: command to execute
     :param configuration: injected by chaostoolkit framework
     :param sudo: True to run command in as sudo, False otherwise
-    :return: result of ssh command on host
+    :param max_workers: amount of hosts to run the command on at the same time
+    :param fail_on_error: fail the activity when any host was unreachable or the command failed on it
+    :return: results of ssh command keyed by host, see `chaosk8s_wix.ssh.run_on_hosts`
     """
 
-    retval = None
-    ec2 = create_aws_resource(secrets, 'ec2')
-
-    filters_to_set = get_aws_filters_from_configuration(configuration)
-    filters_to_set.append({'Name': 'tag:' + tag_name, 'Values': [tag_name]})
-    response = ec2.instances.filter(Filters=filters_to_set)
-
-    api.env.key = os.getenv("SSH_KEY")
-    api.env.user = os.getenv("SSH_USER")
-    api.env.port = 22
-    for instance in response:
-        command_text = command
-        api.env.host_string = instance.private_ip_address
-        if sudo:
-            logger.warning("Run sudo {} \r\n on {}({})".format(command_text,
-                                                               instance.private_dns_name,
-                                                               instance.private_ip_address))
-            retval = api.sudo(command_text).return_code
-        else:
-            logger.warning("Run {} \r\n on {}({})".format(command_text,
-                                                          instance.private_dns_name,
-                                                          instance.private_ip_address))
-            retval = api.run(command_text).return_code
-    return retval
+    hosts = []
+    for instance in get_tagged_running_instances(tag_name, configuration, secrets):
+        logger.warning("Run {}{} \r\n on {}({})".format("sudo " if sudo else "",
+                                                        command,
+                                                        instance["private_dns_name"],
+                                                        instance["private_ip"]))
+        hosts.append(instance["private_ip"])
+    return run_on_hosts(hosts, command, sudo=sudo, max_workers=max_workers,
+                        fail_on_error=fail_on_error)
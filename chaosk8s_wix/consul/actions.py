@@ -1,46 +1,94 @@
+import threading
+import time
+from typing import Dict
 from chaoslib.types import Configuration
 import consul
 import requests
+from requests.adapters import HTTPAdapter
 from logzero import logger
+from chaosk8s_wix.parallel import run_in_parallel
 
 __all__ = ['damage_quorum']
 
+PLAY_DEAD_TIMEOUT = 5
+PLAY_DEAD_POOL_SIZE = 32
 
-def kill_instance(node, seconds_to_be_dead: int = 10):
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Session shared by play_dead requests, so connections to instances are reused between calls.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=PLAY_DEAD_POOL_SIZE, pool_maxsize=PLAY_DEAD_POOL_SIZE)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def kill_instance(node, seconds_to_be_dead: int = 10, timeout: float = PLAY_DEAD_TIMEOUT,
+                  session: requests.Session = None) -> int:
     address = node['ServiceAddress']
     port = node['ServicePort']
     # logger.warning("Make pod play dead {s} for {t} seconds".format(
     #    s=address, t=seconds_to_be_dead))
     url = "http://{a}:{p}/health/play_dead/{t}".format(
         a=address, p=port, t=seconds_to_be_dead)
-    r = requests.put(url)
+    r = (session or get_session()).put(url, timeout=timeout)
+    return r.status_code
 
 
 def damage_quorum(service_name: str,
                   dc: str,
                   num_of_instances_to_kill: int,
                   seconds_to_be_dead: int,
-                  configuration: Configuration):
+                  configuration: Configuration,
+                  timeout: float = PLAY_DEAD_TIMEOUT) -> Dict[str, Dict]:
     """
-    Works only for specific service that supports play dead command
+    Works only for specific service that supports play dead command. play_dead requests are sent to all
+    instances at the same time, so they go down together.
 
     :param service_name: service to kill
     :param dc: in wich dc to kill instances
     :param num_of_instances_to_kill: how much instances to kill
     :param seconds_to_be_dead: number of seconds to play dead
     :param configuration: chaostoolkit will inject this parameter
-    :return:
+    :param timeout: seconds to wait for each play_dead request
+    :return: results keyed by "address:port" of the instances, with "status" code of play_dead request or
+    "error" when it failed and its "duration"
     """
     consul_host = configuration.get('consul_host')
     consul_client = consul.Consul(host=consul_host)
     service_name = service_name.replace('.', '--')
+    retval = {}
     try:
         nodes = consul_client.catalog.service(service_name, dc=dc)[1]
         if nodes:
             if len(nodes) < num_of_instances_to_kill:
                 num_of_instances_to_kill = len(nodes)
-            for i in range(0, num_of_instances_to_kill):
-                kill_instance(nodes[i], seconds_to_be_dead)
+            session = get_session()
+
+            def kill(node):
+                result = {"status": None, "error": None, "duration": 0}
+                started = time.time()
+                try:
+                    result["status"] = kill_instance(node, seconds_to_be_dead, timeout, session)
+                except requests.RequestException as e:
+                    logger.warning("play_dead of {a}:{p} failed: {e}".format(
+                        a=node['ServiceAddress'], p=node['ServicePort'], e=e))
+                    result["error"] = str(e)
+                result["duration"] = time.time() - started
+                return result
+
+            targets = nodes[0:num_of_instances_to_kill]
+            results = run_in_parallel(kill, targets, max_workers=len(targets))
+            for node, result in zip(targets, results):
+                retval["{a}:{p}".format(a=node['ServiceAddress'], p=node['ServicePort'])] = result
     except (ValueError, IndexError) as e:
         logger.error(e)
         pass
+    return retval
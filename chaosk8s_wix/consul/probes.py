@@ -1,8 +1,12 @@
+import time
+from typing import Dict
 from chaoslib.types import Configuration
 import consul
 from logzero import logger
 
-__all__ = ["check_quorum", "get_good_nodes"]
+__all__ = ["check_quorum", "get_good_nodes", "wait_for_quorum"]
+
+QUORUM_WATCH_MAX_WAIT = 60
 
 
 def get_good_nodes(nodes: [] = []):
@@ -15,6 +19,15 @@ def get_good_nodes(nodes: [] = []):
     return retval
 
 
+def has_quorum(nodes: [] = []) -> bool:
+    """
+    More endpoints are passing serfHealth check than not
+    """
+    total_nodes = len(nodes)
+    total_good_nodes = len(get_good_nodes(nodes))
+    return (total_nodes - total_good_nodes) < total_good_nodes
+
+
 def check_quorum(dc: str, service_name: str, configuration: Configuration = None):
     """
     Check that service has more live endpoints than dead ones
@@ -29,14 +42,47 @@ def check_quorum(dc: str, service_name: str, configuration: Configuration = None
     try:
         nodes = consul_client.health.service(service_name, dc=dc)[1]
         if nodes:
-
-            total_nodes = len(nodes)
-            good_nodes = get_good_nodes(nodes)
-            total_good_nodes = len(good_nodes)
-            if (total_nodes - total_good_nodes) < total_good_nodes:
-                retval = True
+            retval = has_quorum(nodes)
     except (ValueError, IndexError) as e:
         logger.error(e)
         pass
 
     return retval
+
+
+def wait_for_quorum(dc: str, service_name: str, quorum: bool = False,
+                    timeout: int = 300, configuration: Configuration = None) -> Dict:
+    """
+    Wait until service quorum, as checked by check_quorum, becomes `quorum`. Health changes are followed with
+    Consul blocking queries, so the change is seen as soon as Consul knows about it.
+    :param service_name: service name to check
+    :param quorum: state to wait for, False for lost quorum, True for restored one
+    :param timeout: seconds to wait
+    :param configuration: injected by chaostoolkit
+    :return: "quorum" state at the end, "flipped_at" unix time of the change and "elapsed" seconds since the
+    call or None for both if the state did not change
+    """
+    consul_host = configuration.get('consul_host')
+    consul_client = consul.Consul(host=consul_host)
+    service_name = service_name.replace('.', '--')
+    started = time.time()
+    retval = {"quorum": None, "flipped_at": None, "elapsed": None}
+
+    index = None
+    while True:
+        remaining = timeout - (time.time() - started)
+        wait = "{}s".format(max(int(min(remaining, QUORUM_WATCH_MAX_WAIT)), 1))
+        new_index, nodes = consul_client.health.service(service_name, dc=dc, index=index, wait=wait)
+        now = time.time()
+        retval["quorum"] = bool(nodes) and has_quorum(nodes)
+        if retval["quorum"] == quorum:
+            if index is not None:
+                retval["flipped_at"] = now
+                retval["elapsed"] = now - started
+            return retval
+        if now - started >= timeout:
+            logger.warning("Quorum of {s} did not become {q} in {t}s".format(
+                s=service_name, q=quorum, t=timeout))
+            return retval
+        # Consul index may go backwards, e.g. after leader change, start over then
+        index = new_index if index is None or int(new_index) >= int(index) else 0
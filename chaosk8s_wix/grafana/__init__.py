@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from typing import Dict, Iterator, List
+from urllib.parse import urljoin
+
+import requests
+from chaoslib.types import Configuration, Secrets
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from chaosk8s_wix import get_kube_secret_from_production
+from chaosk8s_wix.grafana.stream import iter_render_series, RENDER_CHUNK_SIZE
+
+__all__ = ["GrafanaClient", "get_grafana_client", "get_grafana_token"]
+
+GRAFANA_TIMEOUT = 10
+GRAFANA_RETRIES = 3
+GRAFANA_POOL_SIZE = 16
+GRAFANA_TOKEN_TTL = 300
+
+_tokens = {}
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_grafana_token(secrets: Secrets = None) -> str:
+    """
+    Grafana API token stored in vault, or GRAFANA_TOKEN when vault has none.
+    The resolved token is cached for GRAFANA_TOKEN_TTL seconds whichever
+    source it came from, so vault is not asked again on every call.
+    """
+    secrets = secrets or {}
+    env = os.environ
+
+    def lookup(k: str, d: str = None) -> str:
+        return secrets.get(k, env.get(k, d))
+
+    prod_vault_url = lookup("NASA_SECRETS_URL", "undefined")
+    target_url = os.path.join(prod_vault_url, 'grafana')
+    token = lookup("NASA_TOKEN", "undefined")
+    fallback_token = lookup("GRAFANA_TOKEN", "")
+    key = (target_url, token, fallback_token)
+    with _lock:
+        cached = _tokens.get(key)
+    if cached is not None and time.time() - cached[1] <= GRAFANA_TOKEN_TTL:
+        return cached[0]
+
+    grafana_creds = get_kube_secret_from_production(target_url, token)
+    if grafana_creds is not None:
+        grafana_token = grafana_creds["token"]
+    else:
+        grafana_token = fallback_token
+    with _lock:
+        _tokens[key] = (grafana_token, time.time())
+
+    return grafana_token
+
+
+class GrafanaClient(object):
+    """
+    Grafana HTTP API client. Requests go through one pooled session, so
+    concurrent checks reuse connections, failed GET requests are retried on
+    connection errors and 502/503/504 answers.
+    """
+
+    def __init__(self, host: str, token: str,
+                 timeout: float = GRAFANA_TIMEOUT,
+                 retries: int = GRAFANA_RETRIES,
+                 pool_size: int = GRAFANA_POOL_SIZE):
+        self.host = host
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = "Bearer %s" % token
+        retry = Retry(total=retries, backoff_factor=0.3,
+                      status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, path: str, params: Dict = None, headers: Dict = None,
+            stream: bool = False) -> requests.Response:
+        return self.session.get(urljoin(self.host, path), params=params,
+                                headers=headers, timeout=self.timeout,
+                                stream=stream)
+
+    def get_alerts(self, dashboard_id: int,
+                   state: str = "alerting") -> List[Dict]:
+        parameters = {"dashboardId": dashboard_id, "state": state}
+        return self.get("/api/alerts", params=parameters).json()
+
+    def render(self, targets, time_from: str, datasource_id: int = 1,
+               stream: bool = False) -> requests.Response:
+        parameters = {
+            "target": targets,
+            "format": "json",
+            "from": time_from
+        }
+        return self.get(
+            "api/datasources/proxy/{}/render".format(datasource_id),
+            params=parameters,
+            headers={"Content-Type": 'application/json'},
+            stream=stream)
+
+    def render_series(self, targets, time_from: str,
+                      datasource_id: int = 1) -> Iterator[Dict]:
+        """
+        Render targets and yield the series parsed while the response body
+        is being read, see `chaosk8s_wix.grafana.stream.iter_render_series`.
+        """
+        with self.render(targets, time_from, datasource_id,
+                         stream=True) as resp:
+            resp.raise_for_status()
+            for series in iter_render_series(
+                    resp.iter_content(RENDER_CHUNK_SIZE)):
+                yield series
+
+
+def get_grafana_client(configuration: Configuration = None,
+                       secrets: Secrets = None) -> GrafanaClient:
+    """
+    Client for the "grafana_host" of the configuration, shared by all calls
+    using the same host and token. Timeout and retries can be set with
+    "grafana-timeout" and "grafana-retries" configuration keys.
+    """
+    configuration = configuration or {}
+    host = configuration.get('grafana_host')
+    timeout = float(configuration.get("grafana-timeout", GRAFANA_TIMEOUT))
+    retries = int(configuration.get("grafana-retries", GRAFANA_RETRIES))
+    token = get_grafana_token(secrets)
+
+    key = (host, token, timeout, retries)
+    with _lock:
+        grafana = _clients.get(key)
+        if grafana is None:
+            grafana = GrafanaClient(host, token, timeout, retries)
+            _clients[key] = grafana
+    return grafana
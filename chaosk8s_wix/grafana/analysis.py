@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Steady state checks over Graphite datapoints.
+
+Datapoints, `[value, timestamp]` pairs with `None` for missing values, are
+converted to arrays once and all checks are evaluated on them. NumPy is an
+optional dependency (`pip install chaostoolkit-k8s-wix[numpy]`), without it
+the same checks run on plain lists, which is fine for short windows.
+"""
+import math
+import statistics
+from typing import Dict, List
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ["datapoints_to_arrays", "find_spikes", "find_spikes_in_arrays"]
+
+
+def datapoints_to_arrays(datapoints: List) -> (List, List):
+    """
+    Split datapoints to values and timestamps. Missing values become NaN.
+    """
+    if np is not None:
+        if len(datapoints) == 0:
+            return np.empty(0), np.empty(0)
+        arr = np.array(datapoints, dtype=float)
+        return arr[:, 0], arr[:, 1]
+    values = [float('nan') if dp[0] is None else float(dp[0])
+              for dp in datapoints]
+    return values, [float(dp[1]) for dp in datapoints]
+
+
+def find_spikes(datapoints, allowed_results: List = None,
+                **thresholds) -> Dict[str, int]:
+    """
+    Evaluate checks of `find_spikes_in_arrays` on Graphite datapoints.
+    """
+    values, timestamps = datapoints_to_arrays(datapoints)
+    return find_spikes_in_arrays(values, timestamps, allowed_results,
+                                 **thresholds)
+
+
+def find_spikes_in_arrays(values, timestamps, allowed_results: List = None,
+                          min_value: float = None, max_value: float = None,
+                          percentile: float = None,
+                          max_percentile_value: float = None,
+                          moving_median_window: int = None,
+                          max_moving_median: float = None,
+                          max_rate_of_change: float = None,
+                          max_null_gap: int = None) -> Dict[str, int]:
+    """
+    Evaluate the checks which have their parameters set:
+
+    * allowed_results: values outside of the whitelist, missing values
+      unless the whitelist holds None
+    * min_value/max_value: values below or above the limits
+    * percentile/max_percentile_value: 1 if the percentile of values is
+      above the limit
+    * moving_median_window/max_moving_median: windows whose median is
+      above the limit
+    * max_rate_of_change: changes between consecutive values faster than
+      the limit, per second
+    * max_null_gap: 1 if more consecutive values than the limit are missing
+
+    :param values: metric values, NaN for missing ones
+    :param timestamps: timestamps of the values
+    :return: amount of violations keyed by check name, empty if there are
+    none
+    """
+    if np is not None:
+        checks = _find_spikes_numpy
+        values = np.asarray(values, dtype=float)
+        timestamps = np.asarray(timestamps, dtype=float)
+    else:
+        checks = _find_spikes_python
+    violations = checks(values, timestamps, allowed_results, min_value,
+                        max_value, percentile, max_percentile_value,
+                        moving_median_window, max_moving_median,
+                        max_rate_of_change, max_null_gap)
+    return {name: int(count) for name, count in violations.items() if count}
+
+
+def _find_spikes_numpy(values, timestamps, allowed_results, min_value,
+                       max_value, percentile, max_percentile_value,
+                       moving_median_window, max_moving_median,
+                       max_rate_of_change, max_null_gap) -> Dict:
+    violations = {}
+    missing = np.isnan(values)
+    present = values[~missing]
+    if allowed_results is not None:
+        allowed = [r for r in allowed_results if r is not None]
+        bad = ~np.isin(values, allowed)
+        if None in allowed_results:
+            bad &= ~missing
+        violations["allowed_results"] = np.count_nonzero(bad)
+    if min_value is not None:
+        violations["min_value"] = np.count_nonzero(present < min_value)
+    if max_value is not None:
+        violations["max_value"] = np.count_nonzero(present > max_value)
+    if percentile is not None and max_percentile_value is not None and \
+            present.size:
+        violations["percentile"] = int(
+            np.percentile(present, percentile) > max_percentile_value)
+    if moving_median_window and max_moving_median is not None and \
+            present.size >= moving_median_window:
+        windows = np.lib.stride_tricks.sliding_window_view(
+            present, moving_median_window)
+        violations["moving_median"] = np.count_nonzero(
+            np.median(windows, axis=1) > max_moving_median)
+    if max_rate_of_change is not None and present.size > 1:
+        times = timestamps[~missing]
+        elapsed = np.diff(times)
+        elapsed[elapsed <= 0] = 1
+        rates = np.abs(np.diff(present)) / elapsed
+        violations["rate_of_change"] = np.count_nonzero(
+            rates > max_rate_of_change)
+    if max_null_gap is not None and missing.any():
+        # lengths of runs of missing values from the edges of the runs
+        edges = np.diff(np.concatenate(([0], missing.astype(np.int8), [0])))
+        gaps = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+        violations["null_gap"] = int(gaps.max() > max_null_gap)
+    return violations
+
+
+def _percentile(values: List, q: float) -> float:
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (
+        position - lower)
+
+
+def _find_spikes_python(values, timestamps, allowed_results, min_value,
+                        max_value, percentile, max_percentile_value,
+                        moving_median_window, max_moving_median,
+                        max_rate_of_change, max_null_gap) -> Dict:
+    violations = {}
+    present = [(v, t) for v, t in zip(values, timestamps) if not math.isnan(v)]
+    present_values = [v for v, _ in present]
+    if allowed_results is not None:
+        violations["allowed_results"] = len(
+            [v for v in values
+             if (None not in allowed_results if math.isnan(v)
+                 else v not in allowed_results)])
+    if min_value is not None:
+        violations["min_value"] = len(
+            [v for v in present_values if v < min_value])
+    if max_value is not None:
+        violations["max_value"] = len(
+            [v for v in present_values if v > max_value])
+    if percentile is not None and max_percentile_value is not None and \
+            present_values:
+        violations["percentile"] = int(
+            _percentile(present_values, percentile) > max_percentile_value)
+    if moving_median_window and max_moving_median is not None:
+        violations["moving_median"] = len(
+            [i for i in range(len(present_values) - moving_median_window + 1)
+             if statistics.median(
+                present_values[i:i + moving_median_window]) >
+             max_moving_median])
+    if max_rate_of_change is not None:
+        count = 0
+        for (v1, t1), (v2, t2) in zip(present, present[1:]):
+            elapsed = t2 - t1 if t2 > t1 else 1
+            if abs(v2 - v1) / elapsed > max_rate_of_change:
+                count += 1
+        violations["rate_of_change"] = count
+    if max_null_gap is not None:
+        longest = gap = 0
+        for v in values:
+            gap = gap + 1 if math.isnan(v) else 0
+            longest = max(longest, gap)
+        violations["null_gap"] = int(longest > max_null_gap)
+    return violations
@@ -1,38 +1,24 @@
 # -*- coding: utf-8 -*-
-import requests
-from urllib.parse import urljoin
+from typing import Dict, List
 from chaoslib.types import Secrets, Configuration
 from logzero import logger
-import os
-import json
+from urllib.parse import urlencode
 from chaosk8s_wix.slack.logger_handler import SlackHanlder
-from chaosk8s_wix import get_kube_secret_from_production
+from chaosk8s_wix.grafana import get_grafana_client, get_grafana_token
+from chaosk8s_wix.grafana.analysis import find_spikes, find_spikes_in_arrays
+from chaosk8s_wix.parallel import run_in_parallel, DEFAULT_MAX_WORKERS
 
-__all__ = ["check_no_alert_for_dashboard", "check_service_uppness"]
+__all__ = ["check_no_alert_for_dashboard", "check_service_uppness",
+           "check_no_alert_for_dashboards", "check_services_uppness",
+           "get_services_uppness"]
+
+# keeps render URLs below the common 8k request line limit of web servers
+RENDER_MAX_QUERY_LENGTH = 6000
 
 slack_handler = SlackHanlder()
 slack_handler.attach(logger)
 
 
-def get_grafana_token(secrets):
-    secrets = secrets or {}
-    env = os.environ
-
-    def lookup(k: str, d: str = None) -> str:
-        return secrets.get(k, env.get(k, d))
-
-    prod_vault_url = lookup("NASA_SECRETS_URL", "undefined")
-    target_url = os.path.join(prod_vault_url, 'grafana')
-    token = lookup("NASA_TOKEN", "undefined")
-    grafana_creds = get_kube_secret_from_production(target_url, token)
-    if grafana_creds is not None:
-        grafana_token = grafana_creds["token"]
-    else:
-        grafana_token = lookup("GRAFANA_TOKEN",  "")
-
-    return grafana_token
-
-
 def check_no_alert_for_dashboard(
         dashboard_id: int,
         configuration: Configuration = None,
@@ -44,19 +30,8 @@ def check_no_alert_for_dashboard(
     :return: true if no alerts exist for specified dashboard, false otherwise
     """
 
-    grafana_host = configuration.get('grafana_host')
-
-    secrets = secrets or {}
-
-    grafana_token = get_grafana_token(secrets)
-
-    headers = {"Authorization": "Bearer %s" % grafana_token}
-
-    parameters = {"dashboardId": dashboard_id, "state": "alerting"}
-
-    endpoint = urljoin(grafana_host, "/api/alerts")
-
-    alerts = requests.get(endpoint, headers=headers, params=parameters).json()
+    grafana = get_grafana_client(configuration, secrets)
+    alerts = grafana.get_alerts(dashboard_id)
     retval = len(alerts) == 0
 
     for alert in alerts:
@@ -67,6 +42,27 @@ def check_no_alert_for_dashboard(
     return retval
 
 
+def check_no_alert_for_dashboards(
+        dashboard_ids: List[int],
+        configuration: Configuration = None,
+        secrets: Secrets = None,
+        max_workers: int = DEFAULT_MAX_WORKERS) -> bool:
+    """
+    Check alerts for several dashboards in grafana concurrently
+    :param dashboard_ids: dashboard ids in grafana
+    :return: true if no alerts exist for any of specified dashboards, false otherwise
+    """
+    # look the token up and create the shared client once, before workers use it
+    get_grafana_client(configuration, secrets)
+    results = run_in_parallel(
+        lambda dashboard_id: check_no_alert_for_dashboard(dashboard_id, configuration, secrets),
+        dashboard_ids, max_workers)
+    for dashboard_id, result in zip(dashboard_ids, results):
+        if not result:
+            logger.debug("Dashboard {d} has alerts".format(d=dashboard_id))
+    return all(results)
+
+
 def metrics_have_spikes(metrics: [], allowed_results: []) -> bool:
     '''
     Checks that metrics list has only allowed values in results field of metric
@@ -74,52 +70,125 @@ def metrics_have_spikes(metrics: [], allowed_results: []) -> bool:
     :param allowed_results: list of good values for metrics
     :return: true if there are results that are not allowed, true otherwise
     '''
-    bad_metrics = [metric for metric in metrics if metric[0]
-                   not in allowed_results]
-    retval = len(bad_metrics) > 0
-
-    return retval
+    return len(find_spikes(metrics, allowed_results=allowed_results)) > 0
 
 
 def check_service_uppness(service: str,
                           allowed_results: [],
                           time_interval_seconds: int = 300,
                           configuration: Configuration = None,
-                          secrets: Secrets = None) -> bool:
+                          secrets: Secrets = None,
+                          thresholds: Dict = None) -> bool:
     """
        Check alert for dashboard in grafana
        :param panel_id: panel id in grafana
        :param dashboard_id: dashboard id in grafana
        :param alowed_results: whitelist of values that can be in dashboard metrics results
+       :param thresholds: further checks of metrics, keyword arguments of
+       `chaosk8s_wix.grafana.analysis.find_spikes` e.g. {"max_null_gap": 3}
        :return: true if no alerts exist for specified dashboard, false otherwise
        """
 
-    grafana_host = configuration.get('grafana_host')
+    grafana = get_grafana_client(configuration, secrets)
+
+    query = get_service_uppness_target(service)
+    time_interval_string = "-{sec}seconds".format(sec=time_interval_seconds)
+    series = next(grafana.render_series(query, time_interval_string), None)
+    if series is None:
+        logger.debug("No metrics for service {s}".format(s=service))
+        return False
+    violations = find_spikes_in_arrays(series['values'], series['timestamps'], allowed_results=allowed_results,
+                                       **(thresholds or {}))
+    if violations:
+        logger.debug("Service {s} metrics violations: {v}".format(s=service, v=violations))
+    have_spikes = len(violations) > 0
 
-    secrets = secrets or {}
+    return not have_spikes
 
-    grafana_token = get_grafana_token(secrets)
 
-    headers = {"Content-Type": 'application/json',
-               "Authorization": "Bearer %s" % grafana_token}
+def get_service_uppness_target(service: str) -> str:
     # tmpl = 'minSeries(root_is_sensu.type_is_app-router.dispatcher_is_*.dc_is_*.app_is_{s}.metric_is_response)'
     tmpl = 'movingMedian(minSeries' \
            '(root_is_sensu.type_is_app-router.dispatcher_is_*.dc_is_*.app_is_{s}.metric_is_response), \'1min\')'
+    return tmpl.format(s=service)
 
-    query = tmpl.format(
-        s=service)
+
+def split_targets_by_url_length(targets: List[str], max_length: int = RENDER_MAX_QUERY_LENGTH) -> List[List[str]]:
+    """
+    Split render targets into groups whose encoded `target=` query parameters fit into `max_length` characters.
+    """
+    chunks = []
+    chunk = []
+    length = 0
+    for target in targets:
+        target_length = len(urlencode({"target": target})) + 1
+        if chunk and length + target_length > max_length:
+            chunks.append(chunk)
+            chunk = []
+            length = 0
+        chunk.append(target)
+        length += target_length
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def get_services_uppness(services: List[str],
+                         allowed_results: [],
+                         time_interval_seconds: int = 300,
+                         configuration: Configuration = None,
+                         secrets: Secrets = None,
+                         thresholds: Dict = None,
+                         max_workers: int = DEFAULT_MAX_WORKERS) -> Dict[str, bool]:
+    """
+    Check uppness of several services with one render request carrying all of their targets, split into
+    several requests only when the query would get too long for an URL. Series are aliased with service names.
+    :param services: names of services to check
+    :param allowed_results: whitelist of values that can be in dashboard metrics results
+    :param thresholds: further checks of metrics, see check_service_uppness
+    :return: true for every service with no spikes, false for ones with spikes or without metrics
+    """
+    grafana = get_grafana_client(configuration, secrets)
     time_interval_string = "-{sec}seconds".format(sec=time_interval_seconds)
-    parameters = {
-        "target": query,
-        "format": "json",
-                  "from": time_interval_string
-    }
-    endpoint = urljoin(grafana_host, "api/datasources/proxy/1/render")
-
-    resp = requests.get(endpoint, headers=headers, params=parameters)
-    if resp.text != '':
-        data = json.loads(resp.text)
-        metrics = data[0]['datapoints']
-        have_spikes = metrics_have_spikes(metrics, allowed_results)
+    targets = ["alias({t}, '{s}')".format(t=get_service_uppness_target(service), s=service)
+               for service in services]
+
+    def render(chunk):
+        # series are checked as they are parsed, so only one of them is held in memory at a time
+        results = []
+        for series in grafana.render_series(chunk, time_interval_string):
+            violations = find_spikes_in_arrays(series['values'], series['timestamps'],
+                                               allowed_results=allowed_results, **(thresholds or {}))
+            if violations:
+                logger.debug("Service {s} metrics violations: {v}".format(s=series['target'], v=violations))
+            results.append((series['target'], len(violations) == 0))
+        return results
+
+    retval = dict.fromkeys(services, False)
+    chunks = split_targets_by_url_length(targets, RENDER_MAX_QUERY_LENGTH)
+    for results in run_in_parallel(render, chunks, max_workers):
+        for service, result in results:
+            if service in retval:
+                retval[service] = result
+    return retval
 
-    return not have_spikes
+
+def check_services_uppness(services: List[str],
+                           allowed_results: [],
+                           time_interval_seconds: int = 300,
+                           configuration: Configuration = None,
+                           secrets: Secrets = None,
+                           max_workers: int = DEFAULT_MAX_WORKERS,
+                           thresholds: Dict = None) -> bool:
+    """
+    Check uppness of several services, see get_services_uppness
+    :param services: names of services to check
+    :param allowed_results: whitelist of values that can be in dashboard metrics results
+    :return: true if none of the services has spikes, false otherwise
+    """
+    results = get_services_uppness(services, allowed_results, time_interval_seconds, configuration, secrets,
+                                   thresholds, max_workers)
+    for service, result in results.items():
+        if not result:
+            logger.debug("Service {s} has spikes".format(s=service))
+    return all(results.values())
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental parser of Graphite render responses.
+
+The response body, `[{"target": ..., "datapoints": [[value, ts], ...]}, ...]`,
+is read chunk by chunk. Each `datapoints` array is cut out of the buffer
+once it is complete and converted in bulk into compact float arrays (missing
+values become NaN) instead of nested Python lists, other fields of a series
+are decoded with the standard json decoder. Peak memory is bounded by the
+largest series rather than by the whole body, and the bulk conversion is
+faster than `json.loads` of the same data.
+"""
+import codecs
+import json
+import re
+from array import array
+from typing import Dict, Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ["iter_render_series"]
+
+RENDER_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"\s*")
+_DATAPOINTS_END = re.compile(r"\]\s*\]")
+_BRACKETS = str.maketrans("[]", "  ")
+
+
+class _Reader(object):
+    def __init__(self, chunks: Iterable):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self) -> bool:
+        """
+        Append next chunk to the buffer, dropping the consumed part.
+        """
+        while not self.eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self._decoder.decode(b"", final=True)
+            elif isinstance(chunk, bytes):
+                text = self._decoder.decode(chunk)
+            else:
+                text = chunk
+            if text:
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self) -> str:
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError("Expected '{}' at position {} of render "
+                             "response".format(char, self.pos))
+        self.pos += 1
+
+    def read_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer may continue in the
+                # next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.more()
+
+    def read_datapoints(self) -> (array, array):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return array("d"), array("d")
+        start = self.pos
+        scanned = start
+        while True:
+            match = _DATAPOINTS_END.search(self.buf, scanned)
+            if match is not None:
+                break
+            # the closing brackets may be split between chunks
+            last = self.buf.rfind("]", start)
+            if last >= 0 and not self.buf[last + 1:].strip():
+                scanned = last
+            else:
+                scanned = len(self.buf)
+            offset = scanned - start
+            if not self.more():
+                raise ValueError("Unterminated datapoints at position {} of "
+                                 "render response".format(start))
+            start = self.pos
+            scanned = start + offset
+        text = self.buf[start:match.start() + 1]
+        self.pos = match.end()
+        try:
+            flat = array("d", map(float, text.translate(_BRACKETS).replace(
+                "null", "nan").split(",")))
+        except ValueError:
+            flat = None
+        if flat is None or len(flat) % 2:
+            raise ValueError("Malformed datapoints at position {} of render "
+                             "response".format(start))
+        return flat[0::2], flat[1::2]
+
+
+def iter_render_series(chunks: Iterable) -> Iterator[Dict]:
+    """
+    Yield series of Graphite render response one by one.
+
+    :param chunks: response body as iterable of bytes or str chunks, e.g.
+    `response.iter_content(RENDER_CHUNK_SIZE)`
+    :return: series dictionaries, with "values" and "timestamps" arrays
+    (numpy arrays when numpy is installed) in place of "datapoints"
+    """
+    reader = _Reader(chunks)
+    if reader.peek() == "":
+        return
+    reader.expect("[")
+    while True:
+        char = reader.peek()
+        if char == "]":
+            return
+        if char == ",":
+            reader.pos += 1
+            continue
+        reader.expect("{")
+        series = {}
+        while True:
+            char = reader.peek()
+            if char == "}":
+                reader.pos += 1
+                break
+            if char == ",":
+                reader.pos += 1
+                continue
+            key = reader.read_value()
+            reader.expect(":")
+            if key == "datapoints":
+                values, timestamps = reader.read_datapoints()
+                if np is not None:
+                    values = np.frombuffer(values, dtype=float)
+                    timestamps = np.frombuffer(timestamps, dtype=float)
+                series["values"] = values
+                series["timestamps"] = timestamps
+            else:
+                series[key] = reader.read_value()
+        yield series
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+from typing import Callable, Dict, List
+
+from chaoslib.types import Secrets
+from logzero import logger
+
+from chaosk8s_wix import get_cluster_key, list_all_pages
+
+__all__ = ["get_eligible_namespaces", "choose_random_namespace",
+           "invalidate_namespace_inventory", "parse_flag", "NS_INVENTORY_TTL"]
+
+NS_INVENTORY_TTL = 60
+
+_inventories = {}
+_inventories_lock = threading.Lock()
+
+FALSE_FLAGS = ("", "0", "false", "no", "off")
+
+
+def parse_flag(value) -> bool:
+    """
+    Interpret configuration flag which may come as a string, e.g. from an
+    environment variable, where "false", "no", "off" and "0" mean False.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() not in FALSE_FLAGS
+    return bool(value)
+
+
+def get_namespace_inventory(v1_factory: Callable, secrets: Secrets = None,
+                            ttl: int = NS_INVENTORY_TTL) -> Dict:
+    """
+    Return namespaces inventory of the cluster the secrets point to. The
+    namespaces are listed only when there is no inventory yet or it is older
+    than `ttl` seconds.
+
+    :param v1_factory: callable returning CoreV1Api, only called when the
+    inventory has to be (re)loaded
+    :param secrets: k8s credentials
+    :param ttl: seconds the inventory is valid for
+    :return: dictionary with "namespaces" list, "eligible" lists keyed by
+    ignore list and "pod_counts" per namespace name, loaded on demand
+    """
+    ttl = float(ttl)
+    key = get_cluster_key(secrets)
+    with _inventories_lock:
+        inventory = _inventories.get(key)
+        if inventory is None or time.time() - inventory["loaded"] > ttl:
+            v1 = v1_factory()
+            ret = v1.list_namespace()
+            inventory = {
+                "loaded": time.time(),
+                "v1": v1,
+                "namespaces": ret.items,
+                "eligible": {},
+                "pod_counts": None
+            }
+            _inventories[key] = inventory
+            logger.debug("Loaded {} namespaces to inventory".format(
+                len(ret.items)))
+    return inventory
+
+
+def get_eligible_namespaces(v1_factory: Callable, ns_ignore_list=None,
+                            secrets: Secrets = None,
+                            ttl: int = NS_INVENTORY_TTL) -> List:
+    """
+    Namespaces of the cluster except the ones named in `ns_ignore_list`.
+    Lists are computed once per ignore list and inventory.
+    """
+    inventory = get_namespace_inventory(v1_factory, secrets, ttl)
+    ignored = frozenset(ns_ignore_list or [])
+    eligible = inventory["eligible"].get(ignored)
+    if eligible is None:
+        eligible = [ns for ns in inventory["namespaces"]
+                    if ns.metadata.name not in ignored]
+        inventory["eligible"][ignored] = eligible
+    return eligible
+
+
+def get_pod_counts(inventory: Dict, page_size: int = 500) -> Dict[str, int]:
+    """
+    Amount of pods per namespace name, listed once per inventory.
+    """
+    if inventory["pod_counts"] is None:
+        counts = {}
+        pods = list_all_pages(inventory["v1"].list_pod_for_all_namespaces,
+                              page_size=page_size, watch=False)
+        for pod in pods:
+            ns = pod.metadata.namespace
+            counts[ns] = counts.get(ns, 0) + 1
+        inventory["pod_counts"] = counts
+    return inventory["pod_counts"]
+
+
+def choose_random_namespace(v1_factory: Callable, ns_ignore_list=None,
+                            secrets: Secrets = None,
+                            ttl: int = NS_INVENTORY_TTL,
+                            weighted: bool = False):
+    """
+    Pick random namespace out of the eligible ones. With `weighted` set,
+    namespaces are picked proportionally to the amount of pods they run.
+    Returns None when there are no eligible namespaces.
+    """
+    eligible = get_eligible_namespaces(v1_factory, ns_ignore_list, secrets,
+                                       ttl)
+    if not eligible:
+        return None
+    if parse_flag(weighted):
+        inventory = get_namespace_inventory(v1_factory, secrets, ttl)
+        counts = get_pod_counts(inventory)
+        weights = [counts.get(ns.metadata.name, 0) for ns in eligible]
+        if sum(weights) > 0:
+            return random.choices(eligible, weights=weights)[0]
+    return random.choice(eligible)
+
+
+def invalidate_namespace_inventory(secrets: Secrets = None):
+    """
+    Drop inventory of the cluster the secrets point to, next lookup lists
+    namespaces again.
+    """
+    with _inventories_lock:
+        _inventories.pop(get_cluster_key(secrets), None)
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
+import re
 from kubernetes import client
 from chaosk8s_wix import create_k8s_api_client
 from chaoslib.types import Secrets
 from logzero import logger
 from chaosk8s_wix.slack.logger_handler import SlackHanlder
 __all__ = ["get_active_nodes", "node_should_be_ignored_by_taints",
-           "is_equal_V1Taint", "load_taint_list_from_dict"]
+           "is_equal_V1Taint", "load_taint_list_from_dict",
+           "labels_match_selector"]
+
+_SET_REQUIREMENT = re.compile(r"^([\w./-]+)\s+(in|notin)\s*\((.*)\)$")
+_EQUALITY_REQUIREMENT = re.compile(r"^([\w./-]+)\s*(==|=|!=)\s*([\w./-]*)$")
+_EXISTS_REQUIREMENT = re.compile(r"^(!?)\s*([\w./-]+)$")
 
 slack_handler = SlackHanlder()
 slack_handler.attach(logger)
@@ -59,6 +65,71 @@ def node_should_be_ignored_by_taints(node_taints, taint_ignore_list) -> bool:
     return retval
 
 
+def split_label_selector(label_selector: str) -> list:
+    """
+    Split label selector to its requirements. Commas inside of set based
+    requirements, like `env in (prod, qa)`, are not treated as separators.
+    """
+    requirements = []
+    depth = 0
+    current = ""
+    for char in label_selector or "":
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            requirements.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        requirements.append(current.strip())
+    return [r for r in requirements if r]
+
+
+def labels_match_selector(labels, label_selector: str) -> bool:
+    """
+    Evaluate kubernetes label selector against dictionary of labels locally,
+    so objects fetched once can be filtered by several selectors.
+    Supports `key`, `!key`, `key=value`, `key==value`, `key!=value`,
+    `key in (v1,v2)` and `key notin (v1,v2)` requirements.
+    Raises ValueError if selector can not be parsed.
+    """
+    labels = labels or {}
+    for requirement in split_label_selector(label_selector):
+        match = _SET_REQUIREMENT.match(requirement)
+        if match is not None:
+            key, operator, values = match.groups()
+            values = set(v.strip() for v in values.split(","))
+            if operator == "in" and labels.get(key) not in values:
+                return False
+            if operator == "notin" and key in labels and labels[key] in values:
+                return False
+            continue
+
+        match = _EQUALITY_REQUIREMENT.match(requirement)
+        if match is not None:
+            key, operator, value = match.groups()
+            if operator == "!=":
+                if labels.get(key) == value:
+                    return False
+            elif labels.get(key) != value:
+                return False
+            continue
+
+        match = _EXISTS_REQUIREMENT.match(requirement)
+        if match is not None:
+            negate, key = match.groups()
+            if bool(negate) == (key in labels):
+                return False
+            continue
+
+        raise ValueError(
+            "Unable to parse label selector '{}'".format(label_selector))
+    return True
+
+
 def get_active_nodes(label_selector: str = None, taints_ignore_list=None,
                      secrets: Secrets = None):
     """
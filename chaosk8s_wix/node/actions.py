@@ -13,7 +13,7 @@ from kubernetes.client.rest import ApiException
 from logzero import logger
 from random import randint
 from . import get_active_nodes, load_taint_list_from_dict, is_equal_V1Taint
-from chaosk8s_wix import create_k8s_api_client
+from chaosk8s_wix import create_k8s_api_client, aio
 from chaosk8s_wix.slack.logger_handler import SlackHanlder
 
 
@@ -112,13 +112,32 @@ def create_node(meta: Dict[str, Any] = None, spec: Dict[str, Any] = None,
     return res
 
 
+def patch_nodes(v1, nodes, body, action: str):
+    """
+    Helper function.
+    Apply the same patch to all nodes concurrently. Raises
+    :exc:`chaoslib.exceptions.FailedActivity` naming the first node which
+    could not be patched.
+    """
+    async def patch(name):
+        try:
+            await aio.async_patch_node(v1, name, body)
+        except ApiException as x:
+            logger.debug("Patching node '{}' to {} failed: {}".format(
+                name, action, x.body))
+            raise FailedActivity("Failed to {} node '{}': {}".format(
+                action, name, x.body))
+
+    aio.run(aio.gather_limited([patch(n.metadata.name) for n in nodes]))
+
+
 def cordon_node(name: str = None, label_selector: str = None,
                 secrets: Secrets = None):
     """
     Cordon nodes matching the given label or name, so that no pods
     are scheduled on them any longer.
     """
-    api = create_k8s_api_client(secrets)
+    api = aio.get_shared_api_client(secrets)
 
     v1 = client.CoreV1Api(api)
     if name:
@@ -142,14 +161,7 @@ def cordon_node(name: str = None, label_selector: str = None,
         }
     }
 
-    for n in nodes:
-        try:
-            v1.patch_node(n.metadata.name, body)
-        except ApiException as x:
-            logger.debug("Unscheduling node '{}' failed: {}".format(
-                n.metadata.name, x.body))
-            raise FailedActivity("Failed to unschedule node '{}': {}".format(
-                n.metadata.name, x.body))
+    patch_nodes(v1, nodes, body, "unschedule")
 
 
 def uncordon_node(name: str = None, label_selector: str = None,
@@ -158,7 +170,7 @@ def uncordon_node(name: str = None, label_selector: str = None,
     Uncordon nodes matching the given label name, so that pods can be
     scheduled on them again.
     """
-    api = create_k8s_api_client(secrets)
+    api = aio.get_shared_api_client(secrets)
 
     v1 = client.CoreV1Api(api)
     if name:
@@ -185,14 +197,7 @@ def uncordon_node(name: str = None, label_selector: str = None,
         }
     }
 
-    for n in nodes:
-        try:
-            v1.patch_node(n.metadata.name, body)
-        except ApiException as x:
-            logger.debug("Scheduling node '{}' failed: {}".format(
-                n.metadata.name, x.body))
-            raise FailedActivity("Failed to schedule node '{}': {}".format(
-                n.metadata.name, x.body))
+    patch_nodes(v1, nodes, body, "schedule")
 
 
 def drain_nodes(name: str = None, label_selector: str = None,
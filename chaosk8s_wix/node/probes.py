@@ -73,31 +73,41 @@ def all_nodes_are_ok(label_selector: str = None,
     resp, k8s_api_v1 = get_active_nodes(label_selector, ignore_list, secrets)
 
     for item in resp.items:
-        localresult = True
-        for condition in item.status.conditions:
-            if condition.type == "Ready" and condition.status == "False":
-                logger.debug("{p} Ready=False  ".format(
-                    p=item.metadata.name))
-                localresult = False
-        if item.spec.unschedulable:
-            logger.debug("{p} unschedulable ' ".format(
-                p=item.metadata.name))
-            localresult = False
-
-        # if item.spec.taints and len(item.spec.taints) > 0:
-        #     logger.debug("{p} Tainted node ' ".format(
-        #         p=item.metadata.name))
-        #     localresult = False
-
-        if not localresult:
-            logger.debug("{p} Is not healthy ' ".format(
-                p=item.metadata.name))
-        if localresult is False:
-            retval = localresult
+        if get_node_problems(item):
+            retval = False
 
     return retval
 
 
+def get_node_problems(node) -> list:
+    """
+    Helper function.
+    Returns the list of problems found on the node: "NotReady" when its
+    Ready condition is False and "Unschedulable" when it is cordoned.
+    An empty list means the node is healthy.
+    """
+    problems = []
+    for condition in node.status.conditions:
+        if condition.type == "Ready" and condition.status == "False":
+            logger.debug("{p} Ready=False  ".format(
+                p=node.metadata.name))
+            problems.append("NotReady")
+    if node.spec.unschedulable:
+        logger.debug("{p} unschedulable ' ".format(
+            p=node.metadata.name))
+        problems.append("Unschedulable")
+
+    # if node.spec.taints and len(node.spec.taints) > 0:
+    #     logger.debug("{p} Tainted node ' ".format(
+    #         p=node.metadata.name))
+    #     problems.append("Tainted")
+
+    if problems:
+        logger.debug("{p} Is not healthy ' ".format(
+            p=node.metadata.name))
+    return problems
+
+
 def have_new_node(k8s_label_selector: str = None,
                   age_limit: int = 600,
                   configuration: Configuration = None,
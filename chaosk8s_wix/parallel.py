@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List
+
+__all__ = ["run_in_parallel", "DEFAULT_MAX_WORKERS"]
+
+DEFAULT_MAX_WORKERS = 16
+
+
+def run_in_parallel(func: Callable, items: Iterable,
+                    max_workers: int = DEFAULT_MAX_WORKERS) -> List[Any]:
+    """
+    Call `func` for every element of `items` using a bounded thread pool.
+
+    Results are returned in the same order as `items`. The first exception
+    raised by `func` is re-raised to the caller.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if len(items) == 1 or max_workers <= 1:
+        return [func(item) for item in items]
+
+    workers = min(max_workers, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
@@ -9,6 +9,7 @@ from chaosk8s_wix.slack.client import post_message
 from chaosk8s_wix.slack.logger_handler import SlackHanlder
 
 from chaosk8s_wix import create_k8s_api_client
+from chaosk8s_wix.namespaces import get_eligible_namespaces
 
 __all__ = ["terminate_pods", "label_random_pod_in_ns",
            "remove_label_by_label_from_pod"]
@@ -21,10 +22,9 @@ def get_not_empty_ns(secret: Secrets = None, ns_ignore_list: str = "", label_sel
     api = create_k8s_api_client(secret)
 
     v1 = client.CoreV1Api(api)
-    ret = v1.list_namespace()
 
-    good_ns_list = [
-        ns.metadata.name for ns in ret.items if ns.metadata.name not in ns_ignore_list]
+    good_ns_list = [ns.metadata.name for ns in get_eligible_namespaces(
+        lambda: v1, ns_ignore_list, secrets=secret)]
 
     retval = None
     count = 100
@@ -6,7 +6,7 @@ import dateparser
 from logzero import logger
 from kubernetes import client
 
-from chaosk8s_wix import create_k8s_api_client
+from chaosk8s_wix import create_k8s_api_client, aio
 from chaoslib.exceptions import FailedActivity
 from chaosk8s_wix.slack.logger_handler import SlackHanlder
 
@@ -38,7 +38,7 @@ def read_pod_logs(name: str = None, last: Union[str, None] = None,
     previous pod's incarnation, if any.
     """
     label_selector = label_selector.format(name=name)
-    api = create_k8s_api_client(secrets)
+    api = aio.get_shared_api_client(secrets)
     v1 = client.CoreV1Api(api)
     ret = v1.list_namespaced_pod(ns, label_selector=label_selector)
 
@@ -51,25 +51,18 @@ def read_pod_logs(name: str = None, last: Union[str, None] = None,
         since = int((now - dateparser.parse(last)).total_seconds())
 
     params = dict(
-        namespace=ns,
         follow=False,
         previous=from_previous,
         timestamps=True,
         container=container_name or "",  # None is not a valid value
-        _preload_content=False
     )
 
     if since:
         params["since_seconds"] = since
 
-    logs = {}
-    for p in ret.items:
-        name = p.metadata.name
-        logger.debug("Fetching logs for pod '{n}'".format(n=name))
-        r = v1.read_namespaced_pod_log(name, **params)
-        logs[name] = r.read().decode('utf-8')
-
-    return logs
+    names = [p.metadata.name for p in ret.items]
+    logger.debug("Fetching logs for pods [{n}]".format(n=', '.join(names)))
+    return aio.run(aio.async_read_pods_logs(v1, names, ns, **params))
 
 
 def pods_in_phase(label_selector: str, phase: str = "Running",
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import time
 from typing import Dict, Union
 import urllib3
 import requests
@@ -6,17 +7,29 @@ from chaoslib.exceptions import FailedActivity
 from chaoslib.types import MicroservicesStatus, Secrets, Configuration
 from logzero import logger
 from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
 
-from chaosk8s_wix import __version__, create_k8s_api_client
+from chaosk8s_wix import __version__, create_k8s_api_client, list_all_pages, \
+    iter_pages, get_cluster_key, aio
 from chaosk8s_wix.pod.probes import read_pod_logs
-from chaosk8s_wix.node import load_taint_list_from_dict, get_active_nodes
-from chaosk8s_wix.node.probes import all_nodes_are_ok
+from chaosk8s_wix.node import load_taint_list_from_dict, get_active_nodes, \
+    labels_match_selector, node_should_be_ignored_by_taints
+from chaosk8s_wix.node.probes import all_nodes_are_ok, get_node_problems
 
 
 __all__ = ["all_microservices_healthy", "microservice_available_and_healthy",
            "microservice_is_not_available", "service_endpoint_is_initialized",
            "deployment_is_not_fully_available", "read_microservices_logs",
-           "all_pods_in_all_ns_are_ok", "nodes_super_healthy", "check_http", "all_microservices_healthy_multi_ns"]
+           "all_pods_in_all_ns_are_ok", "nodes_super_healthy", "check_http", "all_microservices_healthy_multi_ns",
+           "nodes_super_healthy_report", "pods_health_report"]
+
+MULTI_NS_CLUSTER_WIDE_THRESHOLD = 10
+PODS_PAGE_SIZE = 500
+INCREMENTAL_WATCH_TIMEOUT = 1
+# watch is considered caught up when no event arrived for that many seconds
+INCREMENTAL_WATCH_IDLE_TIMEOUT = 0.2
+
+_incremental_pods_state = {}
 
 
 def all_microservices_healthy(
@@ -30,9 +43,6 @@ def all_microservices_healthy(
     as expected.
     """
     api = create_k8s_api_client(secrets)
-    not_ready = []
-    failed = []
-    not_in_condition = []
     ns_ignore_list = []
     if configuration is not None:
         ns_ignore_list = configuration.get("ns-ignore-list", [])
@@ -41,8 +51,22 @@ def all_microservices_healthy(
         ret = v1.list_pod_for_all_namespaces()
     else:
         ret = v1.list_namespaced_pod(namespace=ns)
+
+    return check_pods_phases(ret.items, ns_ignore_list)
+
+
+def check_pods_phases(pods, ns_ignore_list) -> bool:
+    """
+    Check all given pods are in the `Running` phase. Pods from namespaces in
+    `ns_ignore_list` are skipped.
+
+    Raises :exc:`chaoslib.exceptions.FailedActivity` when the state is not
+    as expected.
+    """
+    not_ready = []
+    failed = []
     total = 0
-    for p in ret.items:
+    for p in pods:
         phase = p.status.phase
         if p.metadata.namespace not in ns_ignore_list:
             total = total + 1
@@ -77,13 +101,53 @@ def all_microservices_healthy_multi_ns(
     Raises :exc:`chaoslib.exceptions.FailedActivity` when the state is not
     as expected.
     """
-    res = True
-    for ns in ns_list:
-        logger.debug("Check all services healthy in {} ".format(ns))
-        res = all_microservices_healthy(ns, secrets, configuration)
-        if not res:
-            break
-    return res
+    ns_ignore_list = []
+    if configuration is not None:
+        ns_ignore_list = configuration.get("ns-ignore-list", [])
+
+    api = aio.get_shared_api_client(secrets)
+    v1 = client.CoreV1Api(api)
+    logger.debug("Check all services healthy in {} ".format(ns_list))
+    pods = list_pods_in_namespaces(v1, ns_list, configuration)
+
+    return check_pods_phases(pods, ns_ignore_list)
+
+
+def list_pods_in_namespaces(v1, ns_list, configuration: Configuration = None):
+    """
+    Fetch the pods of every namespace in `ns_list` with the cheaper of two
+    strategies:
+
+    * up to `multi-ns-cluster-wide-threshold` namespaces (10 by default) are
+      listed with one request per namespace, issued concurrently through
+      `chaosk8s_wix.aio`
+    * above that threshold, pods of all namespaces are listed page by page
+      (`pods-page-size`, 500 by default) and filtered by namespace locally
+
+    :param v1: CoreV1Api instance to use, preferably built on
+    `aio.get_shared_api_client` so concurrent requests reuse connections
+    :param ns_list: namespaces to list pods in
+    :param configuration: experiment configuration
+    :return: list of pods
+    """
+    threshold = get_value_from_configuration(
+        configuration, "multi-ns-cluster-wide-threshold")
+    if threshold is None:
+        threshold = MULTI_NS_CLUSTER_WIDE_THRESHOLD
+    page_size = get_value_from_configuration(configuration, "pods-page-size")
+    if page_size is None:
+        page_size = PODS_PAGE_SIZE
+
+    namespaces = set(ns_list)
+    if len(namespaces) > int(threshold):
+        logger.debug("Listing pods cluster wide for {} namespaces".format(
+            len(namespaces)))
+        pods = list_all_pages(v1.list_pod_for_all_namespaces,
+                              page_size=int(page_size), watch=False)
+        return [p for p in pods if p.metadata.namespace in namespaces]
+
+    return aio.run(aio.async_list_pods_in_namespaces(
+        v1, sorted(namespaces), watch=False))
 
 
 def microservice_available_and_healthy(
@@ -257,26 +321,27 @@ def all_pods_are_ok_in_multi_ns(ns_list: [], configuration: Configuration = None
 
     nodes, kubeclient = get_active_nodes(None, taint_ignore_list, secrets)
 
-    active_nodes = [i.metadata.name for i in nodes.items]
+    active_nodes = set(i.metadata.name for i in nodes.items)
 
-    api = create_k8s_api_client(secrets)
+    api = aio.get_shared_api_client(secrets)
     v1 = client.CoreV1Api(api)
-    for ns in ns_list:
-        pods = v1.list_namespaced_pod(namespace=ns, watch=False)
-        retval = check_pods_statuses(active_nodes, ns_ignore_list, pods)
-        # if one fails all shall fall
-        if not retval:
-            break
+    pods = list_pods_in_namespaces(v1, ns_list, configuration)
+    # if one fails all shall fall
+    retval = check_pods_statuses(active_nodes, ns_ignore_list, pods)
 
     return retval
 
 
 def all_pods_in_all_ns_are_ok(configuration: Configuration = None,
-                              secrets: Secrets = None):
+                              secrets: Secrets = None,
+                              incremental: bool = False):
     """
 
     :param configuration: experiment configuration
     :param secrets: k8s credentials
+    :param incremental: when True, only pods changed since the previous
+    incremental call are fetched and evaluated. Useful when the probe is
+    called in a loop until cluster gets healthy
     :return: True if all pods are in running state, False otherwise. This fucntion ignores nodes with taints from
     configuration taints-ignore-list list
     """
@@ -293,45 +358,291 @@ def all_pods_in_all_ns_are_ok(configuration: Configuration = None,
 
     nodes, kubeclient = get_active_nodes(None, taint_ignore_list, secrets)
 
-    active_nodes = [i.metadata.name for i in nodes.items]
+    active_nodes = set(i.metadata.name for i in nodes.items)
+
+    if incremental:
+        report = get_incremental_pods_health_report(
+            kubeclient, active_nodes, ns_ignore_list,
+            configuration=configuration, secrets=secrets)
+        return report["healthy"]
 
     api = create_k8s_api_client(secrets)
     v1 = client.CoreV1Api(api)
     pods = v1.list_pod_for_all_namespaces(watch=False)
 
-    retval = check_pods_statuses(active_nodes, ns_ignore_list, pods)
+    retval = check_pods_statuses(active_nodes, ns_ignore_list, pods.items)
 
     return retval
 
 
 def check_pods_statuses(active_nodes, ns_ignore_list, pods):
+    report = get_pods_health_report(active_nodes, ns_ignore_list, pods)
+    return report["healthy"]
+
+
+def get_container_problem(container_status):
+    """
+    Helper function.
+    Returns tuple of container state name and reason if container is neither
+    running nor completed, None otherwise.
+    """
+    state = container_status.state
+    if state.running is not None:
+        return None
+    if state.terminated is not None:
+        if state.terminated.reason == 'Completed':
+            # completed docker is ok
+            return None
+        return "terminated", state.terminated.reason or "Unknown"
+    if state.waiting is not None:
+        return "waiting", state.waiting.reason or "Unknown"
+    return "unknown", "Unknown"
+
+
+def get_pod_problems(pod) -> list:
+    """
+    Helper function.
+    Returns list with namespace, pod, node, container, state and reason of
+    every container of the pod that is neither running nor completed.
+    """
+    problems = []
+    for status in pod.status.container_statuses or []:
+        problem = get_container_problem(status)
+        if problem is None:
+            continue
+        state, reason = problem
+        problems.append({
+            "namespace": pod.metadata.namespace,
+            "pod": pod.metadata.name,
+            "node": pod.spec.node_name,
+            "host_ip": pod.status.host_ip,
+            "container": status.name,
+            "state": state,
+            "reason": reason
+        })
+    return problems
+
+
+def get_pods_health_report(active_nodes, ns_ignore_list, pods) -> Dict:
+    """
+    Evaluate containers of all pods scheduled on `active_nodes` in one pass
+    and collect every container that is neither running nor completed.
+
+    :param active_nodes: names of nodes to check pods on
+    :param ns_ignore_list: namespaces whose unhealthy containers are counted
+    as ignored instead of unhealthy
+    :param pods: list of pods to check
+    :return: dictionary with "healthy" flag, number of "checked" pods,
+    number of "ignored" containers, "unhealthy" list with namespace, pod,
+    node, container, state and reason of every bad container and
+    "reasons" with amount of bad containers per reason
+    """
+    active_nodes = set(active_nodes)
+    pods_problems = [get_pod_problems(i) for i in pods
+                     if i.spec.node_name in active_nodes and i.status.container_statuses is not None]
+    return build_pods_health_report(pods_problems, ns_ignore_list)
+
+
+def build_pods_health_report(pods_problems, ns_ignore_list) -> Dict:
+    """
+    Helper function.
+    Builds health report from list of problems lists, one per checked pod.
+    """
+    ns_ignore_list = set(ns_ignore_list)
     ignored_pods = 0
-    retval = True
-    for i in pods.items:
-        if i.spec.node_name in active_nodes and i.status.container_statuses is not None:
-            for status in i.status.container_statuses:
-                is_status_running = status.state.running is not None
-                is_status_terminated = status.state.terminated is not None
-                terminated_reason = ''
-                if is_status_terminated:
-                    terminated_reason = status.state.terminated.reason
-                if is_status_terminated and terminated_reason == 'Completed':
-                    # completed docker is ok
-                    pass
-                elif not is_status_running:
-                    # if its not complete and not running its a problem
-                    if i.metadata.namespace not in ns_ignore_list:
-                        logger.info("%s\t%s\t%s \t%s is not good" % (
-                            i.status.host_ip,
-                            i.metadata.namespace,
-                            i.metadata.name,
-                            i.status.container_statuses[0].state))
-                        retval = False
-                        break
-                    else:
-                        ignored_pods = ignored_pods + 1
+    unhealthy = []
+    reasons = {}
+    for problems in pods_problems:
+        for problem in problems:
+            if problem["namespace"] in ns_ignore_list:
+                ignored_pods = ignored_pods + 1
+                continue
+            # if its not complete and not running its a problem
+            logger.info("%s\t%s\t%s \t%s %s is not good" % (
+                problem["host_ip"],
+                problem["namespace"],
+                problem["pod"],
+                problem["state"],
+                problem["reason"]))
+            unhealthy.append(problem)
+            reasons[problem["reason"]] = reasons.get(problem["reason"], 0) + 1
     logger.info('{} not healthy pods where ignored by ns_ignore_list'.format(ignored_pods))
-    return retval
+    return {
+        "healthy": len(unhealthy) == 0,
+        "checked": len(pods_problems),
+        "ignored": ignored_pods,
+        "unhealthy": unhealthy,
+        "reasons": reasons
+    }
+
+
+def get_incremental_pods_health_report(v1, active_nodes, ns_ignore_list,
+                                       configuration: Configuration = None,
+                                       secrets: Secrets = None) -> Dict:
+    """
+    Same report as get_pods_health_report, but pods of the cluster are listed
+    only on the first call. Evaluated state is remembered with the list
+    resourceVersion, and next calls only apply pods changes streamed by a
+    watch started from that resourceVersion, so cost of repeated polling
+    depends on amount of changes and not on size of the cluster.
+    Full list is done again when the server reports the resourceVersion
+    as expired.
+
+    :param v1: CoreV1Api instance to use
+    :param active_nodes: names of nodes to check pods on
+    :param ns_ignore_list: namespaces to ignore
+    :param configuration: experiment configuration, `pods-page-size` and
+    `incremental-watch-timeout` (seconds, 1 by default) are used
+    :param secrets: k8s credentials, used to tell clusters apart
+    :return: report as returned by get_pods_health_report
+    """
+    key = get_cluster_key(secrets)
+    state = _incremental_pods_state.get(key)
+    if state is not None:
+        timeout = get_value_from_configuration(
+            configuration, "incremental-watch-timeout")
+        if timeout is None:
+            timeout = INCREMENTAL_WATCH_TIMEOUT
+        if not apply_pods_changes(v1, state, int(timeout)):
+            logger.debug("resourceVersion {} expired, listing all pods".format(
+                state["resource_version"]))
+            state = None
+
+    if state is None:
+        page_size = get_value_from_configuration(configuration, "pods-page-size")
+        if page_size is None:
+            page_size = PODS_PAGE_SIZE
+        state = load_pods_state(v1, int(page_size))
+    _incremental_pods_state[key] = state
+
+    pods_problems = [problems for node, problems in state["pods"].values()
+                     if node in active_nodes]
+    return build_pods_health_report(pods_problems, ns_ignore_list)
+
+
+def reset_incremental_pods_health():
+    """
+    Forget state remembered by incremental pods health checks, next check
+    will list all pods again.
+    """
+    _incremental_pods_state.clear()
+
+
+def get_pod_key(pod) -> str:
+    return "{}/{}".format(pod.metadata.namespace, pod.metadata.name)
+
+
+def load_pods_state(v1, page_size: int) -> Dict:
+    """
+    Helper function.
+    List all pods in the cluster and evaluate them. Only node name and
+    problems of every pod are kept.
+    """
+    pods = {}
+    resource_version = None
+    for ret in iter_pages(v1.list_pod_for_all_namespaces,
+                          page_size=page_size, watch=False):
+        if ret.metadata is not None:
+            resource_version = ret.metadata.resource_version
+        for pod in ret.items:
+            if pod.status.container_statuses is not None:
+                pods[get_pod_key(pod)] = (pod.spec.node_name,
+                                          get_pod_problems(pod))
+    return {"resource_version": resource_version, "pods": pods}
+
+
+def is_caught_up(resource_version: str, latest: str) -> bool:
+    """
+    Helper function.
+    True when `resource_version` of an event is not older than `latest`.
+    Resource versions are opaque, numeric ones are compared as numbers.
+    """
+    try:
+        return int(resource_version) >= int(latest)
+    except (TypeError, ValueError):
+        return resource_version == latest
+
+
+def apply_pods_changes(v1, state: Dict, timeout: int) -> bool:
+    """
+    Helper function.
+    Update pods state with changes that happened since its resourceVersion.
+    The current resourceVersion is read with a single item list first, the
+    watch is skipped when state is up to date and stopped once it caught up,
+    or when no event arrived for INCREMENTAL_WATCH_IDLE_TIMEOUT seconds.
+    `timeout` bounds the watch in any case.
+    Returns False if resourceVersion is too old and state must be reloaded.
+    """
+    if state["resource_version"] is None:
+        return False
+
+    ret = v1.list_pod_for_all_namespaces(limit=1, watch=False)
+    latest = ret.metadata.resource_version if ret.metadata else None
+    if latest is not None and latest == state["resource_version"]:
+        return True
+
+    w = watch.Watch()
+    changes = 0
+    try:
+        for event in w.stream(v1.list_pod_for_all_namespaces,
+                              resource_version=state["resource_version"],
+                              timeout_seconds=timeout,
+                              _request_timeout=(
+                                  timeout, INCREMENTAL_WATCH_IDLE_TIMEOUT)):
+            if event["type"] == "ERROR":
+                w.stop()
+                return False
+            pod = event["object"]
+            changes = changes + 1
+            state["resource_version"] = pod.metadata.resource_version
+            key = get_pod_key(pod)
+            if event["type"] == "DELETED" or pod.status.container_statuses is None:
+                state["pods"].pop(key, None)
+            else:
+                state["pods"][key] = (pod.spec.node_name, get_pod_problems(pod))
+            if latest is not None and \
+                    is_caught_up(state["resource_version"], latest):
+                w.stop()
+                break
+    except ApiException as x:
+        if x.status == 410:
+            return False
+        raise
+    except urllib3.exceptions.ReadTimeoutError:
+        pass
+
+    logger.debug("Applied {} pods changes".format(changes))
+    return True
+
+
+def pods_health_report(configuration: Configuration = None,
+                       secrets: Secrets = None) -> Dict:
+    """
+    Same check as all_pods_in_all_ns_are_ok, but instead of a boolean returns
+    report of every unhealthy container found in the cluster, so experiments
+    do not need to rerun the probe to find all offenders.
+
+    :param configuration: experiment configuration
+    :param secrets: k8s credentials
+    :return: report as returned by get_pods_health_report
+    """
+    ns_ignore_list = get_value_from_configuration(
+        configuration, "ns-ignore-list")
+    if ns_ignore_list is None:
+        ns_ignore_list = []
+
+    taint_ignore_list = []
+    taints = get_value_from_configuration(configuration, "taints-ignore-list")
+    if taints is not None:
+        taint_ignore_list = load_taint_list_from_dict(taints)
+
+    nodes, kubeclient = get_active_nodes(None, taint_ignore_list, secrets)
+
+    active_nodes = set(i.metadata.name for i in nodes.items)
+
+    pods = kubeclient.list_pod_for_all_namespaces(watch=False)
+
+    return get_pods_health_report(active_nodes, ns_ignore_list, pods.items)
 
 
 def nodes_super_healthy(
@@ -346,18 +657,90 @@ def nodes_super_healthy(
     :param secrets: k8s credentials
     :return: true if all test are ok. False otherwise
     """
+    report = nodes_super_healthy_report(label_selector=label_selector,
+                                        configuration=configuration,
+                                        secrets=secrets)
+    return report["healthy"]
+
+
+def nodes_super_healthy_report(
+        label_selector: str = "",
+        configuration: Configuration = None,
+        secrets: Secrets = None) -> Dict:
+    """
+    Same checks as nodes_super_healthy, evaluated on a single snapshot of the
+    cluster: nodes and pods are listed once and then pods containers health,
+    nodes Ready condition, unschedulable flag and taints filtering are
+    evaluated locally.
+    :param label_selector: label selector of nodes to check for health
+    :param configuration: experiment configuration
+    :param secrets: k8s credentials
+    :return: dictionary with overall "healthy" flag, result of every check
+    and "timings" in seconds of every step
+    """
+    timings = {}
+
+    ns_ignore_list = get_value_from_configuration(
+        configuration, "ns-ignore-list")
+    if ns_ignore_list is None:
+        ns_ignore_list = []
+
+    taint_ignore_list = []
+    taints = get_value_from_configuration(configuration, "taints-ignore-list")
+    if taints is not None:
+        taint_ignore_list = load_taint_list_from_dict(taints)
+
+    page_size = get_value_from_configuration(configuration, "pods-page-size")
+    if page_size is None:
+        page_size = PODS_PAGE_SIZE
+
+    api = create_k8s_api_client(secrets)
+    v1 = client.CoreV1Api(api)
+
+    started = time.time()
+    nodes = v1.list_node().items
+    timings["list_nodes"] = time.time() - started
+
+    started = time.time()
+    pods = list_all_pages(v1.list_pod_for_all_namespaces,
+                          page_size=int(page_size), watch=False)
+    timings["list_pods"] = time.time() - started
+
+    started = time.time()
+    active_nodes = [n for n in nodes if not n.spec.taints or
+                    not node_should_be_ignored_by_taints(n.spec.taints, taint_ignore_list)]
+    active_node_names = set(n.metadata.name for n in active_nodes)
+    timings["filter_nodes"] = time.time() - started
+
     logger.debug(
         "========================Running all pods in all namespaces are ok check")
-
-    retval = all_pods_in_all_ns_are_ok(
-        configuration=configuration, secrets=secrets)
-    if retval:
-        logger.debug("========================Running all nodes are ok check")
-        retval = all_nodes_are_ok(
-            label_selector=label_selector,
-            secrets=secrets,
-            configuration=configuration)
-    return retval
+    started = time.time()
+    pods_report = get_pods_health_report(active_node_names, ns_ignore_list, pods)
+    timings["pods"] = time.time() - started
+
+    logger.debug("========================Running all nodes are ok check")
+    started = time.time()
+    unhealthy_nodes = {}
+    for node in active_nodes:
+        if label_selector and not labels_match_selector(
+                node.metadata.labels, label_selector):
+            continue
+        problems = get_node_problems(node)
+        if problems:
+            unhealthy_nodes[node.metadata.name] = problems
+    timings["nodes"] = time.time() - started
+
+    return {
+        "healthy": pods_report["healthy"] and not unhealthy_nodes,
+        "pods": pods_report,
+        "nodes": {
+            "healthy": not unhealthy_nodes,
+            "total": len(nodes),
+            "active": len(active_nodes),
+            "unhealthy": unhealthy_nodes
+        },
+        "timings": timings
+    }
 
 
 def check_http(url: str, timeout: int = 5) -> int:
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Run shell commands on many hosts over SSH concurrently.
+
+fabric keeps the target host in the process wide `fabric.api.env`, so it can
+only talk to one host at a time. The runner below uses a transport object
+instead: `ParamikoTransport` keeps one SSH connection per host and is safe to
+use from the worker threads, any object with the same `run`/`close` methods
+(e.g. a stub in tests) can be passed in its place.
+"""
+import io
+import os
+import shlex
+import threading
+import time
+from typing import Dict, List, Union
+
+import paramiko
+from chaoslib.exceptions import FailedActivity
+from logzero import logger
+
+from chaosk8s_wix.parallel import run_in_parallel
+
+__all__ = ["ParamikoTransport", "run_on_hosts", "load_private_key",
+           "SSH_MAX_WORKERS"]
+
+SSH_MAX_WORKERS = 16
+SSH_CONNECT_TIMEOUT = 10
+
+_KEY_CLASSES = [paramiko.RSAKey, paramiko.ECDSAKey, paramiko.Ed25519Key]
+
+
+def load_private_key(key_text: str) -> paramiko.PKey:
+    """
+    Load private key from its full text, as passed in SSH_KEY variable.
+    """
+    for key_class in _KEY_CLASSES:
+        try:
+            return key_class.from_private_key(io.StringIO(key_text))
+        except paramiko.SSHException:
+            continue
+    raise ValueError("SSH key is not a valid RSA, ECDSA or Ed25519 key")
+
+
+class ParamikoTransport(object):
+    """
+    Execute commands over SSH, connections are opened on first use and
+    reused for all further commands sent to the same host.
+    """
+
+    def __init__(self, user: str = None, key_text: str = None,
+                 port: int = 22, timeout: int = SSH_CONNECT_TIMEOUT):
+        self.user = user if user is not None else os.getenv("SSH_USER")
+        key_text = key_text if key_text is not None else os.getenv("SSH_KEY")
+        self.key = load_private_key(key_text) if key_text else None
+        self.port = port
+        self.timeout = timeout
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, host: str) -> paramiko.SSHClient:
+        with self._lock:
+            ssh = self._clients.get(host)
+        if ssh is not None:
+            return ssh
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(host, port=self.port, username=self.user, pkey=self.key,
+                    timeout=self.timeout, allow_agent=self.key is None,
+                    look_for_keys=self.key is None)
+        with self._lock:
+            self._clients[host] = ssh
+        return ssh
+
+    def run(self, host: str, command: str, sudo: bool = False) -> (int, str, str):
+        """
+        Run `command` on `host`, return exit code, stdout and stderr.
+        """
+        if sudo:
+            command = "sudo -n /bin/bash -c {}".format(shlex.quote(command))
+        ssh = self._connect(host)
+        stdin, stdout, stderr = ssh.exec_command(command)
+        stdin.close()
+        # both streams are drained at the same time, so a command filling
+        # up the stderr window does not block while stdout is read
+        err = []
+        err_reader = threading.Thread(target=lambda: err.append(stderr.read()),
+                                      daemon=True)
+        err_reader.start()
+        out = stdout.read()
+        err_reader.join()
+        return (stdout.channel.recv_exit_status(),
+                out.decode("utf-8", "replace"),
+                b"".join(err).decode("utf-8", "replace"))
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for ssh in clients:
+            ssh.close()
+
+
+def run_on_hosts(hosts: List[str], commands: Union[str, List[str]],
+                 sudo: bool = False, transport=None,
+                 max_workers: int = SSH_MAX_WORKERS,
+                 fail_on_error: bool = True) -> Dict[str, Dict]:
+    """
+    Run commands on all hosts, at most `max_workers` hosts at a time.
+    Commands of one host run in order over the same connection and stop at
+    the first failing one.
+
+    Raises :exc:`chaoslib.exceptions.FailedActivity` once all hosts are done
+    when any host was not reachable or a command exited with non zero code,
+    unless `fail_on_error` is False.
+
+    :return: dictionary keyed by host with "exit_code", "stdout", "stderr",
+    "duration" in seconds and "error" set when the host was not reachable
+    """
+    if isinstance(commands, str):
+        commands = [commands]
+    hosts = list(dict.fromkeys(hosts))
+    if not hosts:
+        return {}
+    owns_transport = transport is None
+    if owns_transport:
+        transport = ParamikoTransport()
+
+    def run_on_host(host):
+        result = {"exit_code": None, "stdout": "", "stderr": "",
+                  "duration": 0, "error": None}
+        started = time.time()
+        try:
+            for command in commands:
+                code, out, err = transport.run(host, command, sudo=sudo)
+                result["exit_code"] = code
+                result["stdout"] += out
+                result["stderr"] += err
+                if code != 0:
+                    break
+        except Exception as e:
+            logger.warning("SSH command on {} failed: {}".format(host, e))
+            result["error"] = str(e)
+        result["duration"] = time.time() - started
+        return result
+
+    try:
+        results = run_in_parallel(run_on_host, hosts, max_workers)
+    finally:
+        if owns_transport:
+            transport.close()
+    retval = dict(zip(hosts, results))
+    failures = get_failures(retval)
+    if failures and fail_on_error:
+        raise FailedActivity("SSH commands failed on {} of {} hosts: {}".format(
+            len(failures), len(hosts), "; ".join(failures)))
+    return retval
+
+
+def get_failures(results: Dict[str, Dict]) -> List[str]:
+    """
+    Helper function.
+    Describe every host of `run_on_hosts` results which failed.
+    """
+    failures = []
+    for host, result in results.items():
+        if result["error"] is not None:
+            failures.append("{}: {}".format(host, result["error"]))
+        elif result["exit_code"] != 0:
+            failures.append("{}: exit code {} {}".format(
+                host, result["exit_code"], result["stderr"].strip()).strip())
+    return failures
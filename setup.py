@@ -85,6 +85,7 @@ setup_params = dict(
     packages=packages,
     include_package_data=True,
     install_requires=install_require,
+    extras_require={'numpy': ['numpy']},
     tests_require=test_require,
     setup_requires=pytest_runner,
     python_requires='>=3.5.*'
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from chaosk8s_wix import aio, aws, grafana, invalidate_aws_cache, namespaces
+from chaosk8s_wix.aws import actions as aws_actions
+
+
+@pytest.fixture(autouse=True)
+def clear_namespace_inventory():
+    namespaces._inventories.clear()
+    yield
+    namespaces._inventories.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_instance_index():
+    aws._inventories.clear()
+    aws_actions._sg_ids.clear()
+    aws_actions._sg_rollback.clear()
+    yield
+    aws._inventories.clear()
+    aws_actions._sg_ids.clear()
+    aws_actions._sg_rollback.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_aws_cache():
+    invalidate_aws_cache()
+    yield
+    invalidate_aws_cache()
+
+
+@pytest.fixture(autouse=True)
+def clear_grafana_clients():
+    grafana._tokens.clear()
+    grafana._clients.clear()
+    yield
+    grafana._tokens.clear()
+    grafana._clients.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_shared_api_clients():
+    aio._api_clients.clear()
+    yield
+    aio._api_clients.clear()
@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 from unittest.mock import ANY, MagicMock, patch
 
-from chaoslib.exceptions import FailedActivity
+from chaoslib.exceptions import FailedActivity, InvalidActivity
 from kubernetes import client as k8sClient
 from kubernetes.client.rest import ApiException
+from botocore.exceptions import ClientError
 import pytest
 
-from chaosk8s_wix.actions import start_microservice ,deploy_objects_in_random_namespace
+from chaosk8s_wix.actions import start_microservice ,deploy_objects_in_random_namespace, kill_microservice, \
+    kill_microservice_by_label, scale_microservice
 from chaosk8s_wix.node.actions import cordon_node, create_node, delete_nodes, \
     uncordon_node, drain_nodes, remove_label_from_node, taint_nodes_by_label, add_label_to_node, generate_patch_for_taint
-from chaosk8s_wix.aws.actions import tag_random_node_aws,attach_sq_to_instance_by_tag,iptables_block_port
+from chaosk8s_wix.aws.actions import tag_random_node_aws,attach_sq_to_instance_by_tag,iptables_block_port, \
+    set_tag_to_aws_instances, render_iptables_block_batch, detach_sq_from_instance_by_tag, restore_sq_of_instances, \
+    terminate_instances_by_tag, terminate_instance_by_tag, remove_tag_from_aws_instances, get_sg_id_by_name
+from chaosk8s_wix.aws import get_node_instance_inventory, lookup_node_instances
 from common import create_node_object ,create_config_with_taint_ignore
 import os
 
@@ -533,6 +538,7 @@ def test_tag_random_node_aws(clientApi, has_conf,boto_client):
 
     response = k8sClient.V1NodeList(items=[node1, node2])
     v1.list_node_with_http_info.return_value = response
+    v1.list_node.return_value = response
     clientApi.return_value = v1
 
     client = MagicMock()
@@ -557,6 +563,8 @@ def test_tag_random_node_aws(clientApi, has_conf,boto_client):
     assert retval == 0
     assert nodename == "node1"
     client.create_tags.assert_called_with(Resources=['id_1'], Tags=[{'Key': 'test_tag', 'Value': 'test_tag'}])
+    assert get_node_instance_inventory(v1, client)["node1"]["tags"] == {"test_tag": "test_tag"}
+    assert client.describe_instances.call_count == 1
 
 
 
@@ -616,17 +624,18 @@ def test_attach_sq_to_instance_by_tag(gks,client, has_conf,boto_client):
                                           configuration=config)
 
     assert retval is not None
-    network_interface.modify_attribute.assert_called_with(Groups=['i_testsgid'])
+    client.modify_network_interface_attribute.assert_called_with(NetworkInterfaceId=network_interface.id,
+                                                                 Groups=['i_testsgid'])
 
 
 @patch('chaosk8s_wix.boto3', autospec=True)
 @patch('chaosk8s_wix.has_local_config_file', autospec=True)
-@patch('chaosk8s_wix.node.client', autospec=True)
-@patch('chaosk8s_wix.aws.actions.api', autospec=True)
+@patch('chaosk8s_wix.aws.actions.client', autospec=True)
+@patch('chaosk8s_wix.ssh.ParamikoTransport')
 @patch('chaosk8s_wix.slack.logger_handler.get_kube_secret_from_production')
-def test_iptables_block_port_no_taint_only(gks,fabric,client, has_conf,boto_client):
-    fabric_api = MagicMock()
-    fabric.return_value = fabric_api
+def test_iptables_block_port_no_taint_only(gks,transport_class,client, has_conf,boto_client):
+    transport = transport_class.return_value
+    transport.run.return_value = (0, "", "")
     gks.return_value = {'url': 'fake_url.com', 'token': 'fake_token_towhatever', 'SLACK_CHANNEL': 'chaos_fanout',
                         'SLACK_TOKEN': 'sometoken'}
     os.environ["SSH_KEY"] = "keytext"
@@ -647,31 +656,16 @@ def test_iptables_block_port_no_taint_only(gks,fabric,client, has_conf,boto_clie
     node2.spec.taints = [taint]
 
     response = k8sClient.V1NodeList(items=[node1, node2])
-    v1.list_node_with_http_info.return_value = response
+    v1.list_node.return_value = response
     client.CoreV1Api.return_value = v1
-    client.V1NodeList.return_value = k8sClient.V1NodeList(items=[])
 
     client = MagicMock()
     boto_client.client.return_value = client
     boto_client.resource.return_value = client
 
-    instance = MagicMock()
-    instance.pivate_ip_address = "test_ip"
-    instance.security_groups = [
-        {
-            "GroupId": "some_testsgid"
-        }
-    ]
-
-    client.instances.filter.return_value = [instance]
+    client.describe_instances.return_value = describe_instances_response(
+        create_instance_description("i-1", "node1", "test_ip", tags=["under_chaostest"]))
 
-    client.describe_security_groups.return_value = {'SecurityGroups':
-        [
-            {
-                'GroupId': "i_testsgid",
-            }
-        ]
-    }
     config = create_config_with_taint_ignore()
 
 
@@ -679,9 +673,13 @@ def test_iptables_block_port_no_taint_only(gks,fabric,client, has_conf,boto_clie
 
     assert retval is not None
 
-    text = "iptables -I PREROUTING  -t nat -p {} --dport {} -j DNAT --to-destination 0.0.0.0:1000".format("tcp", 53)
+    text = "printf '%s\\n' '*nat' " \
+           "'-I PREROUTING -p tcp --dport 53 -j DNAT --to-destination 0.0.0.0:1000' " \
+           "COMMIT | iptables-restore --noflush"
 
-    fabric.sudo.assert_called_with(text)
+    transport.run.assert_called_once_with("test_ip", text, sudo=True)
+    assert retval["test_ip"]["exit_code"] == 0
+    transport.close.assert_called_once_with()
 
 def test_generate_patch_for_taint_added():
     taint1 = k8sClient.V1Taint(
@@ -710,3 +708,540 @@ def test_generate_patch_for_taint_already_exists():
     assert len(patch['spec']['taints']) is 2
 
 
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.actions.client')
+def test_kill_microservice_deletes_collections(client, has_conf):
+    has_conf.return_value = False
+
+    obj = MagicMock()
+    obj.metadata.namespace = "myns"
+    result = MagicMock(items=[obj])
+
+    v1 = MagicMock()
+    client.AppsV1beta1Api.return_value = v1
+    client.ExtensionsV1beta1Api.return_value = v1
+    client.CoreV1Api.return_value = v1
+    v1.list_namespaced_deployment.return_value = result
+    v1.list_namespaced_replica_set.return_value = result
+    v1.list_namespaced_pod.return_value = result
+
+    report = kill_microservice("mysvc", ns="myns")
+
+    selector = "name in (mysvc)"
+    v1.delete_collection_namespaced_deployment.assert_called_once_with("myns", label_selector=selector)
+    v1.delete_collection_namespaced_replica_set.assert_called_once_with("myns", label_selector=selector)
+    v1.delete_collection_namespaced_pod.assert_called_once_with("myns", label_selector=selector)
+    v1.delete_namespaced_pod.assert_not_called()
+    assert report["pods"]["count"] == 1
+    assert report["deployments"]["method"] == "collection"
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.actions.client')
+def test_kill_microservice_by_label_falls_back_to_single_deletes(client, has_conf):
+    has_conf.return_value = False
+
+    objects = []
+    for ns in ["ns1", "ns2", "ns2"]:
+        obj = MagicMock()
+        obj.metadata.namespace = ns
+        objects.append(obj)
+    result = MagicMock(items=objects)
+
+    v1 = MagicMock()
+    client.AppsV1beta1Api.return_value = v1
+    client.ExtensionsV1beta1Api.return_value = v1
+    client.CoreV1Api.return_value = v1
+    v1.list_deployment_for_all_namespaces.return_value = result
+    v1.list_replica_set_for_all_namespaces.return_value = result
+    v1.list_pod_for_all_namespaces.return_value = result
+    v1.delete_collection_namespaced_pod.side_effect = ApiException(status=403)
+
+    report = kill_microservice_by_label("app=web")
+
+    assert v1.delete_collection_namespaced_deployment.call_count == 2
+    assert v1.delete_namespaced_pod.call_count == 3
+    assert report["pods"]["method"] == "single"
+    assert report["replica_sets"]["count"] == 3
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.actions.client')
+def test_kill_microservice_by_label_falls_back_only_where_refused(client, has_conf):
+    has_conf.return_value = False
+
+    objects = []
+    for ns in ["ns1", "ns2", "ns2"]:
+        obj = MagicMock()
+        obj.metadata.namespace = ns
+        obj.metadata.name = "obj-" + ns
+        objects.append(obj)
+    result = MagicMock(items=objects)
+
+    v1 = MagicMock()
+    client.AppsV1beta1Api.return_value = v1
+    client.ExtensionsV1beta1Api.return_value = v1
+    client.CoreV1Api.return_value = v1
+    v1.list_deployment_for_all_namespaces.return_value = result
+    v1.list_replica_set_for_all_namespaces.return_value = result
+    v1.list_pod_for_all_namespaces.return_value = result
+
+    def delete_collection(ns, label_selector):
+        if ns == "ns2":
+            raise ApiException(status=405)
+    v1.delete_collection_namespaced_deployment.side_effect = delete_collection
+    v1.delete_namespaced_deployment.side_effect = ApiException(status=404)
+
+    report = kill_microservice_by_label("app=web")
+
+    assert v1.delete_namespaced_deployment.call_count == 2
+    for call in v1.delete_namespaced_deployment.call_args_list:
+        assert call[1]["namespace"] == "ns2"
+    assert report["deployments"]["method"] == "mixed"
+    assert report["replica_sets"]["method"] == "collection"
+    assert v1.delete_collection_namespaced_pod.call_count == 2
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.actions.client')
+def test_kill_microservice_by_label_without_deployments(client, has_conf):
+    has_conf.return_value = False
+
+    v1 = MagicMock()
+    client.AppsV1beta1Api.return_value = v1
+    client.ExtensionsV1beta1Api.return_value = v1
+    client.CoreV1Api.return_value = v1
+    v1.list_deployment_for_all_namespaces.return_value = MagicMock(items=[])
+
+    assert kill_microservice_by_label("app=web") == {}
+    v1.delete_collection_namespaced_pod.assert_not_called()
+
+
+def create_deployment_status(ready, replicas):
+    deployment = MagicMock()
+    deployment.status.ready_replicas = ready
+    deployment.status.replicas = replicas
+    deployment.metadata.resource_version = "42"
+    return deployment
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.actions.watch')
+@patch('chaosk8s_wix.actions.client')
+def test_scale_microservice_waits_for_ready_replicas(client, watch, has_conf):
+    has_conf.return_value = False
+
+    v1 = MagicMock()
+    client.ExtensionsV1beta1Api.return_value = v1
+    v1.read_namespaced_deployment.return_value = create_deployment_status(None, 1)
+
+    watcher = MagicMock()
+    watch.Watch.return_value = watcher
+    watcher.stream.return_value = [
+        {"type": "MODIFIED", "object": create_deployment_status(1, 3)},
+        {"type": "MODIFIED", "object": create_deployment_status(3, 3)}
+    ]
+
+    result = scale_microservice("web", 3, "myns", wait=True, timeout=30)
+
+    v1.patch_namespaced_deployment_scale.assert_called_once_with(
+        "web", namespace="myns", body={"spec": {"replicas": 3}})
+    watcher.stream.assert_called_once_with(
+        v1.list_namespaced_deployment, "myns", field_selector="metadata.name=web",
+        resource_version="42", timeout_seconds=ANY)
+    watcher.stop.assert_called_once_with()
+    assert result["replicas"] == 3
+    assert result["latency"] >= 0
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.actions.watch')
+@patch('chaosk8s_wix.actions.client')
+def test_scale_microservice_fails_when_not_converged(client, watch, has_conf):
+    has_conf.return_value = False
+
+    v1 = MagicMock()
+    client.ExtensionsV1beta1Api.return_value = v1
+    v1.read_namespaced_deployment.return_value = create_deployment_status(3, 3)
+    watch.Watch.return_value.stream.return_value = [
+        {"type": "MODIFIED", "object": create_deployment_status(2, 3)}
+    ]
+
+    with pytest.raises(FailedActivity):
+        scale_microservice("web", 0, "myns", wait=True, timeout=1)
+
+
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_set_tag_to_aws_instances_pages_and_caches(boto_client):
+    client = MagicMock()
+    boto_client.client.return_value = client
+
+    client.describe_instances.side_effect = [
+        {'Reservations': [{'Instances': [{'InstanceId': "id_1", 'PrivateDnsName': 'node1'}]}],
+         'NextToken': 'next'},
+        {'Reservations': [{'Instances': [{'InstanceId': "id_2", 'PrivateDnsName': 'node2'}]}]}
+    ]
+    filters = [{'Name': 'tag:env', 'Values': ['test']}]
+
+    set_tag_to_aws_instances(["node1", "node2", "node3"], "test_tag", filters)
+
+    assert client.describe_instances.call_count == 2
+    first_filters = client.describe_instances.call_args_list[0][1]["Filters"]
+    assert first_filters[-1] == {'Name': 'private-dns-name', 'Values': ["node1", "node2", "node3"]}
+    assert client.describe_instances.call_args_list[1][1]["NextToken"] == "next"
+    assert filters == [{'Name': 'tag:env', 'Values': ['test']}]
+    client.create_tags.assert_called_once_with(Resources=['id_1', 'id_2'],
+                                               Tags=[{'Key': 'test_tag', 'Value': 'test_tag'}])
+
+    client.create_tags.reset_mock()
+    set_tag_to_aws_instances(["node2", "node1"], "test_tag", filters)
+
+    assert client.describe_instances.call_count == 2
+    client.create_tags.assert_called_once_with(Resources=['id_2', 'id_1'],
+                                               Tags=[{'Key': 'test_tag', 'Value': 'test_tag'}])
+
+
+@patch('chaosk8s_wix.ssh.ParamikoTransport')
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_iptables_block_port_protocols(boto_client, transport_class):
+    transport = transport_class.return_value
+    transport.run.return_value = (0, "", "")
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    ec2.describe_instances.return_value = describe_instances_response(
+        create_instance_description("i-1", "node1", "10.0.0.1", tags=["under_chaostest"]))
+
+    iptables_block_port(tag_name="under_chaostest", port=53)
+    transport.run.assert_called_once_with("10.0.0.1", render_iptables_block_batch([53], ["tcp"]), sudo=True)
+
+    with pytest.raises(InvalidActivity):
+        iptables_block_port(tag_name="under_chaostest", port=53, protocols=[])
+    with pytest.raises(InvalidActivity):
+        iptables_block_port(tag_name="under_chaostest", port=[], protocols="udp")
+    assert transport.run.call_count == 1
+
+
+def test_render_iptables_block_batch_for_several_ports():
+    text = render_iptables_block_batch([53, 8080], ["tcp", "udp"])
+
+    assert text.startswith("printf '%s\\n' '*nat' ")
+    assert text.endswith(" COMMIT | iptables-restore --noflush")
+    for port in [53, 8080]:
+        for protocol in ["tcp", "udp"]:
+            rule = "'-I PREROUTING -p {} --dport {} -j DNAT --to-destination 0.0.0.0:1000'".format(protocol, port)
+            assert text.count(rule) == 1
+
+
+def describe_instances_response(*instances):
+    return {'Reservations': [{'Instances': list(instances)}]}
+
+
+def create_instance_description(instance_id, dns_name, ip, tags=(), state="running"):
+    return {'InstanceId': instance_id, 'PrivateDnsName': dns_name, 'PrivateIpAddress': ip,
+            'State': {'Name': state}, 'Tags': [{'Key': tag, 'Value': tag} for tag in tags]}
+
+
+@patch('chaosk8s_wix.aws.actions.client')
+@patch('chaosk8s_wix.boto3', autospec=True)
+@patch('chaosk8s_wix.ssh.ParamikoTransport')
+def test_iptables_block_port_sends_one_batch_per_host(transport_class, boto_client, client):
+    transport = transport_class.return_value
+    transport.run.return_value = (0, "", "")
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    ec2.describe_instances.return_value = describe_instances_response(
+        create_instance_description("i-1", "node1", "10.0.0.1", tags=["under_chaostest"]),
+        create_instance_description("i-2", "node2", "10.0.0.2", tags=["under_chaostest"]),
+        create_instance_description("i-3", "node3", None, tags=["under_chaostest"]))
+
+    retval = iptables_block_port(tag_name="under_chaostest", port=[53, 8080], protocols=["tcp", "udp"])
+
+    assert ec2.describe_instances.call_args[1]["Filters"] == [
+        {'Name': 'tag:under_chaostest', 'Values': ["under_chaostest"]},
+        {'Name': 'instance-state-name', 'Values': ["running"]}]
+    client.CoreV1Api.assert_not_called()
+    expected = render_iptables_block_batch([53, 8080], ["tcp", "udp"])
+    assert transport.run.call_count == 2
+    transport.run.assert_any_call("10.0.0.1", expected, sudo=True)
+    transport.run.assert_any_call("10.0.0.2", expected, sudo=True)
+    assert sorted(retval.keys()) == ["10.0.0.1", "10.0.0.2"]
+
+
+def create_instance_with_interface(instance_id, groups):
+    interface = MagicMock()
+    interface.id = "eni-" + instance_id
+    interface.groups = [{"GroupId": group} for group in groups]
+    instance = MagicMock()
+    instance.id = instance_id
+    instance.network_interfaces = [interface]
+    return instance, interface
+
+
+@patch('chaosk8s_wix.aws.time.sleep')
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_attach_sq_caches_group_and_restores_original_groups(boto_client, sleep):
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    boto_client.resource.return_value = ec2
+    ec2.describe_security_groups.return_value = {'SecurityGroups': [{'GroupId': "sg-chaos"}]}
+    instance1, interface1 = create_instance_with_interface("i-1", ["sg-web"])
+    instance2, interface2 = create_instance_with_interface("i-2", ["sg-web", "sg-db"])
+    ec2.instances.filter.return_value = [instance1, instance2]
+    throttled = ClientError({"Error": {"Code": "RequestLimitExceeded"}}, "ModifyNetworkInterfaceAttribute")
+    ec2.modify_network_interface_attribute.side_effect = [throttled, None, None]
+
+    changes = attach_sq_to_instance_by_tag(tag_name="under_chaostest", sg_name="chaos_test_sg", max_workers=1)
+
+    ec2.modify_network_interface_attribute.assert_any_call(NetworkInterfaceId="eni-i-1", Groups=["sg-chaos"])
+    ec2.modify_network_interface_attribute.assert_any_call(NetworkInterfaceId="eni-i-2", Groups=["sg-chaos"])
+    assert ec2.modify_network_interface_attribute.call_count == 3
+    assert sleep.call_count == 1
+    assert changes["eni-i-2"] == {"instance_id": "i-2", "original_groups": ["sg-web", "sg-db"],
+                                  "groups": ["sg-chaos"]}
+
+    interface1.groups = [{"GroupId": "sg-chaos"}]
+    interface2.groups = [{"GroupId": "sg-chaos"}]
+    ec2.modify_network_interface_attribute.side_effect = None
+    detach_sq_from_instance_by_tag(tag_name="under_chaostest", sg_name="chaos_test_sg")
+
+    assert ec2.describe_security_groups.call_count == 1
+    ec2.modify_network_interface_attribute.assert_any_call(NetworkInterfaceId="eni-i-1", Groups=[])
+
+    restored = restore_sq_of_instances()
+
+    assert restored == {"eni-i-1": ["sg-web"], "eni-i-2": ["sg-web", "sg-db"]}
+    ec2.modify_network_interface_attribute.assert_called_with(NetworkInterfaceId="eni-i-2",
+                                                              Groups=["sg-web", "sg-db"])
+    ec2.NetworkInterface.assert_not_called()
+    assert restore_sq_of_instances() == {}
+
+
+@patch('chaosk8s_wix.get_aws_credentials')
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_sg_id_cache_is_keyed_by_credentials(boto_client, get_aws_credentials):
+    get_aws_credentials.side_effect = lambda secrets: secrets["vault"]
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    ec2.describe_security_groups.side_effect = [{'SecurityGroups': [{'GroupId': "sg-a"}]},
+                                                {'SecurityGroups': [{'GroupId': "sg-b"}]}]
+    account_a = {"AWS_REGION": "us-east-1", "vault": {"aws_access_key_id": "a", "aws_secret_access_key": "a"}}
+    account_b = {"AWS_REGION": "us-east-1", "vault": {"aws_access_key_id": "b", "aws_secret_access_key": "b"}}
+
+    assert get_sg_id_by_name("chaos_test_sg", account_a) == "sg-a"
+    assert get_sg_id_by_name("chaos_test_sg", account_b) == "sg-b"
+    assert get_sg_id_by_name("chaos_test_sg", account_a) == "sg-a"
+    assert ec2.describe_security_groups.call_count == 2
+
+
+@patch('chaosk8s_wix.aws.time.sleep')
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_attach_sq_does_not_retry_other_errors(boto_client, sleep):
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    boto_client.resource.return_value = ec2
+    ec2.describe_security_groups.return_value = {'SecurityGroups': [{'GroupId': "sg-chaos"}]}
+    instance, interface = create_instance_with_interface("i-1", ["sg-web"])
+    ec2.instances.filter.return_value = [instance]
+    ec2.modify_network_interface_attribute.side_effect = ClientError(
+        {"Error": {"Code": "InvalidGroup.NotFound"}}, "ModifyNetworkInterfaceAttribute")
+
+    with pytest.raises(ClientError):
+        attach_sq_to_instance_by_tag(tag_name="under_chaostest", sg_name="chaos_test_sg")
+    sleep.assert_not_called()
+
+
+def create_ready_node(name, ready="True"):
+    node = create_node_object(name)
+    node.status.conditions = [k8sClient.V1NodeCondition(type="Ready", status=ready)]
+    return node
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.aws.actions.watch')
+@patch('chaosk8s_wix.aws.actions.client')
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_terminate_instances_by_tag_waits_for_replacement(boto_client, client, watch, has_conf):
+    has_conf.return_value = False
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    ec2.describe_instances.return_value = describe_instances_response(
+        create_instance_description("i-0", "node1", "10.0.0.1", tags=["under_chaostest"]),
+        create_instance_description("i-1", "node2", "10.0.0.2", tags=["under_chaostest"]),
+        create_instance_description("i-2", "node5", "10.0.0.5", tags=["under_chaostest"]))
+
+    v1 = MagicMock()
+    client.CoreV1Api.return_value = v1
+    v1.list_node.side_effect = [
+        k8sClient.V1NodeList(items=[create_ready_node("node1"), create_ready_node("node2")]),
+        k8sClient.V1NodeList(items=[create_ready_node("node1", "False")],
+                             metadata=k8sClient.V1ListMeta(resource_version="7"))
+    ]
+    watch.Watch.return_value.stream.return_value = [
+        {"type": "ADDED", "object": create_ready_node("node3", "False")},
+        {"type": "MODIFIED", "object": create_ready_node("node3")},
+        {"type": "ADDED", "object": create_ready_node("node4")}
+    ]
+
+    result = terminate_instances_by_tag("under_chaostest", count=2, wait=True, wait_for_replacement=True,
+                                        secrets={"KUBERNETES_CONTEXT": "dc1"})
+
+    assert ec2.describe_instances.call_args[1]["Filters"] == [
+        {'Name': 'tag:under_chaostest', 'Values': ["under_chaostest"]},
+        {'Name': 'instance-state-name', 'Values': ["running"]},
+        {'Name': 'tag:KubernetesCluster', 'Values': ["dc1.k8s.wixprod.net"]}]
+    ec2.terminate_instances.assert_called_once_with(InstanceIds=["i-0", "i-1"])
+    ec2.get_waiter.assert_called_once_with('instance_terminated')
+    ec2.get_waiter.return_value.wait.assert_called_once_with(InstanceIds=["i-0", "i-1"], WaiterConfig=ANY)
+    assert result["instances"] == ["i-0", "i-1"]
+    assert result["time_to_terminated"] >= 0
+    assert result["time_to_replacement_ready"] >= result["time_to_terminated"]
+    watch.Watch.return_value.stop.assert_called_once_with()
+
+
+@patch('chaosk8s_wix.aws.actions.client')
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_terminate_instances_by_tag_without_instances(boto_client, client):
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    ec2.describe_instances.return_value = describe_instances_response()
+
+    result = terminate_instances_by_tag("under_chaostest", count=3, secrets={})
+
+    assert result["instances"] == []
+    ec2.terminate_instances.assert_not_called()
+    client.CoreV1Api.assert_not_called()
+
+
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_terminate_instances_by_tag_stops_reading_pages_at_count(boto_client):
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    first_page = describe_instances_response(
+        *[create_instance_description("i-{}".format(i), "node{}".format(i), "10.0.0.{}".format(i),
+                                      tags=["under_chaostest"]) for i in range(5)])
+    first_page["NextToken"] = "next"
+    ec2.describe_instances.side_effect = [first_page, describe_instances_response(
+        create_instance_description("i-9", "node9", "10.0.0.9", tags=["under_chaostest"]))]
+
+    result = terminate_instances_by_tag("under_chaostest", count=2, secrets={})
+
+    assert result["instances"] == ["i-0", "i-1"]
+    ec2.describe_instances.assert_called_once()
+    assert ec2.describe_instances.call_args[1]["MaxResults"] == 5
+    ec2.terminate_instances.assert_called_once_with(InstanceIds=["i-0", "i-1"])
+
+
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_terminate_instance_by_tag_describes_right_before_terminating(boto_client):
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    ec2.describe_instances.return_value = describe_instances_response(
+        create_instance_description("i-1", "node1", "10.0.0.1", tags=["under_chaostest"]))
+
+    terminate_instance_by_tag("under_chaostest", secrets={"KUBERNETES_CONTEXT": "dc1"})
+    ec2.describe_instances.return_value = describe_instances_response()
+    assert terminate_instance_by_tag("under_chaostest", secrets={"KUBERNETES_CONTEXT": "dc1"}) is None
+
+    assert ec2.describe_instances.call_count == 2
+    assert {'Name': 'instance-state-name', 'Values': ["running"]} in ec2.describe_instances.call_args[1]["Filters"]
+    ec2.terminate_instances.assert_called_once_with(InstanceIds=["i-1"])
+
+
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_remove_tag_from_aws_instances_pages_chunks_and_keeps_configuration(boto_client):
+    ec2 = MagicMock()
+    boto_client.client.return_value = ec2
+    first_page = [{'InstanceId': "i-{}".format(i)} for i in range(1000)]
+    second_page = [{'InstanceId': "i-{}".format(i)} for i in range(1000, 1500)]
+    ec2.describe_instances.side_effect = lambda **kwargs: \
+        {'Reservations': [{'Instances': second_page}]} if "NextToken" in kwargs else \
+        {'Reservations': [{'Instances': first_page}], 'NextToken': 'next'}
+    config = {"aws-instance-filters": [{'Name': 'tag:env', 'Values': ['test']}]}
+
+    remove_tag_from_aws_instances(config, "test_tag")
+    remove_tag_from_aws_instances(config, "test_tag")
+
+    assert config["aws-instance-filters"] == [{'Name': 'tag:env', 'Values': ['test']}]
+    assert ec2.describe_instances.call_count == 4
+    assert ec2.describe_instances.call_args[1]["Filters"] == [
+        {'Name': 'tag:env', 'Values': ['test']}, {'Name': 'tag:test_tag', 'Values': ['test_tag']}]
+    assert ec2.delete_tags.call_count == 4
+    first_call, second_call = ec2.delete_tags.call_args_list[:2]
+    assert len(first_call[1]["Resources"]) == 1000
+    assert second_call[1]["Resources"] == ["i-{}".format(i) for i in range(1000, 1500)]
+    assert second_call[1]["Tags"] == [{"Key": "test_tag"}]
+
+
+def test_node_instance_inventory_joins_nodes_and_instances():
+    node1 = create_node_object("node1")
+    node2 = create_node_object("node2")
+    node2.status.addresses = [k8sClient.V1NodeAddress(type="InternalIP", address="10.0.0.2")]
+    v1 = MagicMock()
+    v1.list_node.return_value = k8sClient.V1NodeList(items=[node1, node2])
+    ec2 = MagicMock()
+    ec2.describe_instances.return_value = {'Reservations': [{'Instances': [
+        {'InstanceId': "i-1", 'PrivateDnsName': 'node1', 'PrivateIpAddress': '10.0.0.1'},
+        {'InstanceId': "i-2", 'PrivateDnsName': 'ip-10-0-0-2.internal', 'PrivateIpAddress': '10.0.0.2'}
+    ]}]}
+
+    inventory = get_node_instance_inventory(v1, ec2)
+
+    assert inventory["node1"] is inventory["i-1"] is inventory["10.0.0.1"]
+    assert inventory["node2"]["instance_id"] == "i-2"
+    assert inventory["10.0.0.2"]["node_name"] == "node2"
+    assert inventory["ip-10-0-0-2.internal"]["private_ip"] == "10.0.0.2"
+
+    get_node_instance_inventory(v1, ec2)
+    assert v1.list_node.call_count == 1
+    assert ec2.describe_instances.call_count == 1
+
+    found = lookup_node_instances(ec2, ["node2", "i-1"])
+    assert found["node2"]["instance_id"] == "i-2"
+    assert ec2.describe_instances.call_count == 1
+
+    ec2.describe_instances.return_value = {'Reservations': [{'Instances': [
+        {'InstanceId': "i-3", 'PrivateDnsName': 'node3', 'PrivateIpAddress': '10.0.0.3'}
+    ]}]}
+    found = lookup_node_instances(ec2, ["10.0.0.3", "i-1"])
+    assert found["10.0.0.3"]["instance_id"] == "i-3"
+    assert ec2.describe_instances.call_args[1]["Filters"] == [
+        {'Name': 'instance-state-name', 'Values': ["pending", "running", "stopping", "stopped"]},
+        {'Name': 'private-ip-address', 'Values': ["10.0.0.3"]}]
+    assert lookup_node_instances(ec2, ["node3"])["node3"]["instance_id"] == "i-3"
+    assert ec2.describe_instances.call_count == 2
+
+
+def test_lookup_node_instances_refreshes_stale_entries_by_instance_id():
+    node2 = create_node_object("node2")
+    node2.status.addresses = [k8sClient.V1NodeAddress(type="InternalIP", address="10.0.0.2")]
+    v1 = MagicMock()
+    v1.list_node.return_value = k8sClient.V1NodeList(items=[node2])
+    ec2 = MagicMock()
+    ec2.describe_instances.return_value = {'Reservations': [{'Instances': [
+        {'InstanceId': "i-2", 'PrivateDnsName': 'ip-10-0-0-2.internal', 'PrivateIpAddress': '10.0.0.2'}
+    ]}]}
+    get_node_instance_inventory(v1, ec2)
+
+    found = lookup_node_instances(ec2, ["node2"], ttl=0)
+
+    assert found["node2"]["instance_id"] == "i-2"
+    assert found["node2"]["node_name"] == "node2"
+    assert ec2.describe_instances.call_args[1]["Filters"][-1] == {'Name': 'instance-id', 'Values': ["i-2"]}
+    assert lookup_node_instances(ec2, ["node2"])["node2"] is found["node2"]
+    assert ec2.describe_instances.call_count == 2
+
+
+def test_lookup_node_instances_skips_terminated_instance_with_reused_ip():
+    ec2 = MagicMock()
+    ec2.describe_instances.return_value = {'Reservations': [{'Instances': [
+        {'InstanceId': "i-live", 'PrivateDnsName': 'ip-10-0-0-5.internal', 'PrivateIpAddress': '10.0.0.5',
+         'State': {'Name': 'running'}},
+        {'InstanceId': "i-dead", 'PrivateDnsName': 'ip-10-0-0-5.internal', 'PrivateIpAddress': '10.0.0.5',
+         'State': {'Name': 'terminated'}}
+    ]}]}
+
+    found = lookup_node_instances(ec2, ["ip-10-0-0-5.internal"])
+
+    assert found["ip-10-0-0-5.internal"]["instance_id"] == "i-live"
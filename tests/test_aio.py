@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import io
+from unittest.mock import MagicMock, patch
+
+from chaosk8s_wix import aio
+
+
+def test_async_list_pods_in_namespaces():
+    pod1 = MagicMock()
+    pod2 = MagicMock()
+    v1 = MagicMock()
+    v1.list_namespaced_pod.side_effect = lambda ns, **kwargs: MagicMock(
+        items=[pod1] if ns == "ns1" else [pod2])
+
+    pods = aio.run(aio.async_list_pods_in_namespaces(
+        v1, ["ns1", "ns2"], label_selector="app=web"))
+
+    assert pods == [pod1, pod2]
+    v1.list_namespaced_pod.assert_any_call("ns1", label_selector="app=web")
+    v1.list_namespaced_pod.assert_any_call("ns2", label_selector="app=web")
+
+
+def test_async_read_pods_logs():
+    v1 = MagicMock()
+    v1.read_namespaced_pod_log.side_effect = lambda name, **kwargs: io.BytesIO(
+        name.encode('utf-8'))
+
+    logs = aio.run(aio.async_read_pods_logs(v1, ["pod1", "pod2"], "default",
+                                            timestamps=True))
+
+    assert logs == {"pod1": "pod1", "pod2": "pod2"}
+    v1.read_namespaced_pod_log.assert_any_call(
+        "pod1", namespace="default", timestamps=True, _preload_content=False)
+
+
+def test_gather_limited_keeps_order():
+    v1 = MagicMock()
+    v1.patch_node.side_effect = lambda name, body: name
+
+    results = aio.run(aio.gather_limited(
+        [aio.async_patch_node(v1, name, {}) for name in ["node1", "node2"]],
+        limit=1))
+
+    assert results == ["node1", "node2"]
+
+
+@patch('chaosk8s_wix.aio.create_k8s_api_client', autospec=True)
+def test_shared_api_client_is_created_once_per_cluster(create_client):
+    create_client.side_effect = lambda secrets, pool_maxsize: MagicMock()
+
+    api1 = aio.get_shared_api_client({"KUBERNETES_CONTEXT": "42"})
+    api2 = aio.get_shared_api_client({"KUBERNETES_CONTEXT": "42"})
+    api3 = aio.get_shared_api_client({"KUBERNETES_CONTEXT": "84"})
+
+    assert api1 is api2
+    assert api1 is not api3
+    assert create_client.call_count == 2
+    create_client.assert_called_with({"KUBERNETES_CONTEXT": "84"},
+                                     pool_maxsize=aio.AIO_MAX_WORKERS)
+
+
+@patch('chaosk8s_wix.aio.time')
+@patch('chaosk8s_wix.aio.create_k8s_api_client', autospec=True)
+def test_shared_api_client_is_keyed_by_credentials_and_expires(create_client, time):
+    create_client.side_effect = lambda secrets, pool_maxsize: MagicMock()
+    time.time.return_value = 1000
+    secrets = {"KUBERNETES_CONTEXT": "42", "NASA_TOKEN": "token1"}
+
+    api1 = aio.get_shared_api_client(secrets)
+    api2 = aio.get_shared_api_client(dict(secrets, NASA_TOKEN="token2"))
+    assert api1 is not api2
+    assert aio.get_shared_api_client(secrets) is api1
+
+    time.time.return_value = 1000 + aio.AIO_API_CLIENT_TTL + 1
+    assert aio.get_shared_api_client(secrets) is not api1
+    assert create_client.call_count == 3
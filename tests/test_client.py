@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 import os
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
 from kubernetes import client, config
 import pytest
 
-from chaosk8s_wix import create_k8s_api_client
+from chaosk8s_wix import create_k8s_api_client, create_aws_client, create_aws_resource, \
+    get_kube_secret_from_production, VAULT_TIMEOUT, AWS_NO_CREDENTIALS_TTL
 
 # Managing kube config through env vars or local configurations is complicated because it requires addtional
 # integrations on local machines and on task executors in cloud
@@ -67,3 +68,49 @@ def Xtest_client_can_provide_a_context(cfg, has_conf):
         cfg.new_client_from_config.assert_called_with(context="minikube")
     finally:
         os.environ.pop("KUBERNETES_CONTEXT", None)
+
+
+@patch('chaosk8s_wix.get_kube_secret_from_production')
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_aws_clients_are_cached_per_credentials_and_service(boto, gks):
+    gks.return_value = {'aws_access_key_id': 'key', 'aws_secret_access_key': 'secret'}
+    boto.client.side_effect = lambda service, **kwargs: MagicMock(name=service)
+
+    ec2 = create_aws_client({"AWS_REGION": "us-east-1"}, 'ec2')
+
+    assert create_aws_client({"AWS_REGION": "us-east-1"}, 'ec2') is ec2
+    assert create_aws_client({"AWS_REGION": "us-east-1"}, 's3') is not ec2
+    assert create_aws_client({"AWS_REGION": "eu-west-1"}, 'ec2') is not ec2
+    boto.client.assert_any_call('ec2', aws_access_key_id='key', aws_secret_access_key='secret',
+                                region_name='us-east-1')
+    assert boto.client.call_count == 3
+    assert gks.call_count == 1
+
+    create_aws_resource({"AWS_REGION": "us-east-1"}, 'ec2')
+    boto.resource.assert_called_once_with('ec2', aws_access_key_id='key', aws_secret_access_key='secret',
+                                          region_name='us-east-1')
+
+
+@patch('chaosk8s_wix.requests.get')
+def test_vault_requests_have_timeout(get):
+    get.return_value.content = b'{"token": "secret"}'
+
+    assert get_kube_secret_from_production("http://vault/grafana", "token") == {"token": "secret"}
+    get.assert_called_once_with("http://vault/grafana", headers=ANY, timeout=VAULT_TIMEOUT)
+
+
+@patch('chaosk8s_wix.time')
+@patch('chaosk8s_wix.get_kube_secret_from_production')
+@patch('chaosk8s_wix.boto3', autospec=True)
+def test_aws_clients_cache_missing_vault_credentials(boto, gks, time):
+    gks.return_value = None
+    time.time.return_value = 1000
+
+    create_aws_client({"AWS_REGION": "us-east-1"}, 'ec2')
+    create_aws_client({"AWS_REGION": "us-east-1"}, 's3')
+    assert gks.call_count == 1
+    boto.client.assert_called_with('s3', region_name='us-east-1')
+
+    time.time.return_value = 1000 + AWS_NO_CREDENTIALS_TTL + 1
+    create_aws_client({"AWS_REGION": "us-east-1"}, 'ec2')
+    assert gks.call_count == 2
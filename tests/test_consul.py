@@ -2,7 +2,9 @@
 import io
 from unittest.mock import MagicMock, patch, ANY
 import pytest
-from chaosk8s_wix.consul.probes import get_good_nodes, check_quorum
+import requests
+import responses
+from chaosk8s_wix.consul.probes import get_good_nodes, check_quorum, wait_for_quorum
 from chaosk8s_wix.consul.actions import damage_quorum
 
 class FakeNode(object):
@@ -35,4 +37,77 @@ def test_get_good_nodes_only_1():
 # def test_kill_service_instances():
 #     configuration = {'consul_host': 'sys-consul0a.96.wixprod.net'}
 #     check_quorum(service_name='com.wixpress.example.k8s-canary-dpl',dc='42',configuration=configuration)
-#     damage_quorum(service_name='com.wixpress.example.k8s-canary-dpl',dc='42' ,num_of_instances_to_kill=3,seconds_to_be_dead=130,configuration=configuration )
\ No newline at end of file
+#     damage_quorum(service_name='com.wixpress.example.k8s-canary-dpl',dc='42' ,num_of_instances_to_kill=3,seconds_to_be_dead=130,configuration=configuration )
+
+def create_consul_nodes(passing, critical):
+    good_check = {'CheckID': 'serfHealth', 'Status': 'passing'}
+    bad_check = {'CheckID': 'serfHealth', 'Status': 'critical'}
+    return [{'Checks': [good_check]}] * passing + [{'Checks': [bad_check]}] * critical
+
+
+@patch('chaosk8s_wix.consul.probes.consul')
+def test_wait_for_quorum_follows_blocking_queries(consul_module):
+    health = consul_module.Consul.return_value.health
+    health.service.side_effect = [
+        ("10", create_consul_nodes(3, 0)),
+        ("12", create_consul_nodes(2, 1)),
+        ("15", create_consul_nodes(1, 2))
+    ]
+
+    result = wait_for_quorum(dc='42', service_name='com.wixpress.example', quorum=False, timeout=30,
+                             configuration={'consul_host': 'consul'})
+
+    assert result["quorum"] is False
+    assert result["elapsed"] >= 0
+    assert result["flipped_at"] is not None
+    assert health.service.call_count == 3
+    health.service.assert_any_call('com--wixpress--example', dc='42', index=None, wait=ANY)
+    health.service.assert_called_with('com--wixpress--example', dc='42', index="12", wait=ANY)
+
+
+@patch('chaosk8s_wix.consul.probes.consul')
+def test_wait_for_quorum_already_in_state(consul_module):
+    health = consul_module.Consul.return_value.health
+    health.service.return_value = ("10", create_consul_nodes(3, 0))
+
+    result = wait_for_quorum(dc='42', service_name='example', quorum=True, configuration={'consul_host': 'consul'})
+
+    assert result == {"quorum": True, "flipped_at": None, "elapsed": None}
+    assert health.service.call_count == 1
+
+
+@patch('chaosk8s_wix.consul.probes.time')
+@patch('chaosk8s_wix.consul.probes.consul')
+def test_wait_for_quorum_times_out(consul_module, fake_time):
+    fake_time.time.side_effect = [0, 5, 10, 15, 31]
+    health = consul_module.Consul.return_value.health
+    health.service.return_value = ("10", create_consul_nodes(3, 0))
+
+    result = wait_for_quorum(dc='42', service_name='example', quorum=False, timeout=30,
+                             configuration={'consul_host': 'consul'})
+
+    assert result["quorum"] is True
+    assert result["flipped_at"] is None
+    assert health.service.call_count == 2
+
+
+@responses.activate
+@patch('chaosk8s_wix.consul.actions.consul')
+def test_damage_quorum_kills_instances_concurrently(consul_module):
+    nodes = [{'ServiceAddress': '10.0.0.{}'.format(i), 'ServicePort': 8080} for i in range(4)]
+    consul_module.Consul.return_value.catalog.service.return_value = ("1", nodes)
+    responses.add(responses.PUT, "http://10.0.0.0:8080/health/play_dead/30", status=200)
+    responses.add(responses.PUT, "http://10.0.0.1:8080/health/play_dead/30", status=500)
+    responses.add(responses.PUT, "http://10.0.0.2:8080/health/play_dead/30",
+                  body=requests.exceptions.ConnectTimeout("timed out"))
+
+    result = damage_quorum(service_name='com.wixpress.example', dc='42', num_of_instances_to_kill=3,
+                           seconds_to_be_dead=30, configuration={'consul_host': 'consul'})
+
+    assert sorted(result.keys()) == ['10.0.0.0:8080', '10.0.0.1:8080', '10.0.0.2:8080']
+    assert result['10.0.0.0:8080']["status"] == 200
+    assert result['10.0.0.1:8080']["status"] == 500
+    assert result['10.0.0.2:8080']["status"] is None
+    assert "timed out" in result['10.0.0.2:8080']["error"]
+    assert len(responses.calls) == 3
+    consul_module.Consul.return_value.catalog.service.assert_called_once_with('com--wixpress--example', dc='42')
@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
 
-from chaosk8s_wix.grafana.probes import check_no_alert_for_dashboard,check_service_uppness
+from chaosk8s_wix.grafana.probes import check_no_alert_for_dashboard,check_service_uppness, \
+    check_services_uppness, check_no_alert_for_dashboards, get_services_uppness
+from chaosk8s_wix.grafana.analysis import find_spikes, find_spikes_in_arrays
+from chaosk8s_wix.grafana.stream import iter_render_series
+from chaosk8s_wix.grafana import get_grafana_token
+from array import array
+import math
 from unittest.mock import MagicMock, patch
+import pytest
 import json
 import responses
 import os.path
+from urllib.parse import parse_qs, urlparse
 
 fake_nasa_url = "http://fakenasa.com/secrets"
 fake_grafana_url = "http://fakegrafana.com/"
@@ -94,4 +102,179 @@ def test_check_service_uppness_is_up_fails():
     }
 
     retval = check_service_uppness("some_service",configuration=secret_and_config, secrets=secret_and_config, time_interval_seconds=300, allowed_results=[200] )
-    assert retval == False
\ No newline at end of file
+    assert retval == False
+
+@responses.activate
+def test_check_services_uppness_renders_all_services_in_one_request():
+    services = ["service_{}".format(i) for i in range(10)]
+    series = [{'target': service, 'datapoints': [(200, 123456)]} for service in services]
+    series[3]['datapoints'].append((503, 123457))
+    responses.add(responses.GET, os.path.join(fake_nasa_url, "grafana"),
+                  json={'token': 'FAKE_TOKEN'}, status=200)
+    responses.add(responses.GET, os.path.join(fake_grafana_url, "api/datasources/proxy/1/render"),
+                  json=series[:9], status=200)
+
+    secret_and_config = {
+        "NASA_SECRETS_URL": fake_nasa_url,
+        "NASA_TOKEN": "fake_token",
+        "grafana_host": fake_grafana_url
+    }
+
+    retval = get_services_uppness(services, configuration=secret_and_config, secrets=secret_and_config,
+                                  allowed_results=[200])
+
+    assert retval == dict((service, service not in ["service_3", "service_9"]) for service in services)
+    render_calls = [call.request for call in responses.calls if call.request.url.startswith(fake_grafana_url)]
+    assert len(render_calls) == 1
+    assert render_calls[0].headers["Authorization"] == "Bearer FAKE_TOKEN"
+    query = parse_qs(urlparse(render_calls[0].url).query)
+    assert len(query["target"]) == 10
+    assert query["target"][0].startswith("alias(movingMedian(")
+    assert query["target"][0].endswith("'service_0')")
+
+
+@responses.activate
+def test_check_services_uppness_splits_long_queries():
+    services = ["service_{}".format(i) for i in range(10)]
+    responses.add(responses.GET, os.path.join(fake_grafana_url, "api/datasources/proxy/1/render"),
+                  json=[{'target': service, 'datapoints': [(200, 123456)]} for service in services], status=200)
+
+    configuration = {"grafana_host": fake_grafana_url}
+    with patch("chaosk8s_wix.grafana.probes.RENDER_MAX_QUERY_LENGTH", 600):
+        assert check_services_uppness(services, configuration=configuration, secrets={},
+                                      allowed_results=[200])
+
+    render_calls = [call.request for call in responses.calls]
+    assert len(render_calls) > 1
+    assert sum(len(parse_qs(urlparse(r.url).query)["target"]) for r in render_calls) == 10
+
+
+@responses.activate
+def test_check_no_alert_for_dashboards_fails_when_one_has_alerts():
+    responses.add(responses.GET, os.path.join(fake_nasa_url, "grafana"),
+                  json={'token': 'FAKE_TOKEN'}, status=200)
+    responses.add(responses.GET, os.path.join(fake_grafana_url, "api/alerts?dashboardId=2&state=alerting"),
+                  json=[{'evalData': {'evalMatches': [{'tags': {}}]}}], status=200)
+    responses.add(responses.GET, os.path.join(fake_grafana_url, "api/alerts"),
+                  json=[], status=200)
+
+    secret_and_config = {
+        "NASA_SECRETS_URL": fake_nasa_url,
+        "NASA_TOKEN": "fake_token",
+        "grafana_host": fake_grafana_url
+    }
+
+    assert check_no_alert_for_dashboards([1, 3], configuration=secret_and_config, secrets=secret_and_config)
+    assert not check_no_alert_for_dashboards([1, 2, 3], configuration=secret_and_config,
+                                             secrets=secret_and_config)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def analysis_backend(request):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        yield
+    else:
+        with patch("chaosk8s_wix.grafana.analysis.np", None):
+            yield
+
+
+def test_find_spikes_allowed_results(analysis_backend):
+    datapoints = [(200, 10), (None, 20), (503, 30), (200, 40)]
+
+    assert find_spikes(datapoints, allowed_results=[200]) == {"allowed_results": 2}
+    assert find_spikes(datapoints, allowed_results=[200, None]) == {"allowed_results": 1}
+    assert find_spikes(datapoints, allowed_results=[200, 503, None]) == {}
+    assert find_spikes([], allowed_results=[200]) == {}
+
+
+def test_find_spikes_thresholds(analysis_backend):
+    datapoints = [(1, 0), (2, 10), (None, 20), (None, 30), (None, 40), (50, 50), (3, 60), (2, 70)]
+
+    violations = find_spikes(datapoints, min_value=2, max_value=10, percentile=50, max_percentile_value=1.5,
+                             moving_median_window=3, max_moving_median=2.5, max_rate_of_change=1,
+                             max_null_gap=2)
+
+    assert violations == {"min_value": 1, "max_value": 1, "percentile": 1, "moving_median": 2,
+                          "rate_of_change": 2, "null_gap": 1}
+    assert find_spikes(datapoints, max_null_gap=3, percentile=50, max_percentile_value=3) == {}
+
+
+@responses.activate
+def test_check_service_uppness_with_thresholds():
+    requests_obj = [{'datapoints': [(200, 10), (None, 20), (None, 30), (200, 40)]}]
+    responses.add(responses.GET, os.path.join(fake_nasa_url, "grafana"),
+                  json={'token': 'FAKE_TOKEN'}, status=200)
+    responses.add(responses.GET, os.path.join(fake_grafana_url, "api/datasources/proxy/1/render"),
+                  json=requests_obj, status=200)
+
+    secret_and_config = {
+        "NASA_SECRETS_URL": fake_nasa_url,
+        "NASA_TOKEN": "fake_token",
+        "grafana_host": fake_grafana_url
+    }
+
+    assert check_service_uppness("some_service", allowed_results=[200, None], configuration=secret_and_config,
+                                 secrets=secret_and_config, thresholds={"max_null_gap": 2})
+    assert not check_service_uppness("some_service", allowed_results=[200, None],
+                                     configuration=secret_and_config, secrets=secret_and_config,
+                                     thresholds={"max_null_gap": 1})
+
+
+RENDER_BODY = json.dumps([
+    {"target": "service_é", "tags": {"name": "x", "step": 10},
+     "datapoints": [[200, 1500000000], [None, 1500000010], [1.5e2, 1500000020], [-3, 1500000030]]},
+    {"datapoints": [], "target": "empty", "step": 12345},
+    {"target": "last", "datapoints": [[503.25, 1500000040]]}
+], indent=1).encode("utf-8")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, len(RENDER_BODY)])
+def test_iter_render_series_matches_json(chunk_size):
+    chunks = [RENDER_BODY[i:i + chunk_size] for i in range(0, len(RENDER_BODY), chunk_size)]
+
+    series = list(iter_render_series(chunks))
+
+    expected = json.loads(RENDER_BODY.decode("utf-8"))
+    assert [s["target"] for s in series] == ["service_é", "empty", "last"]
+    assert series[0]["tags"] == {"name": "x", "step": 10}
+    assert series[1]["step"] == 12345
+    for parsed, original in zip(series, expected):
+        assert len(parsed["values"]) == len(original["datapoints"])
+        for value, timestamp, datapoint in zip(parsed["values"], parsed["timestamps"], original["datapoints"]):
+            if datapoint[0] is None:
+                assert math.isnan(value)
+            else:
+                assert value == datapoint[0]
+            assert timestamp == datapoint[1]
+
+
+def test_iter_render_series_without_numpy():
+    with patch("chaosk8s_wix.grafana.stream.np", None):
+        series = list(iter_render_series([RENDER_BODY]))
+
+    assert isinstance(series[0]["values"], array)
+    assert find_spikes_in_arrays(series[0]["values"], series[0]["timestamps"], allowed_results=[200]) == \
+        {"allowed_results": 3}
+
+
+def test_iter_render_series_handles_empty_and_malformed_bodies():
+    assert list(iter_render_series([])) == []
+    assert list(iter_render_series([b"[]"])) == []
+    with pytest.raises(ValueError):
+        list(iter_render_series([b'[{"target": "a", "datapoints": [[1, 2], [oops']))
+    with pytest.raises(ValueError):
+        list(iter_render_series([b'[{"target": "a", "datapoints": [[1, oops]]}]']))
+    with pytest.raises(ValueError):
+        list(iter_render_series([b'[{"target": "a", "datapoints": [[1, 2], [3]]}]']))
+
+
+@patch('chaosk8s_wix.grafana.get_kube_secret_from_production')
+def test_get_grafana_token_caches_env_fallback(gks):
+    gks.return_value = None
+    secrets = {"NASA_SECRETS_URL": fake_nasa_url, "NASA_TOKEN": "nasa", "GRAFANA_TOKEN": "fallback"}
+
+    assert get_grafana_token(secrets) == "fallback"
+    assert get_grafana_token(secrets) == "fallback"
+    assert get_grafana_token(dict(secrets, GRAFANA_TOKEN="other")) == "other"
+    assert gks.call_count == 2
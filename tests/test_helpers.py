@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 
-from chaosk8s_wix.node import node_should_be_ignored_by_taints, is_equal_V1Taint, load_taint_list_from_dict
+from chaosk8s_wix.node import node_should_be_ignored_by_taints, is_equal_V1Taint, load_taint_list_from_dict, \
+    labels_match_selector
 
 import json
 from kubernetes import client
@@ -62,3 +63,15 @@ def test_is_equal_v1taint_ok():
 
 
 
+
+
+def test_labels_match_selector():
+    labels = {"role": "worker", "beta.kubernetes.io/instance-type": "m5.large"}
+    assert labels_match_selector(labels, "") is True
+    assert labels_match_selector(labels, "role=worker") is True
+    assert labels_match_selector(labels, "role==worker, beta.kubernetes.io/instance-type") is True
+    assert labels_match_selector(labels, "role!=worker") is False
+    assert labels_match_selector(labels, "role in (master, worker)") is True
+    assert labels_match_selector(labels, "role notin (master, worker)") is False
+    assert labels_match_selector(labels, "!dedicated") is True
+    assert labels_match_selector(None, "role") is False
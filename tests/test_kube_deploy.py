@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
-from chaosk8s_wix.actions import deploy_objects_in_random_namespace
+from chaosk8s_wix.actions import deploy_objects_in_random_namespace, deploy_objects_in_namespace, get_deploy_stages, \
+    load_manifest, deploy_single_obj, get_random_namespace, DEPLOY_ORDER, DEPLOY_RESOURCES
+from jinja2 import Template
 from unittest.mock import MagicMock, patch
 from os import path
+import os
 
 fixtures = 'tests/fixtures'
 
@@ -96,3 +99,170 @@ def test_deploy_deployment_single_from_jinja(client, has_conf):
     deploy_objects_in_random_namespace(path.join(fixtures, 'pod.yaml'),configuration,secrets)
     assert v1.create_namespaced_pod.call_count == 1
 
+
+
+def test_get_deploy_stages():
+    objects = [{"kind": "Deployment", "metadata": {"name": "d1"}},
+               {"kind": "Service"},
+               {"kind": "Pod"},
+               {"kind": "ConfigMap"},
+               {"kind": "Namespace"}]
+
+    stages = get_deploy_stages(objects)
+
+    assert [[o["kind"] for o in stage] for stage in stages] == [
+        ["Namespace"], ["ConfigMap"], ["Service"], ["Deployment", "Pod"]]
+
+
+@patch('chaosk8s_wix.aio.create_k8s_api_client', autospec=True)
+@patch('chaosk8s_wix.actions.client')
+def test_deploy_objects_in_namespace_reuses_api_client(client, create_client):
+    v1Beta1 = MagicMock()
+    client.AppsV1beta1Api.return_value = v1Beta1
+
+    deploy_objects_in_namespace(path.join(fixtures, 'deployment_list.json'), "ns1")
+
+    create_client.assert_called_once()
+    assert v1Beta1.create_namespaced_deployment.call_count == 2
+
+
+def test_load_manifest_is_cached_until_file_changes(tmp_path):
+    spec_path = str(tmp_path / "pods.yaml.jinja")
+    with open(spec_path, "w") as f:
+        f.write("{% for ndx in range(count) %}\n---\nkind: Pod\nmetadata:\n  name: pod-{{ ndx }}\n{% endfor %}\n")
+
+    with patch('chaosk8s_wix.actions.Template', wraps=Template) as template:
+        pods = load_manifest(spec_path, {"count": 2})
+        assert [p["metadata"]["name"] for p in pods] == ["pod-0", "pod-1"]
+
+        pods[0]["metadata"]["name"] = "changed"
+        assert load_manifest(spec_path, {"count": 2})[0]["metadata"]["name"] == "pod-0"
+        assert len(load_manifest(spec_path, {"count": 3})) == 3
+        assert template.call_count == 1
+
+        os.utime(spec_path, (0, 0))
+        assert len(load_manifest(spec_path, {"count": 2})) == 2
+        assert template.call_count == 2
+
+
+@patch('chaosk8s_wix.actions.client')
+def test_deploy_single_obj_dispatches_by_api_version_and_kind(client):
+    core_v1 = MagicMock()
+    client.CoreV1Api.return_value = core_v1
+    batch_v1 = MagicMock()
+    client.BatchV1Api.return_value = batch_v1
+    api = MagicMock()
+
+    service = {"apiVersion": "v1", "kind": "Service", "metadata": {"name": "svc"}}
+    job = {"apiVersion": "batch/v1", "kind": "Job", "metadata": {"name": "job"}}
+    deploy_single_obj(None, "ns1", service, api=api)
+    deploy_single_obj(None, "ns1", job, api=api)
+
+    core_v1.create_namespaced_service.assert_called_once_with("ns1", body=service)
+    batch_v1.create_namespaced_job.assert_called_once_with("ns1", body=job)
+    assert deploy_single_obj(None, "ns1", {"apiVersion": "v9", "kind": "Pod"}, api=api) is None
+
+
+def test_deploy_single_obj_server_side_apply():
+    api = MagicMock()
+    config_map = {"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": "conf"}}
+    stateful_set = {"apiVersion": "apps/v1", "kind": "StatefulSet", "metadata": {"name": "db"}}
+
+    deploy_single_obj(None, "ns1", config_map, api=api, apply=True)
+    deploy_single_obj(None, "ns1", stateful_set, api=api, apply=True)
+
+    paths = [c[0][0] for c in api.call_api.call_args_list]
+    assert paths == ["/api/v1/namespaces/{namespace}/configmaps/{name}",
+                     "/apis/apps/v1/namespaces/{namespace}/statefulsets/{name}"]
+    args, kwargs = api.call_api.call_args
+    assert args[1] == "PATCH"
+    assert kwargs["path_params"] == {"namespace": "ns1", "name": "db"}
+    assert kwargs["header_params"]["Content-Type"] == "application/apply-patch+yaml"
+    assert ("force", "true") in kwargs["query_params"]
+
+
+@patch('chaosk8s_wix.actions.client')
+def test_deploy_single_obj_creates_cluster_scoped_and_staged_kinds(client):
+    core_v1 = MagicMock()
+    client.CoreV1Api.return_value = core_v1
+    rbac_v1 = MagicMock()
+    client.RbacAuthorizationV1Api.return_value = rbac_v1
+    api = MagicMock()
+
+    namespace = {"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": "team"}}
+    quota = {"apiVersion": "v1", "kind": "ResourceQuota", "metadata": {"name": "quota"}}
+    role = {"apiVersion": "rbac.authorization.k8s.io/v1", "kind": "Role", "metadata": {"name": "reader"}}
+    for obj in [namespace, quota, role]:
+        deploy_single_obj(None, "ns1", obj, api=api)
+
+    core_v1.create_namespace.assert_called_once_with(body=namespace)
+    core_v1.create_namespaced_resource_quota.assert_called_once_with("ns1", body=quota)
+    rbac_v1.create_namespaced_role.assert_called_once_with("ns1", body=role)
+
+    deploy_single_obj(None, "ns1", namespace, api=api, apply=True)
+    args, kwargs = api.call_api.call_args
+    assert args[0] == "/api/v1/namespaces/{name}"
+    assert kwargs["path_params"] == {"name": "team"}
+    assert "namespace" not in namespace["metadata"]
+
+
+def test_deploy_order_kinds_are_deployable():
+    deployable = {kind for _, kind in DEPLOY_RESOURCES}
+    assert set(DEPLOY_ORDER) <= deployable
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.actions.client')
+def test_get_random_namespace_uses_inventory(client, has_conf):
+    has_conf.return_value = False
+    namespaces = []
+    for name in ["ns1", "ns2", "kube-system"]:
+        ns = MagicMock()
+        ns.metadata.name = name
+        namespaces.append(ns)
+
+    v1 = MagicMock()
+    v1.list_namespace.return_value = MagicMock(items=namespaces)
+    client.CoreV1Api.return_value = v1
+
+    configuration = {"ns-ignore-list": ["kube-system", "ns2"]}
+    for i in range(5):
+        assert get_random_namespace(configuration=configuration).metadata.name == "ns1"
+    assert v1.list_namespace.call_count == 1
+
+    assert get_random_namespace(configuration={"ns-inventory-ttl": -1}) is not None
+    assert v1.list_namespace.call_count == 2
+
+    assert get_random_namespace(configuration={"ns-inventory-ttl": "3600"}) is not None
+    assert v1.list_namespace.call_count == 2
+    assert get_random_namespace(configuration={"ns-inventory-ttl": "-1"}) is not None
+    assert v1.list_namespace.call_count == 3
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.actions.client')
+def test_get_random_namespace_weighted_by_pods(client, has_conf):
+    has_conf.return_value = False
+    namespaces = []
+    for name in ["empty", "busy"]:
+        ns = MagicMock()
+        ns.metadata.name = name
+        namespaces.append(ns)
+    pod = MagicMock()
+    pod.metadata.namespace = "busy"
+
+    v1 = MagicMock()
+    v1.list_namespace.return_value = MagicMock(items=namespaces)
+    v1.list_pod_for_all_namespaces.return_value = MagicMock(items=[pod], metadata=None)
+    client.CoreV1Api.return_value = v1
+
+    configuration = {"ns-weighted-by-pods": True}
+    for i in range(5):
+        assert get_random_namespace(configuration=configuration).metadata.name == "busy"
+    assert v1.list_pod_for_all_namespaces.call_count == 1
+
+    with patch('chaosk8s_wix.namespaces.get_pod_counts', return_value={"busy": 1}) as get_pod_counts:
+        get_random_namespace(configuration={"ns-weighted-by-pods": "false"})
+        get_pod_counts.assert_not_called()
+        get_random_namespace(configuration={"ns-weighted-by-pods": "true"})
+        get_pod_counts.assert_called_once()
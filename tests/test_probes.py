@@ -14,7 +14,10 @@ import datetime
 from chaosk8s_wix.probes import all_microservices_healthy, \
     microservice_available_and_healthy, microservice_is_not_available, \
     service_endpoint_is_initialized, deployment_is_not_fully_available, \
-    read_microservices_logs, all_pods_in_all_ns_are_ok
+    read_microservices_logs, all_pods_in_all_ns_are_ok, \
+    all_microservices_healthy_multi_ns, nodes_super_healthy, nodes_super_healthy_report, \
+    get_pods_health_report, reset_incremental_pods_health, INCREMENTAL_WATCH_IDLE_TIMEOUT, \
+    all_pods_are_ok_in_multi_ns
 from chaosk8s_wix.node.probes import get_active_nodes, all_nodes_are_ok, get_nodes, \
     have_new_node, check_min_nodes_exist, get_tainted_nodes
 
@@ -508,3 +511,225 @@ def test_get_tainted_nodes_fails(cl, client, has_conf):
     resp = get_tainted_nodes(key="dedicated",value="special", effect="NoSchedule")
 
     assert 0 == len(resp)
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.probes.client', autospec=True)
+@patch('chaosk8s_wix.client')
+def test_all_microservices_healthy_multi_ns_per_namespace(cl, client, has_conf):
+    has_conf.return_value = False
+    pod = MagicMock()
+    pod.status.phase = "Running"
+
+    v1 = MagicMock()
+    v1.list_namespaced_pod.return_value = MagicMock(items=[pod])
+    client.CoreV1Api.return_value = v1
+
+    assert all_microservices_healthy_multi_ns(ns_list=["ns1", "ns2"]) is True
+    assert v1.list_namespaced_pod.call_count == 2
+    v1.list_pod_for_all_namespaces.assert_not_called()
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.probes.client', autospec=True)
+@patch('chaosk8s_wix.client')
+def test_all_microservices_healthy_multi_ns_cluster_wide(cl, client, has_conf):
+    has_conf.return_value = False
+    good_pod = create_pod_object("good", namespace="ns1")
+    good_pod.status.phase = "Running"
+    failed_pod = create_pod_object("failed", namespace="not-checked")
+    failed_pod.status.phase = "Failed"
+
+    v1 = MagicMock()
+    v1.list_pod_for_all_namespaces.side_effect = [
+        k8sClient.V1PodList(items=[good_pod],
+                            metadata=k8sClient.V1ListMeta(_continue="next")),
+        k8sClient.V1PodList(items=[failed_pod],
+                            metadata=k8sClient.V1ListMeta())
+    ]
+    client.CoreV1Api.return_value = v1
+
+    configuration = {"multi-ns-cluster-wide-threshold": 1}
+    assert all_microservices_healthy_multi_ns(
+        ns_list=["ns1", "ns2"], configuration=configuration) is True
+    assert v1.list_pod_for_all_namespaces.call_count == 2
+    v1.list_namespaced_pod.assert_not_called()
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.probes.client', autospec=True)
+@patch('chaosk8s_wix.client')
+def test_nodes_super_healthy_report(cl, client, has_conf):
+    has_conf.return_value = False
+    v1 = MagicMock()
+
+    node1 = create_node_object("node1", labels={"role": "worker"})
+    node2 = create_node_object("node2", labels={"role": "worker"})
+    node2.spec.unschedulable = True
+    node3 = create_node_object("node3", labels={"role": "master"})
+    node3.status.conditions[0].status = "False"
+    v1.list_node.return_value = k8sClient.V1NodeList(items=[node1, node2, node3])
+
+    pod1 = create_pod_object("fakepod1", node_name="node1")
+    v1.list_pod_for_all_namespaces.return_value = k8sClient.V1PodList(items=[pod1])
+    client.CoreV1Api.return_value = v1
+
+    report = nodes_super_healthy_report(label_selector="role=worker")
+
+    v1.list_node.assert_called_once_with()
+    v1.list_pod_for_all_namespaces.assert_called_once()
+    assert report["healthy"] is False
+    assert report["pods"]["healthy"] is True
+    assert report["nodes"]["unhealthy"] == {"node2": ["Unschedulable"]}
+    assert "list_pods" in report["timings"]
+
+    assert nodes_super_healthy(label_selector="role=master") is False
+    assert nodes_super_healthy(label_selector="role=worker,!unschedulable") is False
+    node2.spec.unschedulable = False
+    assert nodes_super_healthy(label_selector="role in (worker)") is True
+
+
+def test_get_pods_health_report_collects_all_offenders():
+    pod1 = create_pod_object("fakepod1", node_name="node1")
+    pod2 = create_pod_object("fakepod2", node_name="node1", namespace="ns2")
+    pod2.status.container_statuses[0].state = k8sClient.V1ContainerState(
+        waiting=k8sClient.V1ContainerStateWaiting(reason="CrashLoopBackOff"))
+    pod3 = create_pod_object("fakepod3", node_name="node2", namespace="ns3")
+    pod3.status.container_statuses[0].state = k8sClient.V1ContainerState(
+        terminated=k8sClient.V1ContainerStateTerminated(exit_code=137, reason="OOMKilled"))
+    pod4 = create_pod_object("fakepod4", node_name="node2", namespace="db-catalog")
+    pod4.status.container_statuses[0].state = k8sClient.V1ContainerState(
+        waiting=k8sClient.V1ContainerStateWaiting(reason="CrashLoopBackOff"))
+    pod5 = create_pod_object("fakepod5", node_name="node2")
+    pod5.status.container_statuses[0].state = k8sClient.V1ContainerState(
+        terminated=k8sClient.V1ContainerStateTerminated(exit_code=0, reason="Completed"))
+    pod6 = create_pod_object("fakepod6", node_name="tainted_node", namespace="ns6")
+    pod6.status.container_statuses[0].state = k8sClient.V1ContainerState(
+        waiting=k8sClient.V1ContainerStateWaiting(reason="ImagePullBackOff"))
+
+    report = get_pods_health_report({"node1", "node2"}, ["db-catalog"],
+                                    [pod1, pod2, pod3, pod4, pod5, pod6])
+
+    assert report["healthy"] is False
+    assert report["checked"] == 5
+    assert report["ignored"] == 1
+    assert report["reasons"] == {"CrashLoopBackOff": 1, "OOMKilled": 1}
+    assert [(u["namespace"], u["pod"], u["node"], u["state"]) for u in report["unhealthy"]] == [
+        ("ns2", "fakepod2", "node1", "waiting"),
+        ("ns3", "fakepod3", "node2", "terminated")]
+    json.dumps(report)
+
+
+def create_crashing_pod(name, namespace, node_name="node1"):
+    pod = create_pod_object(name, namespace=namespace, node_name=node_name)
+    pod.status.container_statuses[0].state = k8sClient.V1ContainerState(
+        waiting=k8sClient.V1ContainerStateWaiting(reason="CrashLoopBackOff"))
+    return pod
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.probes.client', autospec=True)
+@patch('chaosk8s_wix.node.client', autospec=True)
+@patch('chaosk8s_wix.client')
+def test_all_pods_are_ok_in_multi_ns_lists_each_namespace(cl, node_client, client, has_conf):
+    has_conf.return_value = False
+    v1 = MagicMock()
+    v1.list_node_with_http_info.return_value = k8sClient.V1NodeList(items=[create_node_object("node1")])
+    node_client.CoreV1Api.return_value = v1
+    node_client.V1NodeList.return_value = k8sClient.V1NodeList(items=[])
+    client.CoreV1Api.return_value = v1
+    pods = {"ns1": [create_pod_object("good", namespace="ns1")],
+            "ns2": [create_crashing_pod("off-node", "ns2", node_name="inactive-node")]}
+    v1.list_namespaced_pod.side_effect = lambda ns, **kwargs: k8sClient.V1PodList(items=pods[ns])
+
+    assert all_pods_are_ok_in_multi_ns(ns_list=["ns1", "ns2", "ns1"]) is True
+    assert sorted(c[0][0] for c in v1.list_namespaced_pod.call_args_list) == ["ns1", "ns2"]
+    v1.list_pod_for_all_namespaces.assert_not_called()
+
+    pods["ns2"].append(create_crashing_pod("crashing", "ns2"))
+    assert all_pods_are_ok_in_multi_ns(ns_list=["ns1", "ns2"]) is False
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.probes.client', autospec=True)
+@patch('chaosk8s_wix.node.client', autospec=True)
+@patch('chaosk8s_wix.client')
+def test_all_pods_are_ok_in_multi_ns_lists_cluster_wide_above_threshold(cl, node_client, client, has_conf):
+    has_conf.return_value = False
+    v1 = MagicMock()
+    v1.list_node_with_http_info.return_value = k8sClient.V1NodeList(items=[create_node_object("node1")])
+    node_client.CoreV1Api.return_value = v1
+    node_client.V1NodeList.return_value = k8sClient.V1NodeList(items=[])
+    client.CoreV1Api.return_value = v1
+
+    def pages(crashing_namespace):
+        return [k8sClient.V1PodList(items=[create_pod_object("good", namespace="ns1")],
+                                    metadata=k8sClient.V1ListMeta(_continue="next")),
+                k8sClient.V1PodList(items=[create_crashing_pod("crashing", crashing_namespace)],
+                                    metadata=k8sClient.V1ListMeta())]
+
+    configuration = {"multi-ns-cluster-wide-threshold": 1, "pods-page-size": 2}
+    v1.list_pod_for_all_namespaces.side_effect = pages("not-checked")
+    assert all_pods_are_ok_in_multi_ns(ns_list=["ns1", "ns2"], configuration=configuration) is True
+    assert v1.list_pod_for_all_namespaces.call_count == 2
+    v1.list_pod_for_all_namespaces.assert_called_with(limit=2, watch=False, _continue="next")
+    v1.list_namespaced_pod.assert_not_called()
+
+    v1.list_pod_for_all_namespaces.side_effect = pages("ns2")
+    assert all_pods_are_ok_in_multi_ns(ns_list=["ns1", "ns2"], configuration=configuration) is False
+
+
+@patch('chaosk8s_wix.has_local_config_file', autospec=True)
+@patch('chaosk8s_wix.probes.watch', autospec=True)
+@patch('chaosk8s_wix.node.client', autospec=True)
+def test_all_pods_in_all_ns_are_ok_incremental(node_client, watch, has_conf):
+    has_conf.return_value = False
+    reset_incremental_pods_health()
+    v1 = MagicMock()
+
+    node = create_node_object("node1")
+    v1.list_node_with_http_info.return_value = k8sClient.V1NodeList(items=[node])
+    node_client.CoreV1Api.return_value = v1
+    node_client.V1NodeList.return_value = k8sClient.V1NodeList(items=[])
+
+    pod1 = create_pod_object("fakepod1")
+    pod2 = create_pod_object("fakepod2")
+    pod2.status.container_statuses[0].state = k8sClient.V1ContainerState(
+        waiting=k8sClient.V1ContainerStateWaiting(reason="CrashLoopBackOff"))
+    pods_list = k8sClient.V1PodList(items=[pod1, pod2], metadata=k8sClient.V1ListMeta(resource_version="10"))
+    v1.list_pod_for_all_namespaces.side_effect = [pods_list]
+
+    assert all_pods_in_all_ns_are_ok(incremental=True) is False
+    assert v1.list_pod_for_all_namespaces.call_count == 1
+
+    def latest_list(resource_version):
+        return k8sClient.V1PodList(items=[], metadata=k8sClient.V1ListMeta(resource_version=resource_version))
+
+    fixed_pod2 = create_pod_object("fakepod2")
+    fixed_pod2.metadata.resource_version = "12"
+    later_pod = create_pod_object("fakepod3")
+    later_pod.metadata.resource_version = "13"
+    watcher = MagicMock()
+    watcher.stream.return_value = [{"type": "MODIFIED", "object": fixed_pod2},
+                                   {"type": "ADDED", "object": later_pod}]
+    watch.Watch.return_value = watcher
+    v1.list_pod_for_all_namespaces.side_effect = [latest_list("12")]
+
+    assert all_pods_in_all_ns_are_ok(incremental=True) is True
+    v1.list_pod_for_all_namespaces.assert_called_with(limit=1, watch=False)
+    watcher.stream.assert_called_with(v1.list_pod_for_all_namespaces,
+                                      resource_version="10", timeout_seconds=1,
+                                      _request_timeout=(1, INCREMENTAL_WATCH_IDLE_TIMEOUT))
+    # stream is left as soon as it reached the latest resourceVersion
+    watcher.stop.assert_called_once_with()
+
+    v1.list_pod_for_all_namespaces.side_effect = [latest_list("12")]
+    assert all_pods_in_all_ns_are_ok(incremental=True) is True
+    assert watcher.stream.call_count == 1
+
+    watcher.stream.return_value = [{"type": "ERROR", "object": None,
+                                    "raw_object": {"code": 410}}]
+    v1.list_pod_for_all_namespaces.side_effect = [latest_list("20"), pods_list]
+    assert all_pods_in_all_ns_are_ok(incremental=True) is False
+    assert v1.list_pod_for_all_namespaces.call_count == 5
+    reset_incremental_pods_health()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from chaoslib.exceptions import FailedActivity
+
+from chaosk8s_wix.ssh import load_private_key, run_on_hosts, ParamikoTransport
+
+
+class StubTransport(object):
+    def __init__(self, results=None, delay=0):
+        self.results = results or {}
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def run(self, host, command, sudo=False):
+        with self.lock:
+            self.calls.append((host, command, sudo))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        result = self.results.get(host, (0, "ok\n", ""))
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_run_on_hosts_returns_result_per_host():
+    transport = StubTransport(results={"10.0.0.2": (1, "", "denied\n"),
+                                       "10.0.0.3": OSError("no route to host")})
+
+    results = run_on_hosts(["10.0.0.1", "10.0.0.2", "10.0.0.3"], ["first", "second"],
+                           sudo=True, transport=transport, fail_on_error=False)
+
+    assert results["10.0.0.1"]["exit_code"] == 0
+    assert results["10.0.0.1"]["stdout"] == "ok\nok\n"
+    assert results["10.0.0.2"]["exit_code"] == 1
+    assert results["10.0.0.2"]["stderr"] == "denied\n"
+    assert results["10.0.0.3"]["exit_code"] is None
+    assert results["10.0.0.3"]["error"] == "no route to host"
+    assert ("10.0.0.1", "second", True) in transport.calls
+    assert ("10.0.0.2", "second", True) not in transport.calls
+    assert all(r["duration"] >= 0 for r in results.values())
+
+
+def test_run_on_hosts_fails_when_any_host_fails():
+    transport = StubTransport(results={"10.0.0.2": (1, "", "sudo: a password is required\n"),
+                                       "10.0.0.3": OSError("no route to host")})
+
+    with pytest.raises(FailedActivity) as excinfo:
+        run_on_hosts(["10.0.0.1", "10.0.0.2", "10.0.0.3"], "uptime",
+                     sudo=True, transport=transport)
+
+    message = str(excinfo.value)
+    assert "2 of 3 hosts" in message
+    assert "10.0.0.2: exit code 1 sudo: a password is required" in message
+    assert "10.0.0.3: no route to host" in message
+    assert len(transport.calls) == 3
+
+
+def test_run_on_hosts_bounds_concurrency():
+    transport = StubTransport(delay=0.05)
+    hosts = ["10.0.0.{}".format(i) for i in range(10)]
+
+    results = run_on_hosts(hosts, "uptime", transport=transport, max_workers=3)
+
+    assert len(results) == 10
+    assert 1 < transport.max_in_flight <= 3
+
+
+def test_invalid_private_key_is_rejected():
+    with pytest.raises(ValueError):
+        load_private_key("not a key")
+
+
+@patch('chaosk8s_wix.ssh.ParamikoTransport')
+def test_run_on_hosts_without_hosts_does_not_load_key(transport_class):
+    assert run_on_hosts([], "uptime") == {}
+    transport_class.assert_not_called()
+
+
+@patch('chaosk8s_wix.ssh.paramiko.SSHClient')
+def test_paramiko_transport_drains_stdout_and_stderr_together(ssh_client):
+    stderr_drained = threading.Event()
+    stdout = MagicMock()
+    stderr = MagicMock()
+
+    def read_stdout():
+        # remote side blocks writing stdout until stderr is drained
+        assert stderr_drained.wait(5)
+        return b"out"
+
+    def read_stderr():
+        stderr_drained.set()
+        return b"err"
+
+    stdout.read.side_effect = read_stdout
+    stderr.read.side_effect = read_stderr
+    stdout.channel.recv_exit_status.return_value = 3
+    ssh_client.return_value.exec_command.return_value = (MagicMock(), stdout, stderr)
+
+    transport = ParamikoTransport(user="user", key_text="")
+    assert transport.run("10.0.0.1", "noisy") == (3, "out", "err")